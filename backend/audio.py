@@ -0,0 +1,626 @@
+import io
+import logging
+import struct
+from math import gcd
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from timing import timed
+
+logger = logging.getLogger(__name__)
+
+# Whisper resamples everything to 16 kHz mono internally, so anything above
+# that is upload weight we pay for without any accuracy gain.
+TARGET_SAMPLE_RATE = 16000
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Resampler design: zero crossings of the sinc kept on each side of the
+# centre tap, Kaiser window shape and passband edge relative to Nyquist.
+RESAMPLE_ZERO_CROSSINGS = 16
+RESAMPLE_KAISER_BETA = 8.6
+RESAMPLE_ROLLOFF = 0.945
+
+# Upper bound on the (outputs x taps) matrix built per resampling block.
+_RESAMPLE_BLOCK_ELEMENTS = 1 << 20
+
+# Silence detection: analysis frame length, the minimum pause worth splitting
+# on, and how far above the noise floor speech is expected to be.
+SILENCE_FRAME_SECONDS = 0.02
+SILENCE_MIN_SECONDS = 0.3
+SILENCE_FLOOR_RATIO = 3.0
+
+
+class WavFormatError(ValueError):
+    """Raised when a byte string is not a WAV file we can decode."""
+
+
+def is_wav(data: bytes) -> bool:
+    """Return True if the data starts with a RIFF/WAVE header."""
+    return len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WAVE"
+
+
+class WavHeader(NamedTuple):
+    """Format fields and sample data location of a WAV file."""
+    format_tag: int
+    channels: int
+    sample_rate: int
+    bits: int
+    data_offset: int
+    data_length: int
+
+    @property
+    def block_align(self) -> int:
+        return self.channels * (self.bits // 8)
+
+    @property
+    def duration(self) -> float:
+        return self.data_length // self.block_align / float(self.sample_rate)
+
+
+def read_wav_header(data: bytes) -> WavHeader:
+    """
+    Locate the fmt and data chunks of a WAV file without decoding samples.
+
+    Browser recorders often leave the RIFF and data sizes at 0 or 0xFFFFFFFF,
+    so a data chunk that claims more bytes than are present is taken to run to
+    the end of the buffer.
+
+    Args:
+        data (bytes): The raw WAV file, or at least its leading bytes
+
+    Returns:
+        WavHeader: Format fields plus the offset and length of the sample data
+    """
+    if not is_wav(data):
+        raise WavFormatError("Not a RIFF/WAVE file")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack_from("<I", data, offset + 4)[0]
+        body_start = offset + 8
+
+        if chunk_id == b"fmt ":
+            if chunk_size < 16 or body_start + 16 > len(data):
+                raise WavFormatError("fmt chunk too short")
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body_start)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40 and body_start + 26 <= len(data):
+                # The first two bytes of the SubFormat GUID carry the real tag
+                format_tag = struct.unpack_from("<H", data, body_start + 24)[0]
+            fmt = (format_tag, channels, sample_rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise WavFormatError("data chunk before fmt chunk")
+            format_tag, channels, sample_rate, bits = fmt
+            if channels < 1 or sample_rate < 1 or bits < 8:
+                raise WavFormatError("Invalid channel count, sample rate or bit depth")
+            length = min(chunk_size, len(data) - body_start)
+            return WavHeader(format_tag, channels, sample_rate, bits, body_start, length)
+
+        # Chunks are word aligned
+        offset = body_start + chunk_size + (chunk_size & 1)
+
+    raise WavFormatError("Missing fmt or data chunk")
+
+
+def parse_wav(data: bytes) -> Tuple[np.ndarray, int]:
+    """
+    Decode a WAV file into float samples.
+
+    Supports 8/16/24/32-bit integer PCM and 32/64-bit IEEE float, including
+    WAVE_FORMAT_EXTENSIBLE headers.
+
+    Args:
+        data (bytes): The raw WAV file
+
+    Returns:
+        Tuple[np.ndarray, int]: Samples as float32 in [-1, 1] with shape
+        (frames, channels), and the sample rate
+    """
+    header = read_wav_header(data)
+    format_tag, channels, sample_rate, bits = header.format_tag, header.channels, header.sample_rate, header.bits
+    block_align = header.block_align
+    frames = header.data_length // block_align
+    pcm = data[header.data_offset:header.data_offset + frames * block_align]
+
+    if format_tag == WAVE_FORMAT_PCM:
+        if bits == 8:
+            samples = (np.frombuffer(pcm, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        elif bits == 16:
+            samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+        elif bits == 24:
+            raw = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+            ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+            samples = ints.astype(np.float32) / 8388608.0
+        elif bits == 32:
+            samples = (np.frombuffer(pcm, dtype="<i4").astype(np.float64) / 2147483648.0).astype(np.float32)
+        else:
+            raise WavFormatError(f"Unsupported PCM bit depth: {bits}")
+    elif format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        if bits == 32:
+            samples = np.frombuffer(pcm, dtype="<f4").astype(np.float32)
+        elif bits == 64:
+            samples = np.frombuffer(pcm, dtype="<f8").astype(np.float32)
+        else:
+            raise WavFormatError(f"Unsupported float bit depth: {bits}")
+    else:
+        raise WavFormatError(f"Unsupported WAV format tag: {format_tag:#x}")
+
+    return samples.reshape(-1, channels), sample_rate
+
+
+def downmix(samples: np.ndarray) -> np.ndarray:
+    """Average all channels of a (frames, channels) array into a mono vector."""
+    if samples.ndim == 1:
+        return samples
+    if samples.shape[1] == 1:
+        return samples[:, 0]
+    return samples.mean(axis=1, dtype=np.float32)
+
+
+def _design_polyphase_filter(up: int, down: int) -> Tuple[np.ndarray, int]:
+    """
+    Design the windowed-sinc anti-aliasing filter for an up/down resampler
+    and split it into `up` polyphase branches.
+
+    Returns:
+        Tuple[np.ndarray, int]: Filter taps with shape (up, taps_per_phase),
+        and the filter delay in upsampled samples
+    """
+    factor = max(up, down)
+    half_length = RESAMPLE_ZERO_CROSSINGS * factor
+    n = np.arange(-half_length, half_length + 1, dtype=np.float64)
+    cutoff = RESAMPLE_ROLLOFF / (2.0 * factor)
+    taps = 2.0 * cutoff * np.sinc(2.0 * cutoff * n)
+    taps *= np.kaiser(len(n), RESAMPLE_KAISER_BETA)
+    # Zero-stuffing by `up` divides the DC gain by `up`; restore it here
+    taps *= up / taps.sum()
+
+    taps_per_phase = -(-len(taps) // up)
+    padded = np.zeros(taps_per_phase * up, dtype=np.float64)
+    padded[:len(taps)] = taps
+    return padded.reshape(taps_per_phase, up).T.astype(np.float32), half_length
+
+
+def resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """
+    Resample a mono signal with a polyphase windowed-sinc filter.
+
+    Only the output samples are computed: each one is the dot product of one
+    polyphase branch with the input samples under it, so the cost is
+    proportional to output length times taps per phase rather than to the
+    zero-stuffed intermediate rate.
+
+    Args:
+        samples (np.ndarray): Mono float samples
+        source_rate (int): Input sample rate in Hz
+        target_rate (int): Output sample rate in Hz
+
+    Returns:
+        np.ndarray: Resampled float32 samples
+    """
+    if source_rate == target_rate or len(samples) == 0:
+        return samples.astype(np.float32, copy=False)
+
+    divisor = gcd(source_rate, target_rate)
+    up = target_rate // divisor
+    down = source_rate // divisor
+
+    phases, delay = _design_polyphase_filter(up, down)
+    taps_per_phase = phases.shape[1]
+
+    # Pad so every gather below stays in bounds
+    padded = np.concatenate([
+        np.zeros(taps_per_phase, dtype=np.float32),
+        samples.astype(np.float32, copy=False),
+        np.zeros(taps_per_phase + delay // up + 1, dtype=np.float32),
+    ])
+
+    out_length = -(-len(samples) * up // down)
+    output = np.empty(out_length, dtype=np.float32)
+    tap_offsets = np.arange(taps_per_phase)
+    block = max(1, _RESAMPLE_BLOCK_ELEMENTS // taps_per_phase)
+
+    for start in range(0, out_length, block):
+        positions = np.arange(start, min(start + block, out_length), dtype=np.int64) * down + delay
+        phase = positions % up
+        base = positions // up + taps_per_phase
+        window = padded[base[:, None] - tap_offsets[None, :]]
+        output[start:start + len(positions)] = np.einsum("ij,ij->i", window, phases[phase])
+
+    return output
+
+
+def encode_wav_pcm16(samples: np.ndarray, sample_rate: int) -> bytes:
+    """
+    Encode mono float samples as a 16-bit PCM WAV file.
+
+    Args:
+        samples (np.ndarray): Mono float samples in [-1, 1]
+        sample_rate (int): Sample rate in Hz
+
+    Returns:
+        bytes: A complete WAV file
+    """
+    pcm = np.clip(samples, -1.0, 32767.0 / 32768.0)
+    pcm = np.round(pcm * 32768.0).astype("<i2").tobytes()
+
+    buffer = io.BytesIO()
+    buffer.write(b"RIFF")
+    buffer.write(struct.pack("<I", 36 + len(pcm)))
+    buffer.write(b"WAVE")
+    buffer.write(b"fmt ")
+    buffer.write(struct.pack("<IHHIIHH", 16, WAVE_FORMAT_PCM, 1, sample_rate, sample_rate * 2, 2, 16))
+    buffer.write(b"data")
+    buffer.write(struct.pack("<I", len(pcm)))
+    buffer.write(pcm)
+    return buffer.getvalue()
+
+
+@timed("normalize")
+def normalize_audio(data: bytes, target_rate: int = TARGET_SAMPLE_RATE) -> bytes:
+    """
+    Downmix and resample WAV audio to 16 kHz mono 16-bit PCM for transcription.
+
+    Non-WAV containers (webm, ogg, mp3, ...) are compressed already and are
+    returned unchanged, as is anything that fails to decode or would not get
+    smaller. Signals at or below the target rate are only downmixed; upsampling
+    would add bytes without adding information.
+
+    Args:
+        data (bytes): The uploaded audio file
+        target_rate (int): Output sample rate in Hz
+
+    Returns:
+        bytes: The normalized WAV file, or the original bytes
+    """
+    if not is_wav(data):
+        return data
+
+    try:
+        samples, sample_rate = parse_wav(data)
+    except (WavFormatError, struct.error, ValueError) as e:
+        logger.warning(f"Skipping audio normalization, could not parse WAV: {str(e)}")
+        return data
+
+    mono = downmix(samples)
+    if sample_rate > target_rate:
+        mono = resample(mono, sample_rate, target_rate)
+        sample_rate = target_rate
+
+    normalized = encode_wav_pcm16(mono, sample_rate)
+    if len(normalized) >= len(data):
+        return data
+    return normalized
+
+
+def wav_duration(data: bytes) -> Optional[float]:
+    """Return the duration of a WAV file in seconds, or None if it can't be parsed."""
+    try:
+        return read_wav_header(data).duration
+    except (WavFormatError, struct.error):
+        return None
+
+
+class Segment(NamedTuple):
+    """A slice of a mono signal, in samples. `overlap` is the number of samples
+    shared with the previous segment (non-zero only after a hard cut)."""
+    start: int
+    end: int
+    overlap: int
+
+
+def _frame_energy(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    frames = len(samples) // frame_length
+    if frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    framed = samples[:frames * frame_length].reshape(frames, frame_length)
+    return np.sqrt(np.mean(framed * framed, axis=1, dtype=np.float64)).astype(np.float32)
+
+
+def _silence_threshold(energy: np.ndarray) -> float:
+    # Speech/silence threshold from the noise floor. The geometric mean with
+    # the peak keeps it below speech level when the floor is itself speech.
+    floor = float(np.percentile(energy, 10))
+    peak = float(energy.max())
+    return max(min(floor * SILENCE_FLOOR_RATIO, (floor * peak) ** 0.5), 1e-4)
+
+
+def trim_silence(samples: np.ndarray, sample_rate: int, keep_seconds: float = 0.2) -> Tuple[int, int]:
+    """
+    Find the span of a mono signal between its leading and trailing silence.
+
+    Uses the same speech/silence threshold as split_on_silence, and keeps
+    `keep_seconds` of the pause on either side so the first and last words
+    are not clipped.
+
+    Args:
+        samples (np.ndarray): Mono float samples
+        sample_rate (int): Sample rate in Hz
+        keep_seconds (float): Silence kept before the first and after the last sound
+
+    Returns:
+        Tuple[int, int]: Start and end sample; (0, 0) if there is no sound at all
+    """
+    frame_length = max(1, int(SILENCE_FRAME_SECONDS * sample_rate))
+    energy = _frame_energy(samples, frame_length)
+    if len(energy) == 0:
+        return 0, len(samples)
+    loud = np.nonzero(energy >= _silence_threshold(energy))[0]
+    if len(loud) == 0:
+        return 0, 0
+    keep = int(keep_seconds * sample_rate)
+    start = max(0, int(loud[0]) * frame_length - keep)
+    end = min(len(samples), (int(loud[-1]) + 1) * frame_length + keep)
+    return start, end
+
+
+def split_on_silence(samples: np.ndarray, sample_rate: int, max_segment_seconds: float,
+                     overlap_seconds: float = 1.0) -> List[Segment]:
+    """
+    Split a mono signal into segments of bounded length at pauses.
+
+    Each cut is placed at the quietest point of the last pause found inside
+    the allowed window, so words are never split. When a window contains no
+    pause at all the segment is cut at the maximum length and the next one
+    starts `overlap_seconds` earlier; the overlap is reported so transcripts
+    can be de-duplicated when they are stitched back together.
+
+    Args:
+        samples (np.ndarray): Mono float samples
+        sample_rate (int): Sample rate in Hz
+        max_segment_seconds (float): Upper bound on segment length
+        overlap_seconds (float): Overlap used for hard cuts
+
+    Returns:
+        List[Segment]: Segments covering the whole signal, in order
+
+    Raises:
+        ValueError: The maximum segment length is under one sample
+    """
+    total = len(samples)
+    max_length = int(max_segment_seconds * sample_rate)
+    if max_length <= 0:
+        raise ValueError(f"max_segment_seconds must be positive, got {max_segment_seconds}")
+    if total <= max_length:
+        return [Segment(0, total, 0)]
+
+    frame_length = max(1, int(SILENCE_FRAME_SECONDS * sample_rate))
+    energy = _frame_energy(samples, frame_length)
+    if len(energy) == 0:
+        return [Segment(0, total, 0)]
+
+    threshold = _silence_threshold(energy)
+
+    # A frame is a split candidate if the whole pause around it is quiet
+    run = max(1, int(SILENCE_MIN_SECONDS / SILENCE_FRAME_SECONDS))
+    smoothed = np.convolve(energy, np.ones(run, dtype=np.float32) / run, mode="same")
+    quiet = smoothed < threshold
+
+    overlap = int(overlap_seconds * sample_rate)
+    # Don't cut segments shorter than a quarter of the limit
+    min_frames = max(1, max_length // frame_length // 4)
+    max_frames = max_length // frame_length
+
+    segments = []
+    start = 0
+    carried_overlap = 0
+    while total - start > max_length:
+        first = start // frame_length + min_frames
+        last = min(start // frame_length + max_frames, len(quiet))
+        candidates = np.nonzero(quiet[first:last])[0]
+        if len(candidates):
+            # Walk back from the latest quiet frame to the deepest point of that pause
+            pause_end = first + int(candidates[-1])
+            pause_start = pause_end
+            while pause_start > first and quiet[pause_start - 1]:
+                pause_start -= 1
+            cut_frame = pause_start + int(np.argmin(smoothed[pause_start:pause_end + 1]))
+            cut = cut_frame * frame_length + frame_length // 2
+            segments.append(Segment(start, cut, carried_overlap))
+            start = cut
+            carried_overlap = 0
+        else:
+            cut = start + max_length
+            segments.append(Segment(start, cut, carried_overlap))
+            carried_overlap = min(overlap, max_length // 2)
+            start = cut - carried_overlap
+
+    segments.append(Segment(start, total, carried_overlap))
+    return segments
+
+
+# Containers accepted by the Whisper API, keyed by the extension we report
+SUPPORTED_FORMATS = ("wav", "mp3", "ogg", "webm", "flac", "m4a")
+
+# MPEG audio bitrates in kbit/s, indexed by the 4-bit header field
+_MP3_BITRATES_V1_L3 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0)
+_MP3_BITRATES_V2_L3 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0)
+
+
+def sniff_audio_format(head: bytes) -> Optional[str]:
+    """
+    Identify an audio container from its leading bytes.
+
+    Args:
+        head (bytes): At least the first 12 bytes of the file
+
+    Returns:
+        Optional[str]: One of SUPPORTED_FORMATS, or None if unrecognized
+    """
+    if is_wav(head):
+        return "wav"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if len(head) >= 12 and head[4:8] == b"ftyp":
+        return "m4a"
+    if head[:3] == b"ID3" or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+
+def mp3_bitrate(head: bytes) -> Optional[int]:
+    """
+    Read the bitrate of the first MPEG Layer III frame, skipping any ID3v2 tag.
+
+    Args:
+        head (bytes): The leading bytes of an MP3 file
+
+    Returns:
+        Optional[int]: Bitrate in bit/s, or None if no frame header is in range
+    """
+    offset = 0
+    if head[:3] == b"ID3" and len(head) >= 10:
+        # Synchsafe tag size: four 7-bit bytes
+        size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        offset = 10 + size
+    for position in range(offset, len(head) - 3):
+        if head[position] != 0xFF or head[position + 1] & 0xE0 != 0xE0:
+            continue
+        version = (head[position + 1] >> 3) & 0x03
+        layer = (head[position + 1] >> 1) & 0x03
+        if layer != 0x01 or version == 0x01:
+            continue
+        table = _MP3_BITRATES_V1_L3 if version == 0x03 else _MP3_BITRATES_V2_L3
+        bitrate = table[head[position + 2] >> 4]
+        if bitrate:
+            return bitrate * 1000
+    return None
+
+
+# MPEG audio sample rates in Hz by version field (1, 2, 2.5), indexed by the 2-bit header field
+_MP3_SAMPLE_RATES = {0x03: (44100, 48000, 32000), 0x02: (22050, 24000, 16000), 0x00: (11025, 12000, 8000)}
+
+
+class Mp3FormatError(ValueError):
+    """Raised when MP3 data has no Layer III frames or parts can't be joined."""
+
+
+class Mp3Frame(NamedTuple):
+    """Location and format of one MPEG Layer III frame."""
+    offset: int
+    length: int
+    sample_rate: int
+    channels: int
+    samples: int
+
+
+def _id3v2_length(data: bytes, offset: int) -> int:
+    # Header, synchsafe body size and optional footer of an ID3v2 tag at `offset`
+    if data[offset:offset + 3] != b"ID3" or len(data) < offset + 10:
+        return 0
+    size = (data[offset + 6] << 21) | (data[offset + 7] << 14) | (data[offset + 8] << 7) | data[offset + 9]
+    footer = 10 if data[offset + 5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _mp3_frame_at(data: bytes, position: int) -> Optional[Mp3Frame]:
+    if position + 4 > len(data) or data[position] != 0xFF or data[position + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[position + 1] >> 3) & 0x03
+    layer = (data[position + 1] >> 1) & 0x03
+    bitrate_index = data[position + 2] >> 4
+    rate_index = (data[position + 2] >> 2) & 0x03
+    if layer != 0x01 or version == 0x01 or rate_index == 0x03 or bitrate_index in (0x00, 0x0F):
+        return None
+    mpeg1 = version == 0x03
+    bitrate = (_MP3_BITRATES_V1_L3 if mpeg1 else _MP3_BITRATES_V2_L3)[bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (data[position + 2] >> 1) & 0x01
+    samples = 1152 if mpeg1 else 576
+    length = samples // 8 * bitrate // sample_rate + padding
+    if position + length > len(data):
+        return None
+    channels = 1 if data[position + 3] >> 6 == 0x03 else 2
+    return Mp3Frame(position, length, sample_rate, channels, samples)
+
+
+def _is_info_frame(data: bytes, frame: Mp3Frame) -> bool:
+    # Xing/Info (after the side information) or VBRI header: no audio, and
+    # its frame count describes only the file it came from
+    mpeg1 = frame.samples == 1152
+    side_info = (32 if frame.channels == 2 else 17) if mpeg1 else (17 if frame.channels == 2 else 9)
+    tag = data[frame.offset + 4 + side_info:frame.offset + 8 + side_info]
+    return tag in (b"Xing", b"Info") or data[frame.offset + 36:frame.offset + 40] == b"VBRI"
+
+
+def mp3_frames(data: bytes) -> List[Mp3Frame]:
+    """
+    The audio frames of an MP3 file, in order.
+
+    ID3v2 tags, the Xing/Info/VBRI header frame, trailing ID3v1/APE tags and
+    any bytes that don't parse as Layer III frames (including a truncated
+    last frame) are left out.
+
+    Args:
+        data (bytes): An MP3 file
+
+    Returns:
+        List[Mp3Frame]: Audio frames
+    """
+    frames: List[Mp3Frame] = []
+    position = 0
+    while position < len(data):
+        tag = _id3v2_length(data, position)
+        if tag:
+            position += tag
+            continue
+        frame = _mp3_frame_at(data, position)
+        if frame is None:
+            # Resynchronize on the next frame header
+            position = data.find(b"\xff", position + 1)
+            if position < 0:
+                break
+            continue
+        if frames or not _is_info_frame(data, frame):
+            frames.append(frame)
+        position += frame.length
+    return frames
+
+
+def concatenate_mp3(parts: List[bytes]) -> bytes:
+    """
+    Join MP3 files into one stream, frame by frame.
+
+    Every part is cut to its audio frames, so no tag or header frame ends up
+    mid-stream where a player would glitch on it or stop early. The parts must
+    share sample rate and channel count. Each part keeps its own encoder delay
+    and padding (a few tens of milliseconds of silence), which lands at the
+    sentence boundaries the parts were split at.
+
+    Args:
+        parts (List[bytes]): MP3 files in playback order
+
+    Returns:
+        bytes: One MP3 stream
+
+    Raises:
+        Mp3FormatError: A part has no frames, or the parts' formats differ
+    """
+    joined = bytearray()
+    stream_format = None
+    for part in parts:
+        frames = mp3_frames(part)
+        if not frames:
+            raise Mp3FormatError("MP3 part has no audio frames")
+        part_format = (frames[0].sample_rate, frames[0].channels)
+        if stream_format is not None and part_format != stream_format:
+            raise Mp3FormatError(f"MP3 parts differ in format: {part_format} vs {stream_format}")
+        stream_format = part_format
+        if all(frame.offset + frame.length == after.offset for frame, after in zip(frames, frames[1:])):
+            # The usual case: one contiguous run of frames
+            joined += part[frames[0].offset:frames[-1].offset + frames[-1].length]
+        else:
+            for frame in frames:
+                joined += part[frame.offset:frame.offset + frame.length]
+    return bytes(joined)
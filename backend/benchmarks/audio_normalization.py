@@ -0,0 +1,133 @@
+"""
+Benchmark for the audio normalization stage in audio.py.
+
+Synthesizes speech-like recordings in the formats browsers typically produce,
+runs them through `normalize_audio` and reports the bytes saved, the CPU time
+spent, and the upload time that saving is worth over the link to the transcription API.
+With --live, both the original and normalized files are also sent through
+`process_audio_file` so the end-to-end upstream latency can be compared.
+
+Usage (from the backend directory):
+    python benchmarks/audio_normalization.py
+    python benchmarks/audio_normalization.py --durations 5 30 120 --upstream-mbps 5
+    python benchmarks/audio_normalization.py --live
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import struct
+import sys
+import time
+
+import numpy as np
+
+# Make the backend modules importable when run as a script
+project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_dir not in sys.path:
+    sys.path.insert(0, project_dir)
+
+from audio import normalize_audio  # noqa: E402
+
+SOURCE_FORMATS = [
+    # (sample rate, channels, bits)
+    (48000, 2, 16),
+    (44100, 2, 16),
+    (48000, 1, 16),
+    (44100, 1, 32),
+]
+
+
+def synthesize_speech(duration: float, sample_rate: int, channels: int, seed: int = 0) -> np.ndarray:
+    """Harmonic 'syllables' with pauses and a little noise, shape (frames, channels)."""
+    rng = np.random.default_rng(seed)
+    frames = int(duration * sample_rate)
+    t = np.arange(frames) / sample_rate
+    pitch = 120.0 + 30.0 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 3.0 * t), 0, None) * (np.sin(2 * np.pi * 0.2 * t) > -0.3)
+    signal = 0.3 * voiced * envelope + 0.01 * rng.standard_normal(frames)
+    return np.repeat(signal[:, None], channels, axis=1).astype(np.float32)
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int, bits: int) -> bytes:
+    channels = samples.shape[1]
+    if bits == 16:
+        pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes()
+        format_tag = 1
+    else:
+        pcm = samples.astype("<f4").tobytes()
+        format_tag = 3
+    block_align = channels * bits // 8
+    header = b"RIFF" + struct.pack("<I", 36 + len(pcm)) + b"WAVE"
+    header += b"fmt " + struct.pack("<IHHIIHH", 16, format_tag, channels, sample_rate,
+                                    sample_rate * block_align, block_align, bits)
+    header += b"data" + struct.pack("<I", len(pcm))
+    return header + pcm
+
+
+def time_call(func, *args, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def transcribe_latency(data: bytes) -> float:
+    from utils import process_audio_file
+
+    start = time.perf_counter()
+    process_audio_file(io.BytesIO(data))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[5.0, 30.0, 120.0])
+    parser.add_argument("--upstream-mbps", type=float, default=10.0, help="backend-to-Whisper bandwidth used for the transfer estimate")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--live", action="store_true", help="also transcribe both versions through process_audio_file")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    bytes_per_second = args.upstream_mbps * 1_000_000 / 8
+    results = []
+    for duration in args.durations:
+        for sample_rate, channels, bits in SOURCE_FORMATS:
+            original = encode_wav(synthesize_speech(duration, sample_rate, channels), sample_rate, bits)
+            normalized = normalize_audio(original)
+            cpu = time_call(normalize_audio, original, repeat=args.repeat)
+            upload_saved = (len(original) - len(normalized)) / bytes_per_second
+            row = {
+                "source": f"{sample_rate}Hz/{channels}ch/{bits}bit",
+                "duration_s": duration,
+                "bytes_in": len(original),
+                "bytes_out": len(normalized),
+                "saved_pct": round(100.0 * (1 - len(normalized) / len(original)), 1),
+                "normalize_ms": round(cpu * 1000, 2),
+                "upload_saved_ms": round(upload_saved * 1000, 1),
+                "net_gain_ms": round((upload_saved - cpu) * 1000, 1),
+            }
+            if args.live:
+                row["upstream_original_ms"] = round(transcribe_latency(original) * 1000, 1)
+                row["upstream_normalized_ms"] = round(transcribe_latency(normalized) * 1000, 1)
+            results.append(row)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    columns = list(results[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in results)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in results:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+    print(f"\nupstream upload estimate at {args.upstream_mbps} Mbit/s; net_gain = upload time saved - normalization CPU time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Cold-start import budget for serverless deployments.
+
+Imports the app the way a fresh serverless instance does, in a new
+interpreter each run with `python -X importtime`, and reports the total
+import time and the packages it is spent in. Exits 1 if the median total
+exceeds the budget or a module that must stay lazy (the provider SDKs, see
+providers.py) was imported at startup.
+
+The budget is in milliseconds of this machine; record the time before a
+change, and pass a budget that fits the machine the check runs on.
+
+Usage (from the backend directory):
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --budget-ms 600 --runs 10
+    python benchmarks/cold_start.py --module index --top 20 --json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported on first use or by the warm-up after startup, never on a cold start
+LAZY_MODULES = ["openai", "elevenlabs"]
+
+_IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def import_times(module: str) -> List[Tuple[str, int, int, int]]:
+    """(module, self us, cumulative us, depth) for every module a fresh interpreter imports."""
+    env = dict(os.environ, PROVIDER_WARMUP="false")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=project_dir, env=env, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        sys.exit(f"importing {module} failed:\n{completed.stderr[-2000:]}")
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def by_package(rows: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    """Self time summed per top-level package, in microseconds."""
+    totals: Dict[str, int] = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        totals[name.split(".", 1)[0]] += self_us
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="entry module the deployment imports")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--budget-ms", type=float, default=750.0, help="largest acceptable median import time")
+    parser.add_argument("--top", type=int, default=15, help="packages to list")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    totals_ms = []
+    packages: Dict[str, List[float]] = defaultdict(list)
+    imported = set()
+    for _ in range(args.runs):
+        rows = import_times(args.module)
+        imported.update(name for name, _, _, _ in rows)
+        totals_ms.append(next(cumulative for name, _, cumulative, depth in rows if name == args.module and depth == 0) / 1000)
+        for package, self_us in by_package(rows).items():
+            packages[package].append(self_us / 1000)
+
+    total = statistics.median(totals_ms)
+    ranked = sorted(((package, statistics.median(times)) for package, times in packages.items()),
+                    key=lambda entry: entry[1], reverse=True)[:args.top]
+    eager = [name for name in LAZY_MODULES if name in imported]
+
+    if args.json:
+        print(json.dumps({
+            "module": args.module,
+            "total_ms": round(total, 1),
+            "runs_ms": [round(value, 1) for value in totals_ms],
+            "budget_ms": args.budget_ms,
+            "packages_ms": {package: round(ms, 1) for package, ms in ranked},
+            "eager_lazy_modules": eager,
+        }, indent=2))
+    else:
+        print(f"{'package':<24} {'self ms':>8} {'share':>6}")
+        for package, ms in ranked:
+            print(f"{package:<24} {ms:>8.1f} {ms / total:>6.0%}")
+        print(f"\nimport {args.module}: median {total:.1f} ms over {args.runs} runs "
+              f"(min {min(totals_ms):.1f}, max {max(totals_ms):.1f}), budget {args.budget_ms:.0f} ms")
+
+    failures = []
+    if total > args.budget_ms:
+        failures.append(f"import time {total:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+    if eager:
+        failures.append(f"imported at startup but meant to load lazily: {', '.join(eager)}")
+    if failures:
+        print("\n" + "\n".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
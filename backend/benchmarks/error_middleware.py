@@ -0,0 +1,139 @@
+"""
+Microbenchmark: per-request overhead of the error handling middleware.
+
+Compares no middleware, the previous BaseHTTPMiddleware-based
+ErrorHandlingMiddleware, and the current pure ASGI one, on a JSON endpoint
+and a streaming endpoint. Requests are driven straight through the ASGI
+interface with in-memory receive/send, so the numbers are the middleware
+cost without any network or server noise.
+
+Usage (from the backend directory):
+    python benchmarks/error_middleware.py
+    python benchmarks/error_middleware.py --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+# Make the backend modules importable when run as a script
+project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_dir not in sys.path:
+    sys.path.insert(0, project_dir)
+
+from errors import ErrorHandlingMiddleware  # noqa: E402
+
+
+class LegacyErrorHandlingMiddleware(BaseHTTPMiddleware):
+    """The BaseHTTPMiddleware implementation errors.py used before."""
+    async def dispatch(self, request: Request, call_next):
+        try:
+            return await call_next(request)
+        except HTTPException:
+            raise
+        except Exception:
+            return JSONResponse(
+                status_code=500,
+                content={"detail": "An unexpected error occurred. Please try again later."}
+            )
+
+
+def build_app(middleware=None) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/json")
+    async def json_endpoint():
+        return {"response": "ok"}
+
+    @app.get("/stream")
+    async def stream_endpoint():
+        return StreamingResponse((b"chunk\n" for _ in range(20)), media_type="text/plain")
+
+    if middleware is not None:
+        app.add_middleware(middleware)
+    return app
+
+
+def make_scope(path: str) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+
+
+def make_receive():
+    # Like a real server: the body once, then block until the client leaves
+    sent = False
+    never = asyncio.Event()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await never.wait()
+
+    return receive
+
+
+async def run_requests(app, path: str, count: int) -> float:
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(count):
+        await app(make_scope(path), make_receive(), send)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    variants = [
+        ("none", None),
+        ("BaseHTTPMiddleware (old)", LegacyErrorHandlingMiddleware),
+        ("pure ASGI (current)", ErrorHandlingMiddleware),
+    ]
+    loop = asyncio.new_event_loop()
+    for path in ("/json", "/stream"):
+        print(f"{path} ({args.requests} requests x {args.rounds} rounds)")
+        apps = [(name, build_app(middleware)) for name, middleware in variants]
+        for _, app in apps:
+            loop.run_until_complete(run_requests(app, path, 1000))  # warm-up
+
+        # Interleave variants so drift in machine state hits all of them alike
+        timings = {name: [] for name, _ in apps}
+        for _ in range(args.rounds):
+            for name, app in apps:
+                timings[name].append(loop.run_until_complete(run_requests(app, path, args.requests)))
+
+        baseline = None
+        for name, _ in apps:
+            per_request_us = statistics.median(timings[name]) / args.requests * 1e6
+            if baseline is None:
+                baseline = per_request_us
+            print(f"  {name:<26} {per_request_us:8.1f} us/request   overhead {per_request_us - baseline:+7.1f} us")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Benchmark suite for backend hot paths, with baselines and regression checks.
+
+Each case times one small operation the request path runs on every turn:
+question-type detection, conversation formatting, prompt assembly for long
+histories, TextRequest validation, JSON response rendering and compression,
+reply text and audio normalization and TTS cache lookups.
+
+Baselines are plain JSON and only meaningful on the machine that recorded
+them, so record one before a change and compare after it.
+
+Usage (from the backend directory):
+    python benchmarks/hotpaths.py --save                 # writes baselines/hotpaths.json
+    python benchmarks/hotpaths.py --compare              # exits 1 on regressions
+    python benchmarks/hotpaths.py --compare --threshold 0.10 --filter prompt
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+# Make the backend modules importable when run as a script
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(benchmarks_dir)
+for path in (project_dir, benchmarks_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+DEFAULT_BASELINE = os.path.join(benchmarks_dir, "baselines", "hotpaths.json")
+
+QUESTIONS = [
+    "Tell me about yourself and your journey so far",
+    "What would you say is your number one superpower?",
+    "What are the top three areas you'd like to grow in?",
+    "What misconception do your coworkers have about you?",
+    "How do you push your boundaries and limits?",
+    "What's the weather like where you live?",
+]
+
+ANSWER = (
+    "I consistently push my boundaries by taking on diverse research projects, exploring emerging "
+    "technologies like generative AI, and challenging myself to learn across different domains, "
+    "from cybersecurity simulations to data analytics."
+)
+
+
+# A markdown-heavy reply, the worst case for text normalization before speech
+MARKDOWN_REPLY = (
+    "## My top three growth areas\n\n"
+    "1. **Public speaking** - I've presented to groups of 10-15, and want to reach 100+.\n"
+    "2. *Distributed systems*: see https://www.example.com/notes?topic=raft for my notes.\n"
+    "3. `Leadership` - mentoring 2-3 juniors on a $1.5M project, up 40% this year.\n\n"
+    "| Skill | Level |\n|---|---|\n| Python | Expert |\n| Go | Learning |\n\n"
+    "> Growth happens outside the comfort zone!!! \u2014 reach me at me@example.com \U0001F680\n"
+) * 4
+
+
+def conversation(turns: int) -> List[Dict[str, str]]:
+    history = []
+    for index in range(turns):
+        history.append({"role": "user", "content": QUESTIONS[index % len(QUESTIONS)]})
+        history.append({"role": "assistant", "content": ANSWER})
+    return history
+
+
+# Each case returns the zero-argument callable to time; setup cost is excluded
+CASES: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def case(name: str):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+@case("detect_interview_question_type")
+def _detect():
+    from utils import detect_interview_question_type
+
+    def run():
+        for question in QUESTIONS:
+            detect_interview_question_type(question)
+    return run
+
+
+@case("classify_turn")
+def _classify():
+    from utils import classify_turn
+
+    def run():
+        for question in QUESTIONS:
+            classify_turn(question)
+    return run
+
+
+@case("format_conversation_for_openai/20_turns")
+def _format_short():
+    from utils import format_conversation_for_openai
+    history = conversation(20)
+    return lambda: format_conversation_for_openai("You are a helpful AI assistant.", history)
+
+
+@case("build_messages/200_turns")
+def _prompt_long():
+    from utils import build_messages
+    history = conversation(200)
+    return lambda: build_messages("How do you push your boundaries?", history)
+
+
+@case("TextRequest/validate_50_turns")
+def _validate():
+    from models import TextRequest
+    payload = {"message": "Tell me about yourself", "conversation_history": conversation(50)}
+    return lambda: TextRequest(**payload)
+
+
+@case("json_response/reply")
+def _json_reply():
+    from responses import FastJSONResponse
+    payload = {"response": ANSWER}
+    return lambda: FastJSONResponse(payload)
+
+
+@case("json_response/long_conversation")
+def _json_long():
+    from responses import FastJSONResponse
+    payload = {"response": ANSWER, "conversation_history": conversation(100)}
+    return lambda: FastJSONResponse(payload)
+
+
+@case("compress/long_conversation")
+def _compress_long():
+    from compression import _Encoder, negotiate
+    from responses import dumps
+    body = dumps({"response": ANSWER, "conversation_history": conversation(100)})
+    encoding = negotiate("gzip, deflate, br")
+    return lambda: _Encoder(encoding).finish(body)
+
+
+@case("normalize_for_speech/long_reply")
+def _normalize_text():
+    from speech_text import normalize_for_speech
+    return lambda: normalize_for_speech(MARKDOWN_REPLY)
+
+
+@case("normalize_audio/5s_48k_stereo")
+def _normalize():
+    from audio import normalize_audio
+    from audio_normalization import encode_wav, synthesize_speech
+    data = encode_wav(synthesize_speech(5.0, 48000, 2), 48000, 16)
+    return lambda: normalize_audio(data)
+
+
+@case("tts_cache/hit")
+def _cache_hit():
+    from cache import LRUCache, content_hash
+    cache = LRUCache("bench", 64 * 1024 * 1024)
+    key = content_hash("voice", "model", ANSWER)
+    cache.set(key, b"\0" * 40000)
+    return lambda: cache.get(content_hash("voice", "model", ANSWER))
+
+
+@case("tts_cache/miss")
+def _cache_miss():
+    from cache import LRUCache, content_hash
+    cache = LRUCache("bench", 64 * 1024 * 1024)
+    for index in range(1000):
+        cache.set(content_hash("voice", "model", f"{ANSWER} {index}"), b"\0" * 100)
+    return lambda: cache.get(content_hash("voice", "model", "not cached"))
+
+
+def measure(func: Callable[[], object], repeat: int, min_sample_seconds: float) -> Dict[str, float]:
+    """Median and spread of per-call time, with the loop count calibrated per case."""
+    func()
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        if time.perf_counter() - start >= min_sample_seconds:
+            break
+        iterations *= 2
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        samples.append((time.perf_counter() - start) / iterations * 1e9)
+
+    quartiles = statistics.quantiles(samples, n=4) if len(samples) >= 2 else [samples[0]] * 3
+    return {
+        "median_ns": round(statistics.median(samples), 1),
+        "min_ns": round(min(samples), 1),
+        "iqr_ns": round(quartiles[2] - quartiles[0], 1),
+        "iterations": iterations,
+        "repeat": repeat,
+    }
+
+
+def run_cases(names: List[str], repeat: int, min_sample_seconds: float) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name in names:
+        results[name] = measure(CASES[name](), repeat, min_sample_seconds)
+        print(f"  {name:<42} {format_ns(results[name]['median_ns']):>10}  (iqr {format_ns(results[name]['iqr_ns'])})", file=sys.stderr)
+    return results
+
+
+def format_ns(value: float) -> str:
+    for unit, scale in (("s", 1e9), ("ms", 1e6), ("us", 1e3)):
+        if value >= scale:
+            return f"{value / scale:.2f} {unit}"
+    return f"{value:.0f} ns"
+
+
+def environment() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[Tuple[str, str]]:
+    """Print a comparison table and return (case, reason) for every regression."""
+    regressions = []
+    print(f"{'case':<42} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<42} {'-':>10} {format_ns(current['median_ns']):>10} {'new':>8}")
+            continue
+        change = current["median_ns"] / base["median_ns"] - 1.0
+        # Only flag changes that are also outside the combined run-to-run noise
+        noise = (base.get("iqr_ns", 0.0) + current.get("iqr_ns", 0.0)) / base["median_ns"]
+        flag = ""
+        if change > threshold and change > noise:
+            flag = "  REGRESSION"
+            regressions.append((name, f"{change:+.1%}"))
+        elif change < -threshold and -change > noise:
+            flag = "  improved"
+        print(f"{name:<42} {format_ns(base['median_ns']):>10} {format_ns(current['median_ns']):>10} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=7, help="timed samples per case")
+    parser.add_argument("--min-sample-seconds", type=float, default=0.05)
+    parser.add_argument("--save", nargs="?", const=DEFAULT_BASELINE, help="write results as a baseline file")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, help="compare against a baseline file")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative slowdown that counts as a regression")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    names = [name for name in CASES if args.filter in name]
+    if not names:
+        parser.error(f"no case matches {args.filter!r}")
+
+    results = run_cases(names, args.repeat, args.min_sample_seconds)
+
+    if args.json:
+        print(json.dumps({"environment": environment(), "results": results}, indent=2))
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        existing = {}
+        if os.path.exists(args.save):
+            with open(args.save) as handle:
+                existing = json.load(handle).get("results", {})
+        # Filtered runs update their cases and keep the rest
+        existing.update(results)
+        with open(args.save, "w") as handle:
+            json.dump({"environment": environment(), "results": existing}, handle, indent=2, sort_keys=True)
+        print(f"baseline written to {args.save}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) past {args.threshold:.0%}: "
+                  + ", ".join(f"{name} {change}" for name, change in regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Load test for the backend API at a target concurrency.
+
+Drives /api/generate-text, /api/speech-to-text and /api/text-to-speech with a
+fixed number of concurrent clients, each sending requests back to back, and
+reports throughput and latency percentiles per endpoint. Run the backend
+against benchmarks/mock_upstreams.py to avoid spending API credits.
+
+All simulated clients come from one address, so start the backend with the
+per-client rate limit and load shedding off, or most requests get 429/503:
+    RATE_LIMIT_PER_MINUTE=0 ADMISSION_TARGET_DELAY_MS=0 python -m uvicorn main:app
+
+Usage (from the backend directory):
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --concurrency 16 --duration 30
+    python benchmarks/loadtest.py --scenario generate-text --concurrency 1 4 16 64
+"""
+import abc
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+# Make the backend modules importable when run as a script
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+if benchmarks_dir not in sys.path:
+    sys.path.insert(0, benchmarks_dir)
+
+from audio_normalization import encode_wav, synthesize_speech  # noqa: E402
+
+# The scripted interview questions, plus open-ended prompts of the kind real
+# conversations drift into, so neither the canned answers nor one reply
+# length stands in for the whole workload
+QUESTIONS = [
+    "Tell me about yourself.",
+    "Can you explain how a hash map works and when you would pick a tree instead?",
+    "What's your number one superpower?",
+    "I'm planning a three day trip to Lisbon in March. What should I see and what should I skip?",
+    "What are the top three areas you'd like to grow in?",
+    "Write a short, friendly reply turning down a meeting invitation for Friday.",
+    "What misconception do your coworkers have about you?",
+    "Why did the Roman Empire split in two, briefly?",
+    "How do you push your boundaries and limits?",
+    "Thanks, that's all for now.",
+]
+
+ANSWER = (
+    "I consistently push my boundaries by taking on diverse research projects, exploring emerging "
+    "technologies like generative AI, and challenging myself to learn across different domains."
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Scenario(abc.ABC):
+    """One kind of request; `send` returns the HTTP status."""
+    name = ""
+
+    @abc.abstractmethod
+    async def send(self, client: httpx.AsyncClient, iteration: int) -> int:
+        ...
+
+
+class GenerateText(Scenario):
+    name = "generate-text"
+
+    def __init__(self, history_turns: int):
+        self.history = []
+        for index in range(history_turns):
+            self.history.append({"role": "user", "content": QUESTIONS[index % len(QUESTIONS)]})
+            self.history.append({"role": "assistant", "content": ANSWER})
+
+    async def send(self, client, iteration):
+        response = await client.post("/api/generate-text", json={
+            "message": QUESTIONS[iteration % len(QUESTIONS)],
+            "conversation_history": self.history,
+        })
+        return response.status_code
+
+
+class SpeechToText(Scenario):
+    name = "speech-to-text"
+
+    def __init__(self, seconds: float):
+        self.audio = encode_wav(synthesize_speech(seconds, 48000, 2), 48000, 16)
+
+    async def send(self, client, iteration):
+        response = await client.post("/api/speech-to-text", files={"audio_file": ("turn.wav", self.audio, "audio/wav")})
+        return response.status_code
+
+
+class TextToSpeech(Scenario):
+    name = "text-to-speech"
+
+    def __init__(self, unique: bool):
+        self.unique = unique
+
+    async def send(self, client, iteration):
+        # Unique texts defeat the TTS cache; repeated ones measure it
+        text = f"{ANSWER} ({iteration})" if self.unique else ANSWER
+        response = await client.post("/api/text-to-speech", data={"text": text})
+        return response.status_code
+
+
+async def run_level(url: str, scenarios: List[Scenario], concurrency: int, duration: float, timeout: float) -> Dict[str, dict]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def worker(worker_id: int):
+            iteration = worker_id
+            while time.perf_counter() < deadline:
+                scenario = scenarios[iteration % len(scenarios)]
+                start = time.perf_counter()
+                try:
+                    status = await scenario.send(client, iteration)
+                except httpx.HTTPError:
+                    status = 0
+                elapsed = time.perf_counter() - start
+                if 200 <= status < 300:
+                    latencies[scenario.name].append(elapsed)
+                else:
+                    errors[scenario.name] += 1
+                iteration += concurrency
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(index) for index in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    results = {}
+    for scenario in scenarios:
+        values = latencies[scenario.name]
+        results[scenario.name] = {
+            "concurrency": concurrency,
+            "ok": len(values),
+            "errors": errors[scenario.name],
+            "throughput_rps": round(len(values) / wall, 2),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenario", choices=["all", "generate-text", "speech-to-text", "text-to-speech"], default="all")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8])
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per concurrency level")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--history-turns", type=int, default=4, help="conversation turns sent with generate-text")
+    parser.add_argument("--audio-seconds", type=float, default=5.0, help="length of the synthetic speech upload")
+    parser.add_argument("--unique-tts", action="store_true", help="make every TTS text unique (no cache hits)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    available = {
+        "generate-text": lambda: GenerateText(args.history_turns),
+        "speech-to-text": lambda: SpeechToText(args.audio_seconds),
+        "text-to-speech": lambda: TextToSpeech(args.unique_tts),
+    }
+    names = list(available) if args.scenario == "all" else [args.scenario]
+    scenarios = [available[name]() for name in names]
+
+    all_results = []
+    for concurrency in args.concurrency:
+        results = asyncio.run(run_level(args.url, scenarios, concurrency, args.duration, args.timeout))
+        for name, row in results.items():
+            all_results.append(dict(endpoint=name, **row))
+
+    if args.json:
+        print(json.dumps(all_results, indent=2))
+        return
+
+    columns = ["endpoint", "concurrency", "ok", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in all_results)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in all_results:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Deterministic mock of the upstream APIs the backend calls.
+
+Serves OpenAI-compatible chat completions (streaming and non-streaming), a
+Whisper-style transcription endpoint and the ElevenLabs text-to-speech
+endpoints, with configurable latency distributions, error rates and token
+rates. Random draws come from a seeded generator, so a given seed and request
+sequence always produces the same latencies, errors and replies.
+
+Run it, then point the backend at it:
+
+    python benchmarks/mock_upstreams.py --port 9000 --llm-ttft-ms 400 --error-rate 0.01
+
+    OPENROUTER_BASE_URL=http://127.0.0.1:9000/v1 \
+    WHISPER_BASE_URL=http://127.0.0.1:9000/v1 \
+    ELEVENLABS_BASE_URL=http://127.0.0.1:9000/v1 \
+    OPENROUTER_API_KEY=mock ELEVENLABS_API_KEY=mock \
+    uvicorn main:app --port 8000
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from typing import List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# Make the backend modules importable when run as a script
+project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_dir not in sys.path:
+    sys.path.insert(0, project_dir)
+
+from audio import wav_duration  # noqa: E402
+
+WORDS = (
+    "machine learning research models data python adaptability problem solving "
+    "projects students papers deep vision generative growth technology curious "
+    "learning team communication solutions challenge boundaries explore build"
+).split()
+
+# One silent MPEG-1 Layer III frame: 128 kbit/s, 44.1 kHz, no padding,
+# 1152 samples (26.1 ms) in 417 bytes.
+MP3_FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 413
+MP3_FRAME_SECONDS = 1152 / 44100.0
+# Speech runs at roughly 15 characters per second
+SPOKEN_CHARS_PER_SECOND = 15.0
+
+
+class MockSettings:
+    """Latency, error and rate parameters. Latencies are lognormal around a median."""
+    def __init__(self, args=None):
+        self.seed = getattr(args, "seed", 1234)
+        self.sigma = getattr(args, "sigma", 0.35)
+        self.error_rate = getattr(args, "error_rate", 0.0)
+        self.llm_ttft_ms = getattr(args, "llm_ttft_ms", 350.0)
+        self.tokens_per_second = getattr(args, "tokens_per_second", 60.0)
+        self.reply_tokens = getattr(args, "reply_tokens", 80)
+        self.stt_base_ms = getattr(args, "stt_base_ms", 300.0)
+        self.stt_realtime_factor = getattr(args, "stt_realtime_factor", 0.05)
+        self.tts_ttfb_ms = getattr(args, "tts_ttfb_ms", 250.0)
+        self.tts_realtime_factor = getattr(args, "tts_realtime_factor", 0.15)
+
+
+settings = MockSettings()
+_rng = random.Random(settings.seed)
+_rng_lock = threading.Lock()
+
+
+def configure(new_settings: MockSettings):
+    global settings, _rng
+    settings = new_settings
+    _rng = random.Random(settings.seed)
+
+
+def draw_latency(median_ms: float) -> float:
+    """A lognormal latency sample in seconds."""
+    with _rng_lock:
+        return median_ms / 1000.0 * math.exp(_rng.gauss(0.0, settings.sigma))
+
+
+def draw_error() -> Optional[Response]:
+    with _rng_lock:
+        failed = _rng.random() < settings.error_rate
+        status = _rng.choice((429, 500, 503))
+    if not failed:
+        return None
+    return JSONResponse(status_code=status, content={"error": {"message": "mock upstream error", "code": status}})
+
+
+def reply_tokens(count: int) -> List[str]:
+    with _rng_lock:
+        return [_rng.choice(WORDS) + " " for _ in range(count)]
+
+
+def mp3_for_text(text: str) -> bytes:
+    frames = max(1, int(len(text) / SPOKEN_CHARS_PER_SECOND / MP3_FRAME_SECONDS))
+    return MP3_FRAME * frames
+
+
+app = FastAPI()
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error = draw_error()
+    await asyncio.sleep(draw_latency(settings.llm_ttft_ms))
+    if error is not None:
+        return error
+
+    tokens = reply_tokens(min(settings.reply_tokens, int(body.get("max_tokens") or settings.reply_tokens)))
+    model = body.get("model", "mock-model")
+    created = int(time.time())
+    usage = {"prompt_tokens": sum(len(str(m.get("content", "")).split()) for m in body.get("messages", [])),
+             "completion_tokens": len(tokens)}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+    if not body.get("stream"):
+        await asyncio.sleep(len(tokens) / settings.tokens_per_second)
+        return {
+            "id": "chatcmpl-mock", "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "".join(tokens).strip()}}],
+            "usage": usage,
+        }
+
+    async def events():
+        for index, token in enumerate(tokens):
+            if index:
+                await asyncio.sleep(1.0 / settings.tokens_per_second)
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        final = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(request: Request):
+    form = await request.form()
+    upload = form.get("file")
+    data = await upload.read() if upload is not None else b""
+    error = draw_error()
+    # Without a decoder, assume 16 kHz 16-bit mono for non-WAV input
+    seconds = wav_duration(data) or len(data) / 32000.0
+    await asyncio.sleep(draw_latency(settings.stt_base_ms) + seconds * settings.stt_realtime_factor)
+    if error is not None:
+        return error
+    words = max(1, int(seconds * 2.5))
+    return {"text": "".join(reply_tokens(words)).strip()}
+
+
+async def _speech(voice_id: str, request: Request, stream: bool):
+    body = await request.json()
+    text = body.get("text", "")
+    error = draw_error()
+    await asyncio.sleep(draw_latency(settings.tts_ttfb_ms))
+    if error is not None:
+        return error
+
+    audio = mp3_for_text(text)
+    audio_seconds = len(audio) / len(MP3_FRAME) * MP3_FRAME_SECONDS
+    synthesis_seconds = audio_seconds * settings.tts_realtime_factor
+    if not stream:
+        await asyncio.sleep(synthesis_seconds)
+        return Response(audio, media_type="audio/mpeg")
+
+    chunk_frames = 20
+    chunks = [audio[i:i + chunk_frames * len(MP3_FRAME)] for i in range(0, len(audio), chunk_frames * len(MP3_FRAME))]
+
+    async def body_chunks():
+        for index, chunk in enumerate(chunks):
+            if index:
+                await asyncio.sleep(synthesis_seconds / len(chunks))
+            yield chunk
+
+    return StreamingResponse(body_chunks(), media_type="audio/mpeg")
+
+
+@app.post("/v1/text-to-speech/{voice_id}")
+async def text_to_speech(voice_id: str, request: Request):
+    return await _speech(voice_id, request, stream=False)
+
+
+@app.post("/v1/text-to-speech/{voice_id}/stream")
+async def text_to_speech_stream(voice_id: str, request: Request):
+    return await _speech(voice_id, request, stream=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--sigma", type=float, default=0.35, help="lognormal spread of every latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/500/503")
+    parser.add_argument("--llm-ttft-ms", type=float, default=350.0, help="median time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--reply-tokens", type=int, default=80)
+    parser.add_argument("--stt-base-ms", type=float, default=300.0, help="median transcription overhead")
+    parser.add_argument("--stt-realtime-factor", type=float, default=0.05, help="transcription seconds per audio second")
+    parser.add_argument("--tts-ttfb-ms", type=float, default=250.0, help="median time to first audio byte")
+    parser.add_argument("--tts-realtime-factor", type=float, default=0.15, help="synthesis seconds per audio second")
+    args = parser.parse_args()
+
+    configure(MockSettings(args))
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
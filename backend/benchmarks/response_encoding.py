@@ -0,0 +1,134 @@
+"""
+Benchmark for JSON response rendering and compression.
+
+Renders typical API payloads (a single reply, replies with growing
+conversation histories, a batch job summary and an NDJSON transcript
+stream) with the stock JSONResponse and with the app's FastJSONResponse,
+then compresses each body the way CompressionMiddleware does. Reports
+render time before and after, the bytes on the wire for each encoding and
+the time that saves over a given client link.
+
+Usage (from the backend directory):
+    python benchmarks/response_encoding.py
+    python benchmarks/response_encoding.py --turns 20 100 500 --client-mbps 2
+    python benchmarks/response_encoding.py --json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+# Make the backend modules importable when run as a script
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(benchmarks_dir)
+for path in (project_dir, benchmarks_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import compression  # noqa: E402
+from hotpaths import ANSWER, MARKDOWN_REPLY, conversation  # noqa: E402
+from responses import FastJSONResponse, dumps, ndjson_line  # noqa: E402
+
+
+def payloads(turns_list):
+    yield "reply", {"response": ANSWER}
+    yield "reply/markdown", {"response": MARKDOWN_REPLY}
+    for turns in turns_list:
+        yield f"conversation/{turns}_turns", {"response": ANSWER, "conversation_history": conversation(turns)}
+    items = [{"index": index, "text": ANSWER, "status": "done", "content_hash": f"{index:064x}",
+              "bytes": 48000 + index, "cached": False, "seconds": 1.234, "finished_at": 1700000000.0 + index}
+             for index in range(200)]
+    yield "tts_job/200_items", {"job_id": "0" * 32, "kind": "tts", "status": "done", "total": 200, "items": items}
+
+
+def time_call(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def compressed(body: bytes, encoding: str) -> bytes:
+    return compression._Encoder(encoding).finish(body)
+
+
+def streamed(lines, encoding: str) -> bytes:
+    # Flushed after every line, as the middleware does for streaming bodies
+    encoder = compression._Encoder(encoding)
+    return b"".join(encoder.flush(line) for line in lines) + encoder.finish(b"")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--client-mbps", type=float, default=5.0, help="client download bandwidth used for the transfer estimate")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    encodings = ["gzip"] + (["br"] if compression.brotli is not None else [])
+    bytes_per_second = args.client_mbps * 1_000_000 / 8
+    results = []
+    for name, payload in payloads(args.turns):
+        stock = time_call(lambda: JSONResponse(payload), args.repeat)
+        fast = time_call(lambda: FastJSONResponse(payload), args.repeat)
+        body = dumps(payload)
+        row = {
+            "payload": name,
+            "bytes": len(body),
+            "stock_render_us": round(stock * 1e6, 1),
+            "fast_render_us": round(fast * 1e6, 1),
+            "render_speedup": round(stock / fast, 1),
+        }
+        for encoding in encodings:
+            size = len(compressed(body, encoding))
+            cpu = time_call(lambda: compressed(body, encoding), args.repeat)
+            if len(body) < compression.CompressionMiddleware(None).minimum_size:
+                size, cpu = len(body), 0.0
+            row[f"{encoding}_bytes"] = size
+            row[f"{encoding}_us"] = round(cpu * 1e6, 1)
+            row[f"{encoding}_saved_ms"] = round(((len(body) - size) / bytes_per_second - cpu) * 1000, 2)
+        results.append(row)
+
+    # Partial transcripts of a long recording, one NDJSON line per segment
+    lines = [{"type": "partial", "index": index, "text": ANSWER, "start": index * 30.0} for index in range(40)]
+    stock = time_call(lambda: [(json.dumps(line) + "\n").encode("utf-8") for line in lines], args.repeat)
+    fast = time_call(lambda: [ndjson_line(line) for line in lines], args.repeat)
+    encoded = [ndjson_line(line) for line in lines]
+    body = b"".join(encoded)
+    row = {
+        "payload": "ndjson/40_segments",
+        "bytes": len(body),
+        "stock_render_us": round(stock * 1e6, 1),
+        "fast_render_us": round(fast * 1e6, 1),
+        "render_speedup": round(stock / fast, 1),
+    }
+    for encoding in encodings:
+        size = len(streamed(encoded, encoding))
+        cpu = time_call(lambda: streamed(encoded, encoding), args.repeat)
+        row[f"{encoding}_bytes"] = size
+        row[f"{encoding}_us"] = round(cpu * 1e6, 1)
+        row[f"{encoding}_saved_ms"] = round(((len(body) - size) / bytes_per_second - cpu) * 1000, 2)
+    results.append(row)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    columns = list(results[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in results)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in results:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+    print(f"\nbodies under {compression.CompressionMiddleware(None).minimum_size} bytes are sent uncompressed; "
+          f"saved = transfer time at {args.client_mbps} Mbit/s - compression CPU time")
+
+
+if __name__ == "__main__":
+    main()
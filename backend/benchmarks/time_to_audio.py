@@ -0,0 +1,297 @@
+"""
+End-to-end voice turn benchmark: time from releasing the mic to first audio.
+
+Replays the browser's turn sequence (frontend/pages/index.tsx): upload the
+recording to /api/speech-to-text, send the transcript with the conversation
+history to /api/generate-text, then post the reply to /api/text-to-speech.
+Each concurrent client is one conversation whose history grows turn by turn;
+a turn joins the history once its reply has arrived.
+
+With --socket the reply and its speech come from one combined voice turn on
+/ws/voice instead (one connection per conversation), so the two round trips
+and the reply travelling back up are saved. This needs the websockets package.
+
+Per turn it reports, measured from the start of the upload:
+    stt_ms    transcript received
+    ttft_ms   first byte of the reply text
+    ttfa_ms   first byte of reply audio (what the user waits for)
+    turn_ms   audio fully received
+
+Without --stream every response is read whole, as the browser does today;
+with --stream bodies are read incrementally and transcription uses NDJSON, so
+first-byte times show what streaming clients would gain.
+
+--spawn starts the backend with the per-client rate limit and load shedding
+off, since every simulated client shares one address. Start a backend given
+with --url the same way (RATE_LIMIT_PER_MINUTE=0 ADMISSION_TARGET_DELAY_MS=0).
+
+Usage (from the backend directory):
+    python benchmarks/time_to_audio.py --spawn --concurrency 1 4 16
+    python benchmarks/time_to_audio.py --url http://127.0.0.1:8000 --stream --turns 50
+    python benchmarks/time_to_audio.py --spawn --socket --concurrency 1 4 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+# Make the backend modules importable when run as a script
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(benchmarks_dir)
+if benchmarks_dir not in sys.path:
+    sys.path.insert(0, benchmarks_dir)
+
+from audio_normalization import encode_wav, synthesize_speech  # noqa: E402
+from loadtest import QUESTIONS, percentile  # noqa: E402
+
+METRICS = ("stt_ms", "ttft_ms", "ttfa_ms", "turn_ms")
+
+# A failed turn is counted and the run goes on
+TURN_ERRORS = (httpx.HTTPError, ValueError, KeyError, OSError) + (
+    (websockets.WebSocketException,) if websockets is not None else ())
+
+
+class VoiceTurn:
+    """One conversation replaying the browser's sequential voice turn, or the combined one with `socket_url`."""
+    def __init__(self, client: httpx.AsyncClient, audio: bytes, stream: bool, typed: bool,
+                 socket_url: Optional[str] = None):
+        self.client = client
+        self.audio = audio
+        self.stream = stream
+        self.typed = typed
+        self.socket_url = socket_url
+        self.socket = None
+        self.messages: List[Dict[str, str]] = []
+
+    async def close(self):
+        if self.socket is not None:
+            await self.socket.close()
+            self.socket = None
+
+    async def _socket_turn(self, text: str, started: float) -> Tuple[float, float, str]:
+        """One turn on /ws/voice; returns (ms to reply text, ms to reply audio, reply)."""
+        if self.socket is None:
+            self.socket = await websockets.connect(self.socket_url, max_size=None)
+        try:
+            await self.socket.send(json.dumps({"type": "turn", "message": text, "conversation_history": self.messages}))
+            ttft_ms = ttfa_ms = None
+            reply = ""
+            while True:
+                message = await self.socket.recv()
+                elapsed_ms = (time.perf_counter() - started) * 1000.0
+                if isinstance(message, bytes):
+                    ttfa_ms = elapsed_ms
+                    continue
+                event = json.loads(message)
+                if event["type"] == "reply":
+                    ttft_ms, reply = elapsed_ms, event["response"]
+                elif event["type"] == "done":
+                    return ttft_ms, ttfa_ms, reply
+                elif event["type"] == "error":
+                    raise ValueError(f"{event['status']}: {event['detail']}")
+        except BaseException:
+            # The connection may be mid-turn; the next turn starts a fresh one
+            await self.close()
+            raise
+
+    async def _post(self, path: str, started: float, **kwargs) -> Tuple[float, bytes]:
+        """POST and return (ms to first body byte, full body)."""
+        if not self.stream:
+            response = await self.client.post(path, **kwargs)
+            response.raise_for_status()
+            return (time.perf_counter() - started) * 1000.0, response.content
+
+        first_byte_ms = None
+        body = bytearray()
+        async with self.client.stream("POST", path, **kwargs) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                if first_byte_ms is None and chunk:
+                    first_byte_ms = (time.perf_counter() - started) * 1000.0
+                body.extend(chunk)
+        return first_byte_ms or (time.perf_counter() - started) * 1000.0, bytes(body)
+
+    async def run(self, question: str) -> Dict[str, float]:
+        started = time.perf_counter()
+        timings = {}
+
+        if self.typed:
+            text = question
+            timings["stt_ms"] = 0.0
+        else:
+            params = {"stream": "true"} if self.stream else None
+            _, body = await self._post("/api/speech-to-text", started, params=params,
+                                       files={"audio_file": ("recording.wav", self.audio, "audio/wav")})
+            # NDJSON ends with the final transcript; plain JSON is a single object
+            _transcript = json.loads(body.decode("utf-8").strip().splitlines()[-1])["response"]
+            timings["stt_ms"] = (time.perf_counter() - started) * 1000.0
+            # Synthetic audio transcribes to filler words, so continue the
+            # conversation with the scripted question instead
+            text = question
+
+        # The message goes separately; the history holds the earlier turns only
+        if self.socket_url is not None:
+            timings["ttft_ms"], timings["ttfa_ms"], reply = await self._socket_turn(text, started)
+        else:
+            timings["ttft_ms"], body = await self._post("/api/generate-text", started, json={
+                "message": text,
+                "conversation_history": self.messages,
+            })
+            reply = json.loads(body)["response"]
+            timings["ttfa_ms"], _ = await self._post("/api/text-to-speech", started, data={"text": reply})
+        timings["turn_ms"] = (time.perf_counter() - started) * 1000.0
+        self.messages.append({"role": "user", "content": text})
+        self.messages.append({"role": "assistant", "content": reply})
+        return timings
+
+
+async def run_level(url: str, concurrency: int, turns: int, turns_per_session: int,
+                    audio: bytes, stream: bool, typed: bool, socket: bool, timeout: float) -> dict:
+    samples: Dict[str, List[float]] = {name: [] for name in METRICS}
+    errors = 0
+    remaining = turns
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    socket_url = "ws" + url[len("http"):].rstrip("/") + "/ws/voice" if socket else None
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def session(worker_id: int):
+            nonlocal remaining, errors
+            conversation = VoiceTurn(client, audio, stream, typed, socket_url)
+            turn = 0
+            while remaining > 0:
+                remaining -= 1
+                if turn and turn % turns_per_session == 0:
+                    await conversation.close()
+                    conversation = VoiceTurn(client, audio, stream, typed, socket_url)
+                try:
+                    timings = await conversation.run(QUESTIONS[(worker_id + turn) % len(QUESTIONS)])
+                except TURN_ERRORS:
+                    errors += 1
+                else:
+                    for name in METRICS:
+                        samples[name].append(timings[name])
+                turn += 1
+            await conversation.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(session(index) for index in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    row = {"concurrency": concurrency, "turns": len(samples["turn_ms"]), "errors": errors,
+           "turns_per_s": round(len(samples["turn_ms"]) / wall, 2)}
+    for name in METRICS:
+        row[f"{name[:-3]}_p50_ms"] = round(percentile(samples[name], 0.50), 1)
+        row[f"{name[:-3]}_p95_ms"] = round(percentile(samples[name], 0.95), 1)
+    return row
+
+
+def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def spawn_stack(backend_port: int, mock_port: int, mock_args: List[str]) -> List[subprocess.Popen]:
+    """Start the mock upstreams and a backend pointed at them."""
+    mock_url = f"http://127.0.0.1:{mock_port}/v1"
+    env = dict(
+        os.environ,
+        OPENROUTER_BASE_URL=mock_url, WHISPER_BASE_URL=mock_url, ELEVENLABS_BASE_URL=mock_url,
+        OPENROUTER_API_KEY="mock", OPENAI_API_KEY="mock", ELEVENLABS_API_KEY="mock",
+        # Every simulated client shares one address; measure latency, not our own limits
+        RATE_LIMIT_PER_MINUTE="0", ADMISSION_TARGET_DELAY_MS="0",
+    )
+    processes = [
+        subprocess.Popen([sys.executable, os.path.join(benchmarks_dir, "mock_upstreams.py"),
+                          "--port", str(mock_port), *mock_args]),
+        subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(backend_port),
+                          "--log-level", "warning"], cwd=project_dir, env=env),
+    ]
+    try:
+        wait_until_up(f"http://127.0.0.1:{mock_port}/docs")
+        wait_until_up(f"http://127.0.0.1:{backend_port}/")
+    except RuntimeError:
+        stop_stack(processes)
+        raise
+    return processes
+
+
+def stop_stack(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="backend to drive (ignored with --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="start mock upstreams and a backend for the run")
+    parser.add_argument("--backend-port", type=int, default=8765)
+    parser.add_argument("--mock-port", type=int, default=9765)
+    parser.add_argument("--mock-arg", action="append", default=[],
+                        help="extra mock_upstreams.py argument, e.g. --mock-arg=--llm-ttft-ms=600")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--turns", type=int, default=40, help="turns per concurrency level")
+    parser.add_argument("--turns-per-session", type=int, default=5, help="turns before a conversation restarts")
+    parser.add_argument("--audio-seconds", type=float, default=4.0, help="length of the synthetic recording")
+    parser.add_argument("--stream", action="store_true", help="read responses incrementally")
+    parser.add_argument("--typed", action="store_true", help="skip speech-to-text, as for typed messages")
+    parser.add_argument("--socket", action="store_true", help="get reply and speech from one turn on /ws/voice")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    if args.socket and websockets is None:
+        parser.error("--socket needs the websockets package (pip install websockets)")
+
+    # Browsers record 48 kHz mono
+    audio = encode_wav(synthesize_speech(args.audio_seconds, 48000, 1), 48000, 16)
+
+    url = args.url
+    processes: Optional[List[subprocess.Popen]] = None
+    if args.spawn:
+        processes = spawn_stack(args.backend_port, args.mock_port, args.mock_arg)
+        url = f"http://127.0.0.1:{args.backend_port}"
+
+    try:
+        rows = [
+            asyncio.run(run_level(url, concurrency, args.turns, args.turns_per_session,
+                                  audio, args.stream, args.typed, args.socket, args.timeout))
+            for concurrency in args.concurrency
+        ]
+    finally:
+        if processes is not None:
+            stop_stack(processes)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    columns = list(rows[0])
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import config
+from metrics import CACHE_BYTES, CACHE_REQUESTS
+
+
+class LRUCache:
+    """
+    A thread-safe LRU cache of byte strings, bounded by their total size.
+
+    Hits and misses are counted in the cache_requests_total metric under the
+    cache's name, so hit ratios can be derived per cache.
+    """
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = CACHE_REQUESTS.labels(name, "hit")
+        self._misses = CACHE_REQUESTS.labels(name, "miss")
+        self._bytes = CACHE_BYTES.labels(name)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        (self._hits if value is not None else self._misses).inc()
+        return value
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+            size = self._size
+        self._bytes.set(size)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def content_hash(*parts: str) -> str:
+    """SHA-256 over the given strings, used as a stable cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+# Synthesized speech keyed by content_hash(voice, model, text)
+tts_cache = LRUCache("tts", config.TTS_CACHE_MAX_BYTES)
@@ -0,0 +1,275 @@
+import asyncio
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import httpx
+
+from errors import RequestCancelledError
+from metrics import CANCELLED_UPSTREAM, CLIENT_CANCELLATIONS
+from timing import current_stage
+
+# Cancellation token of the request or voice turn being handled; carried into
+# worker threads with the rest of the context
+_token: contextvars.ContextVar[Optional["CancelToken"]] = contextvars.ContextVar("cancel_token", default=None)
+
+
+class CancelToken:
+    """
+    Set once when nobody is waiting for a request's result any more: the
+    client disconnected or barged in. Upstream calls check it before they
+    start, while they queue and while their response streams in.
+    """
+    def __init__(self, abandon_in_flight: bool = False):
+        # Also give up on a request still waiting for its response headers,
+        # rather than only cutting off a response as it streams in
+        self.abandon_in_flight = abandon_in_flight
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str, client: bool = True):
+        """
+        Cancel the work under this token. `client` is False when we gave up
+        on the work ourselves (e.g. a lost hedge), which isn't counted as a
+        client cancellation.
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        if client:
+            CLIENT_CANCELLATIONS.labels(reason).inc()
+        for callback in callbacks:
+            callback()
+
+    def child(self, abandon_in_flight: bool = False) -> Tuple["CancelToken", Callable[[], None]]:
+        """
+        A token cancelled along with this one that can also be cancelled on
+        its own. Returns it with a function that detaches it again.
+        """
+        token = CancelToken(abandon_in_flight)
+        detach = self.on_cancel(lambda: token.cancel(self.reason or "cancelled", client=False))
+        return token, detach
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Call `callback` on cancellation (at once if already cancelled). Returns a function that unregisters it."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to `timeout` seconds; return True early if cancelled."""
+        return self._event.wait(timeout)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _token.get()
+
+
+@contextmanager
+def cancel_scope(token: Optional[CancelToken] = None) -> Iterator[CancelToken]:
+    """Make `token` (or a new one) the current request's cancellation token inside the block."""
+    token = token or CancelToken()
+    reset = _token.set(token)
+    try:
+        yield token
+    finally:
+        _token.reset(reset)
+
+
+def cancelled() -> bool:
+    token = _token.get()
+    return token is not None and token.cancelled
+
+
+def count_cancelled(phase: str, stage: Optional[str] = None, calls: int = 1):
+    """
+    Count upstream work the client no longer needed.
+
+    Args:
+        phase (str): "skipped" (never sent), "queued" (left a concurrency
+            queue) or "aborted" (response cut off mid-stream)
+        stage (Optional[str]): Pipeline stage; defaults to the current one
+        calls (int): Number of calls
+    """
+    if calls > 0:
+        CANCELLED_UPSTREAM.labels(stage or current_stage() or "unknown", phase).inc(calls)
+
+
+def check_cancelled():
+    """Raise RequestCancelledError, counting a skipped call, if the current request was cancelled."""
+    if cancelled():
+        count_cancelled("skipped")
+        raise RequestCancelledError()
+
+
+def sleep(seconds: float):
+    """time.sleep that wakes up early, raising RequestCancelledError, if the request is cancelled."""
+    token = _token.get()
+    if token is None:
+        threading.Event().wait(seconds)
+    elif token.wait(seconds):
+        raise RequestCancelledError()
+
+
+class _CancellableStream(httpx.SyncByteStream):
+    """Passes response chunks through until the request is cancelled, then stops reading."""
+    def __init__(self, stream: httpx.SyncByteStream, token: CancelToken, stage: Optional[str]):
+        self._stream = stream
+        self._token = token
+        self._stage = stage
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            if self._token.cancelled:
+                # Closing the half-read response drops the connection, which
+                # is what makes the upstream stop generating
+                count_cancelled("aborted", self._stage)
+                raise RequestCancelledError()
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+
+
+class CancellableTransport(httpx.BaseTransport):
+    """
+    httpx transport wrapper that refuses to send requests for a cancelled
+    request and cuts off responses that are still streaming in when it is
+    cancelled.
+    """
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        token = _token.get()
+        if token is None:
+            return self._transport.handle_request(request)
+        check_cancelled()
+        if token.abandon_in_flight:
+            response = self._send_abandonable(request, token)
+        else:
+            response = self._transport.handle_request(request)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_CancellableStream(response.stream, token, current_stage()),
+            extensions=response.extensions,
+        )
+
+    def _send_abandonable(self, request: httpx.Request, token: CancelToken) -> httpx.Response:
+        """
+        Send on a helper thread so the caller can stop waiting for the
+        response headers when the token is cancelled. The caller then gets
+        RequestCancelledError at once, freeing its thread and concurrency
+        slot, and the response is closed unread when it arrives, which drops
+        the connection.
+        """
+        lock = threading.Lock()
+        done = threading.Event()
+        state: dict = {"abandoned": False}
+
+        def send():
+            try:
+                response = self._transport.handle_request(request)
+            except BaseException as e:
+                with lock:
+                    state["error"] = e
+                done.set()
+                return
+            with lock:
+                abandoned = state["abandoned"]
+                if not abandoned:
+                    state["response"] = response
+            done.set()
+            if abandoned:
+                response.close()
+
+        threading.Thread(target=contextvars.copy_context().run, args=(send,),
+                         name="upstream-send", daemon=True).start()
+        unregister = token.on_cancel(done.set)
+        try:
+            done.wait()
+        finally:
+            unregister()
+        with lock:
+            if "response" not in state and "error" not in state:
+                state["abandoned"] = True
+                count_cancelled("aborted")
+                raise RequestCancelledError()
+        if "error" in state:
+            raise state["error"]
+        return state["response"]
+
+    def close(self):
+        self._transport.close()
+
+
+class DisconnectMiddleware:
+    """
+    ASGI middleware that gives each HTTP request a cancellation token and
+    cancels it if the client disconnects before the response is complete.
+
+    Once the app has read the whole body the only message left is
+    http.disconnect, so a background task waits for it and hands it on to
+    whoever asks next (e.g. StreamingResponse's own disconnect listener).
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = CancelToken()
+        state = {"watcher": None, "done": False}
+        disconnect = asyncio.Event()
+        last: List[dict] = []
+
+        async def watch():
+            last.append(await receive())
+            disconnect.set()
+            if last[0]["type"] == "http.disconnect" and not state["done"]:
+                token.cancel("disconnect")
+
+        async def receive_wrapper():
+            if state["watcher"] is not None:
+                await disconnect.wait()
+                return last[0]
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                state["watcher"] = asyncio.ensure_future(watch())
+            elif message["type"] == "http.disconnect" and not state["done"]:
+                token.cancel("disconnect")
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["done"] = True
+            await send(message)
+
+        with cancel_scope(token):
+            try:
+                await self.app(scope, receive_wrapper, send_wrapper)
+            finally:
+                state["done"] = True
+                if state["watcher"] is not None:
+                    state["watcher"].cancel()
@@ -0,0 +1,249 @@
+import atexit
+import base64
+import gzip
+import json
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+import config
+from cache import content_hash
+from timing import PHASE_TTFB, current_stage, notify_first_byte, record
+
+logger = logging.getLogger(__name__)
+
+MODE_OFF = "off"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+# Response headers worth keeping; everything else (cookies, request ids,
+# rate-limit counters) is noise or sensitive.
+KEPT_HEADERS = ("content-type", "content-encoding", "retry-after")
+
+# Chunks that arrive closer together than this are merged when recording,
+# which keeps cassettes small without visibly changing the stream shape.
+CHUNK_MERGE_SECONDS = 0.005
+
+_BOUNDARY = re.compile(rb"boundary=([^;\s]+)")
+
+
+def request_key(request: httpx.Request) -> str:
+    """
+    Match key for an upstream request: method, path and a canonical body.
+
+    JSON bodies are compared with sorted keys and multipart bodies with their
+    random boundary replaced, so the same call matches across runs. API keys
+    and other headers are never part of the key or the cassette.
+    """
+    body = request.read()
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True).encode("utf-8")
+        except ValueError:
+            pass
+    elif content_type.startswith("multipart/"):
+        match = _BOUNDARY.search(content_type.encode("latin-1"))
+        if match:
+            body = body.replace(match.group(1).strip(b'"'), b"BOUNDARY")
+    return content_hash(request.method, request.url.path, body.hex())
+
+
+class Cassette:
+    """
+    Recorded upstream exchanges, one gzip-compressed JSON line each:
+
+        {"key": ..., "method": "POST", "path": "/v1/chat/completions",
+         "stage": "llm", "status": 200, "headers": {...}, "ttfb": 0.412,
+         "chunks": [[0.0, "<base64>"], [0.031, "<base64>"], ...]}
+
+    `ttfb` is seconds from sending the request to the response headers, and
+    each chunk carries its offset in seconds from the headers.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._entries: Dict[str, List[dict]] = defaultdict(list)
+        self._by_path: Dict[str, List[dict]] = defaultdict(list)
+        self._cursor: Dict[str, int] = defaultdict(int)
+
+    def load(self) -> int:
+        """Read every entry from disk, returning how many were loaded."""
+        count = 0
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as handle:
+                for line in handle:
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry)
+                    self._by_path[f"{entry['method']} {entry['path']}"].append(entry)
+                    count += 1
+        except EOFError:
+            # A recording process that was killed leaves the last gzip block unterminated
+            logger.warning(f"Cassette {self.path} is truncated; using the {count} complete entries")
+        return count
+
+    def append(self, entry: dict):
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = gzip.open(self.path, "at", encoding="utf-8")
+                atexit.register(self.close)
+            self._file.write(line)
+            # Sync flush so everything written so far survives a crash
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def find(self, request: httpx.Request) -> Optional[dict]:
+        """
+        The recorded exchange for a request. Exact matches are served in
+        recorded order, cycling when a request repeats more often than it was
+        recorded; otherwise fall back to any exchange on the same endpoint.
+        """
+        key = request_key(request)
+        candidates = self._entries.get(key)
+        if not candidates:
+            key = f"{request.method} {request.url.path}"
+            candidates = self._by_path.get(key)
+        if not candidates:
+            return None
+        with self._lock:
+            index = self._cursor[key]
+            self._cursor[key] = index + 1
+        return candidates[index % len(candidates)]
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    """Passes response chunks through, noting their timing, and saves the exchange on close."""
+    def __init__(self, stream: httpx.SyncByteStream, cassette: Cassette, entry: dict, headers_at: float):
+        self._stream = stream
+        self._cassette = cassette
+        self._entry = entry
+        self._headers_at = headers_at
+        self._chunks: List[list] = []
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            offset = time.perf_counter() - self._headers_at
+            if self._chunks and offset - self._chunks[-1][0] < CHUNK_MERGE_SECONDS:
+                self._chunks[-1][1] += chunk
+            else:
+                self._chunks.append([offset, chunk])
+            yield chunk
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._entry["chunks"] = [
+                [round(offset, 4), base64.b64encode(data).decode("ascii")] for offset, data in self._chunks
+            ]
+            self._cassette.append(self._entry)
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """Forwards requests to the real transport and records every exchange."""
+    def __init__(self, transport: httpx.BaseTransport, cassette: Cassette):
+        self._transport = transport
+        self._cassette = cassette
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        entry = {
+            "key": request_key(request),
+            "method": request.method,
+            "path": request.url.path,
+            "stage": current_stage(),
+        }
+        started = time.perf_counter()
+        response = self._transport.handle_request(request)
+        headers_at = time.perf_counter()
+        entry.update(
+            status=response.status_code,
+            headers={name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+            ttfb=round(headers_at - started, 4),
+        )
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, self._cassette, entry, headers_at),
+            extensions=response.extensions,
+        )
+
+    def close(self):
+        self._transport.close()
+        self._cassette.close()
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks: List[list], headers_at: float, time_scale: float):
+        self._chunks = chunks
+        self._headers_at = headers_at
+        self._time_scale = time_scale
+
+    def __iter__(self) -> Iterator[bytes]:
+        for offset, data in self._chunks:
+            delay = self._headers_at + offset * self._time_scale - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield base64.b64decode(data)
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """
+    Serves recorded exchanges with their original timing multiplied by
+    `time_scale` (0 replays instantly). Requests with no recording fail like
+    an unreachable upstream, so replay never touches the network.
+    """
+    def __init__(self, cassette: Cassette, time_scale: float = 1.0):
+        self._cassette = cassette
+        self._time_scale = max(0.0, time_scale)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        entry = self._cassette.find(request)
+        if entry is None:
+            raise httpx.ConnectError(f"No recorded exchange for {request.method} {request.url.path}", request=request)
+
+        started = time.perf_counter()
+        time.sleep(entry["ttfb"] * self._time_scale)
+        headers_at = time.perf_counter()
+        stage = current_stage()
+        if stage is not None:
+            record(stage, PHASE_TTFB, headers_at - started)
+        notify_first_byte()
+
+        return httpx.Response(
+            status_code=entry["status"],
+            headers=entry["headers"],
+            stream=_ReplayStream(entry["chunks"], headers_at, self._time_scale),
+        )
+
+
+def upstream_transport(transport: httpx.BaseTransport) -> httpx.BaseTransport:
+    """
+    Wrap the real upstream transport according to UPSTREAM_CASSETTE_MODE:
+    'record' saves every exchange to UPSTREAM_CASSETTE_PATH, 'replay' serves
+    them from it instead of the network, anything else uses the network as is.
+    """
+    mode = config.UPSTREAM_CASSETTE_MODE
+    if mode == MODE_RECORD:
+        logger.info(f"Recording upstream exchanges to {config.UPSTREAM_CASSETTE_PATH}")
+        return RecordingTransport(transport, Cassette(config.UPSTREAM_CASSETTE_PATH))
+    if mode == MODE_REPLAY:
+        cassette = Cassette(config.UPSTREAM_CASSETTE_PATH)
+        count = cassette.load()
+        logger.info(
+            f"Replaying {count} upstream exchanges from {config.UPSTREAM_CASSETTE_PATH} "
+            f"at {config.UPSTREAM_REPLAY_TIME_SCALE}x original timing"
+        )
+        return ReplayTransport(cassette, config.UPSTREAM_REPLAY_TIME_SCALE)
+    return transport
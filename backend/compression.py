@@ -0,0 +1,164 @@
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+import config
+from metrics import COMPRESSED_RESPONSES, COMPRESSION_SAVED_BYTES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies worth compressing: text and structured text. Audio, archives and
+# images are compressed already, so everything else passes through.
+COMPRESSIBLE_TYPES = frozenset({
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+})
+
+# Statuses whose bodies must stay byte-for-byte what the app sent
+_UNTOUCHED_STATUSES = frozenset({204, 206, 304})
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return (media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+            or media_type.endswith("+json") or media_type.endswith("+xml"))
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """
+    Pick "br" or "gzip" from an Accept-Encoding header, or None.
+
+    The client's q-values decide; brotli wins ties when it is installed.
+    """
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        weight = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[token] = weight
+    available = (["br"] if brotli is not None else []) + ["gzip"]
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for encoding in available:
+        weight = weights.get(encoding, wildcard)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class _Encoder:
+    """Incremental gzip or brotli compressor that can flush mid-stream."""
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=config.COMPRESSION_BROTLI_QUALITY, mode=brotli.MODE_TEXT)
+        else:
+            self._zlib = zlib.compressobj(config.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def flush(self, data: bytes) -> bytes:
+        """Compress `data` and everything buffered, so the client can decode it now."""
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing text and JSON responses with brotli or gzip,
+    as negotiated from Accept-Encoding.
+
+    Whole bodies under `minimum_size` are sent as they are. Streaming
+    bodies (NDJSON, server-sent events) are compressed chunk by chunk and
+    flushed after each one, so every line still reaches the client as soon
+    as it is written. Responses that already have a Content-Encoding, are
+    partial (206) or carry no body are never touched.
+    """
+    def __init__(self, app, minimum_size: int = config.COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        start_message: Optional[dict] = None
+        encoder: Optional[_Encoder] = None
+        raw_bytes = 0
+        sent_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal start_message, encoder, raw_bytes, sent_bytes
+            if message["type"] == "http.response.start":
+                # Held until the first body chunk shows whether it is worth compressing
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                headers = MutableHeaders(raw=list(start["headers"]))
+                eligible = (is_compressible(headers.get("content-type", ""))
+                            and "content-encoding" not in headers
+                            and "content-range" not in headers
+                            and start["status"] not in _UNTOUCHED_STATUSES)
+                if eligible:
+                    headers.add_vary_header("Accept-Encoding")
+                if eligible and encoding is not None and (more_body or len(body) >= self.minimum_size):
+                    encoder = _Encoder(encoding)
+                    headers["Content-Encoding"] = encoding
+                    if "etag" in headers and not headers["etag"].startswith("W/"):
+                        # Same content, different bytes
+                        headers["ETag"] = "W/" + headers["etag"]
+                    del headers["content-length"]
+                    if not more_body:
+                        compressed = encoder.finish(body)
+                        headers["Content-Length"] = str(len(compressed))
+                        COMPRESSED_RESPONSES.labels(encoding).inc()
+                        COMPRESSION_SAVED_BYTES.labels(encoding).inc(len(body) - len(compressed))
+                        await send(dict(start, headers=headers.raw))
+                        await send({"type": "http.response.body", "body": compressed})
+                        return
+                await send(dict(start, headers=headers.raw))
+
+            if encoder is None:
+                await send(message)
+                return
+            raw_bytes += len(body)
+            if more_body:
+                # Nothing new to flush for an empty chunk
+                chunk = encoder.flush(body) if body else b""
+            else:
+                chunk = encoder.finish(body)
+                COMPRESSED_RESPONSES.labels(encoding).inc()
+            sent_bytes += len(chunk)
+            if not more_body:
+                COMPRESSION_SAVED_BYTES.labels(encoding).inc(raw_bytes - sent_bytes)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
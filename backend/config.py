@@ -0,0 +1,214 @@
+import json
+import os
+
+# Settings are read once at import time. main.py loads .env before importing
+# anything that depends on this module.
+
+# Long-audio transcription: recordings longer than STT_LONG_AUDIO_SECONDS are
+# split at silences into segments of at most STT_SEGMENT_MAX_SECONDS and
+# transcribed concurrently, at most STT_MAX_CONCURRENCY at a time.
+STT_LONG_AUDIO_SECONDS = float(os.environ.get("STT_LONG_AUDIO_SECONDS", "30"))
+STT_SEGMENT_MAX_SECONDS = float(os.environ.get("STT_SEGMENT_MAX_SECONDS", "20"))
+STT_SEGMENT_OVERLAP_SECONDS = float(os.environ.get("STT_SEGMENT_OVERLAP_SECONDS", "1.0"))
+STT_MAX_CONCURRENCY = int(os.environ.get("STT_MAX_CONCURRENCY", "4"))
+if not 0 <= STT_SEGMENT_OVERLAP_SECONDS < STT_SEGMENT_MAX_SECONDS:
+    raise ValueError(
+        "STT_SEGMENT_MAX_SECONDS must be positive and greater than STT_SEGMENT_OVERLAP_SECONDS "
+        f"(got {STT_SEGMENT_MAX_SECONDS} and {STT_SEGMENT_OVERLAP_SECONDS})"
+    )
+
+# Upload gating for audio endpoints. Whisper rejects files over 25 MB anyway,
+# so there is no point buffering more than that.
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_MAX_SECONDS = float(os.environ.get("UPLOAD_MAX_SECONDS", "600"))
+
+# In-process cache for synthesized speech, bounded by total audio bytes.
+# Its hit ratio is exported on /metrics; 0 disables it.
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Strip markdown and rewrite URLs, numbers and punctuation for speech before
+# synthesis; the normalized text is also the TTS cache key
+TTS_NORMALIZE_TEXT = os.environ.get("TTS_NORMALIZE_TEXT", "true").lower() in ("1", "true", "yes")
+
+# Long-text speech: replies longer than TTS_CHUNK_THRESHOLD_CHARS are split
+# into sentences of at most TTS_CHUNK_MAX_CHARS, synthesized at most
+# TTS_CHUNK_CONCURRENCY at a time and cached one by one. 0 turns it off.
+TTS_CHUNK_THRESHOLD_CHARS = int(os.environ.get("TTS_CHUNK_THRESHOLD_CHARS", "300"))
+TTS_CHUNK_MAX_CHARS = int(os.environ.get("TTS_CHUNK_MAX_CHARS", "250"))
+TTS_CHUNK_CONCURRENCY = int(os.environ.get("TTS_CHUNK_CONCURRENCY", "4"))
+
+# API keys
+OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY", "")
+ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY", "")
+
+# Upstream API base URLs. Point these at benchmarks/mock_upstreams.py for
+# load tests that don't spend real credits.
+OPENROUTER_BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+WHISPER_BASE_URL = os.environ.get("WHISPER_BASE_URL", "https://api.openai.com/v1")
+ELEVENLABS_BASE_URL = os.environ.get("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io/v1")
+
+# Concurrent calls allowed per upstream provider in this process, and how long
+# a call may wait for a free slot before the request fails with a 503.
+UPSTREAM_MAX_CONCURRENCY = {
+    "openrouter": int(os.environ.get("OPENROUTER_MAX_CONCURRENCY", "16")),
+    "whisper": int(os.environ.get("WHISPER_MAX_CONCURRENCY", "8")),
+    "elevenlabs": int(os.environ.get("ELEVENLABS_MAX_CONCURRENCY", "4")),
+}
+_QUEUE_TIMEOUT = os.environ.get("UPSTREAM_QUEUE_TIMEOUT_SECONDS", "10")
+UPSTREAM_QUEUE_TIMEOUT_SECONDS = {
+    "openrouter": float(os.environ.get("OPENROUTER_QUEUE_TIMEOUT_SECONDS", _QUEUE_TIMEOUT)),
+    "whisper": float(os.environ.get("WHISPER_QUEUE_TIMEOUT_SECONDS", _QUEUE_TIMEOUT)),
+    "elevenlabs": float(os.environ.get("ELEVENLABS_QUEUE_TIMEOUT_SECONDS", _QUEUE_TIMEOUT)),
+}
+
+# Time budget for one voice turn and the share of it each stage may spend on
+# upstream calls, retries included. Calls made outside a budget time out after
+# UPSTREAM_TIMEOUT_SECONDS.
+TURN_BUDGET_SECONDS = float(os.environ.get("TURN_BUDGET_SECONDS", "45"))
+STAGE_BUDGET_SHARES = {"stt": 0.25, "llm": 0.45, "tts": 0.30}
+UPSTREAM_TIMEOUT_SECONDS = float(os.environ.get("UPSTREAM_TIMEOUT_SECONDS", "120"))
+
+# Retries for transient upstream failures (connection errors, timeouts, 429
+# and 5xx), with full-jitter exponential backoff
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_SECONDS = float(os.environ.get("RETRY_BASE_DELAY_SECONDS", "0.2"))
+RETRY_MAX_DELAY_SECONDS = float(os.environ.get("RETRY_MAX_DELAY_SECONDS", "2.0"))
+
+# Circuit breaker per provider: open after this many consecutive failures and
+# refuse calls for BREAKER_RESET_SECONDS before probing again
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+
+# Hedged requests for reply generation and speech (off by default). When an
+# attempt has no first byte after the HEDGE_PERCENTILE of recent first-byte
+# latency, a second request is raced against it (for replies, on the next
+# backend the router would pick). Hedges are capped at about
+# HEDGE_BUDGET_RATIO of calls.
+HEDGING_ENABLED = os.environ.get("HEDGING_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "0.95"))
+HEDGE_BUDGET_RATIO = float(os.environ.get("HEDGE_BUDGET_RATIO", "0.05"))
+HEDGE_BUDGET_BURST = float(os.environ.get("HEDGE_BUDGET_BURST", "3"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_MS = float(os.environ.get("HEDGE_MIN_DELAY_MS", "50"))
+HEDGE_WINDOW = int(os.environ.get("HEDGE_WINDOW", "200"))
+
+# Per-client rate limit on requests that reach an upstream API, as a token
+# bucket of RATE_LIMIT_BURST refilled at RATE_LIMIT_PER_MINUTE (0 disables).
+# Clients are keyed by "ip", "session" (X-Session-ID) or "api_key" (X-API-Key
+# or Authorization). Set RATE_LIMIT_REDIS_URL to share buckets across workers.
+# Behind a reverse proxy (Vercel, Render) every request comes from the proxy:
+# list its addresses or networks in RATE_LIMIT_TRUSTED_PROXIES so "ip" keys on
+# the client address from X-Forwarded-For instead. "*" trusts any peer, but only
+# for the X-Forwarded-For entry that peer appended.
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("RATE_LIMIT_PER_MINUTE", "60"))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_KEY = os.environ.get("RATE_LIMIT_KEY", "ip").lower()
+RATE_LIMIT_TRUSTED_PROXIES = [proxy.strip() for proxy in os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", "").split(",") if proxy.strip()]
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", "")
+
+# Load shedding: once queueing delay stays above the target for a whole
+# interval, new requests get a 503 until it drops again (0 disables).
+ADMISSION_TARGET_DELAY_MS = float(os.environ.get("ADMISSION_TARGET_DELAY_MS", "500"))
+ADMISSION_INTERVAL_SECONDS = float(os.environ.get("ADMISSION_INTERVAL_SECONDS", "1.0"))
+
+# Upstream record/replay (see cassette.py). "record" saves every upstream
+# exchange, "replay" serves them back instead of calling the network, with
+# delays multiplied by UPSTREAM_REPLAY_TIME_SCALE (0 replays instantly).
+UPSTREAM_CASSETTE_MODE = os.environ.get("UPSTREAM_CASSETTE_MODE", "off").lower()
+UPSTREAM_CASSETTE_PATH = os.environ.get("UPSTREAM_CASSETTE_PATH", "upstream-cassette.jsonl.gz")
+UPSTREAM_REPLAY_TIME_SCALE = float(os.environ.get("UPSTREAM_REPLAY_TIME_SCALE", "1.0"))
+
+# LLM backends for router.py: OpenAI-compatible endpoints, each a JSON object
+# with name, model, base_url and api_key_env, plus optional provider (the
+# concurrency limiter it shares), family, tier and cost_per_mtok (USD per
+# million tokens). Defaults to OpenRouter with LLM_MODEL.
+LLM_MODEL = os.environ.get("LLM_MODEL", "openai/gpt-3.5-turbo")
+
+
+def _llm_backends():
+    specs = json.loads(os.environ.get("LLM_BACKENDS") or "null") or [{
+        "name": "openrouter",
+        "model": LLM_MODEL,
+        "base_url": OPENROUTER_BASE_URL,
+        "api_key_env": "OPENROUTER_API_KEY",
+        "family": "gpt-3.5",
+        "cost_per_mtok": 1.0,
+    }]
+    backends = []
+    for spec in specs:
+        spec = dict(spec)
+        spec["api_key"] = os.environ.get(spec.pop("api_key_env", "OPENROUTER_API_KEY"), "")
+        spec.setdefault("base_url", OPENROUTER_BASE_URL)
+        backends.append(spec)
+    return backends
+
+
+LLM_BACKENDS = _llm_backends()
+
+# Routing policy: skip backends costing more than LLM_MAX_COST_PER_MTOK and,
+# if set, outside LLM_MODEL_FAMILY. Latency and error rate are averaged with
+# weight LLM_EWMA_ALPHA; backends above LLM_MAX_ERROR_RATE are used last, and
+# LLM_ROUTER_EXPLORE of requests try a backend other than the fastest.
+LLM_MAX_COST_PER_MTOK = float(os.environ.get("LLM_MAX_COST_PER_MTOK", "0"))
+LLM_MODEL_FAMILY = os.environ.get("LLM_MODEL_FAMILY", "")
+LLM_EWMA_ALPHA = float(os.environ.get("LLM_EWMA_ALPHA", "0.2"))
+LLM_MAX_ERROR_RATE = float(os.environ.get("LLM_MAX_ERROR_RATE", "0.5"))
+LLM_ROUTER_EXPLORE = float(os.environ.get("LLM_ROUTER_EXPLORE", "0.05"))
+
+# Turn routing: each message is classified locally as a greeting, a short
+# question about the persona, or open-ended. Each class gets its own backend
+# tier (see LLM_BACKENDS) and reply length. With TURN_CANNED_ANSWERS on, a
+# message that is exactly one of the standard interview questions is
+# answered from the stored answers without an LLM call.
+TURN_ROUTING_ENABLED = os.environ.get("TURN_ROUTING_ENABLED", "true").lower() in ("1", "true", "yes")
+TURN_CANNED_ANSWERS = os.environ.get("TURN_CANNED_ANSWERS", "false").lower() in ("1", "true", "yes")
+TURN_TIERS = {
+    "greeting": os.environ.get("TURN_TIER_GREETING", "small"),
+    "persona": os.environ.get("TURN_TIER_PERSONA", "small"),
+    "open": os.environ.get("TURN_TIER_OPEN", "standard"),
+}
+TURN_MAX_TOKENS = {
+    "greeting": int(os.environ.get("TURN_MAX_TOKENS_GREETING", "60")),
+    "persona": int(os.environ.get("TURN_MAX_TOKENS_PERSONA", "200")),
+    "open": int(os.environ.get("TURN_MAX_TOKENS_OPEN", "500")),
+}
+
+# Speculative answers (off by default): after each spoken reply, the replies
+# and speech for the SPECULATION_TOP_N interview questions most likely to come
+# next are prepared in the background, using only idle speech capacity. Each
+# session may spend at most SPECULATION_SESSION_CHAR_BUDGET characters of
+# speech (and LLM output, when canned answers are off) this way.
+SPECULATION_ENABLED = os.environ.get("SPECULATION_ENABLED", "false").lower() in ("1", "true", "yes")
+SPECULATION_TOP_N = int(os.environ.get("SPECULATION_TOP_N", "2"))
+SPECULATION_SESSION_CHAR_BUDGET = int(os.environ.get("SPECULATION_SESSION_CHAR_BUDGET", "5000"))
+SPECULATION_MAX_SESSIONS = int(os.environ.get("SPECULATION_MAX_SESSIONS", "1000"))
+# A prepared reply older than this is dropped rather than served: the
+# conversation it was written for has moved on
+SPECULATION_TTL_SECONDS = float(os.environ.get("SPECULATION_TTL_SECONDS", "600"))
+
+# Batch jobs: state and results are kept under JOBS_DIR so a restarted worker
+# resumes unfinished jobs. JOBS_MAX_WORKERS items run at a time across all
+# jobs; an item refused by our own upstream limits is retried up to
+# JOBS_ITEM_ATTEMPTS times.
+JOBS_DIR = os.environ.get("JOBS_DIR", "jobs")
+JOBS_MAX_WORKERS = int(os.environ.get("JOBS_MAX_WORKERS", "4"))
+JOBS_ITEM_ATTEMPTS = int(os.environ.get("JOBS_ITEM_ATTEMPTS", "3"))
+JOBS_MAX_ITEMS = int(os.environ.get("JOBS_MAX_ITEMS", "1000"))
+TTS_JOB_MAX_TEXT_CHARS = int(os.environ.get("TTS_JOB_MAX_TEXT_CHARS", "5000"))
+# Bulk transcription: upload size per job, and whether leading and trailing
+# silence is cut from WAV files before they are transcribed
+STT_JOB_MAX_BYTES = int(os.environ.get("STT_JOB_MAX_BYTES", str(512 * 1024 * 1024)))
+STT_JOB_TRIM_SILENCE = os.environ.get("STT_JOB_TRIM_SILENCE", "true").lower() in ("1", "true", "yes")
+
+# Response compression: text and JSON bodies of at least COMPRESSION_MIN_BYTES
+# are sent with brotli (if installed) or gzip, as the client accepts.
+# Streaming responses are flushed after every chunk.
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Provider SDKs (openai) are imported on first use rather than at startup.
+# With PROVIDER_WARMUP on they are imported on a background thread as soon as
+# the app has started, so the first reply doesn't wait for them either.
+PROVIDER_WARMUP = os.environ.get("PROVIDER_WARMUP", "true").lower() in ("1", "true", "yes")
@@ -1,6 +1,5 @@
 from fastapi import HTTPException, Request
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
 import logging
 
 # Configure logging
@@ -27,23 +26,84 @@ class SpeechGenerationError(HTTPException):
     def __init__(self, detail: str = "Error generating speech"):
         super().__init__(status_code=500, detail=detail)
 
+class UpstreamUnavailableError(HTTPException):
+    """Raised when an upstream provider can't take the request right now."""
+    def __init__(self, detail: str = "Upstream service unavailable", retry_after: int = 1):
+        super().__init__(status_code=503, detail=detail, headers={"Retry-After": str(retry_after)})
+
+class UpstreamTimeoutError(UpstreamUnavailableError):
+    """Raised when an upstream call can't complete within the request's time budget."""
+    def __init__(self, detail: str = "Upstream service timed out"):
+        HTTPException.__init__(self, status_code=504, detail=detail)
+
+class UpstreamRejectedError(HTTPException):
+    """Raised when a provider refuses our request outright, e.g. a bad API key or model."""
+    def __init__(self, detail: str = "Upstream service rejected the request"):
+        super().__init__(status_code=502, detail=detail)
+
+class AudioRejectedError(HTTPException):
+    """Raised when the transcription provider can't process the audio it was sent."""
+    def __init__(self, detail: str = "Audio could not be transcribed"):
+        super().__init__(status_code=422, detail=detail)
+
+class RateLimitedError(HTTPException):
+    """Raised when a client has used up its request allowance."""
+    def __init__(self, detail: str = "Too many requests", retry_after: int = 1):
+        super().__init__(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+class RequestCancelledError(HTTPException):
+    """Raised when the client disconnected or barged in, so the work was abandoned."""
+    def __init__(self, detail: str = "Client closed request"):
+        # 499 is nginx's "client closed request"; nobody receives it, but it
+        # tells cancelled requests apart in logs and metrics
+        super().__init__(status_code=499, detail=detail)
+
 # Error handling middleware
-class ErrorHandlingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+class ErrorHandlingMiddleware:
+    """
+    Turn unhandled exceptions into a generic 500 JSON response.
+
+    Implemented as plain ASGI rather than on BaseHTTPMiddleware so requests
+    don't pay for an extra task and memory stream each, streaming responses
+    and background tasks pass through untouched, and WebSocket/lifespan
+    scopes are forwarded as-is.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
         try:
-            return await call_next(request)
-        except HTTPException as exc:
+            await self.app(scope, receive, send_wrapper)
+        except HTTPException:
             # Re-raise HTTP exceptions as they are already handled by FastAPI
             raise
         except Exception as exc:
             # Log the exception
             logger.exception(f"Unhandled exception: {str(exc)}")
-            
+
+            if response_started:
+                # Part of the body is already on the wire; all we can do is
+                # let the server abort the connection.
+                raise
+
             # Return a generic error response
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=500,
                 content={"detail": "An unexpected error occurred. Please try again later."}
             )
+            await response(scope, receive, send)
 
 # Function to register all exception handlers with the app
 def setup_exception_handlers(app):
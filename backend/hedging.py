@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+import config
+from cancellation import CancelToken, cancel_scope, count_cancelled, current_token
+from errors import RequestCancelledError
+from limiter import get_limiter
+from metrics import HEDGE_CALLS, HEDGES
+from timing import first_byte_listener, submit_with_context
+
+T = TypeVar("T")
+
+# Attempts run on their own threads so the caller can watch for a slow first byte
+_executor = ThreadPoolExecutor(
+    max_workers=2 * sum(config.UPSTREAM_MAX_CONCURRENCY.values()) + 8,
+    thread_name_prefix="hedge",
+)
+
+
+class LatencyTracker:
+    """Recent time-to-first-byte samples for one provider."""
+    def __init__(self, window: int):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgeBudget:
+    """
+    Token bucket that keeps hedges to a fraction of calls: each call earns
+    `ratio` of a token, each hedge spends one, and at most `burst` are banked.
+    """
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class _Attempt:
+    """
+    One upstream attempt running on the hedge pool, under its own
+    cancellation token.
+
+    The token follows the request's, and cancelling it on its own stops just
+    this attempt: it leaves a limiter queue at once, sends nothing if it
+    hasn't yet, skips further retries, stops waiting for response headers
+    (giving back its concurrency slot) and has its connection dropped.
+    """
+    def __init__(self, func: Callable[[float], T], timeout: float, tracker: LatencyTracker):
+        self.first_byte = threading.Event()
+        parent = current_token()
+        if parent is not None:
+            self.token, self._detach = parent.child(abandon_in_flight=True)
+        else:
+            self.token, self._detach = CancelToken(abandon_in_flight=True), lambda: None
+        self._started = time.perf_counter()
+        self._tracker = tracker
+        self.future: Future = submit_with_context(_executor, self._run, func, timeout)
+
+    def _on_first_byte(self):
+        if not self.first_byte.is_set():
+            self._tracker.add(time.perf_counter() - self._started)
+            self.first_byte.set()
+
+    def _run(self, func, timeout):
+        try:
+            if self.token.cancelled:
+                count_cancelled("skipped")
+                raise RequestCancelledError()
+            with cancel_scope(self.token), first_byte_listener(self._on_first_byte):
+                return func(timeout)
+        finally:
+            self._detach()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.token.cancelled
+
+    def cancel(self):
+        """Stop this attempt; the other one won."""
+        self.token.cancel("hedge_lost", client=False)
+        self.future.cancel()
+
+
+trackers: Dict[str, LatencyTracker] = {}
+
+
+def _tracker(name: str) -> LatencyTracker:
+    tracker = trackers.get(name)
+    if tracker is None:
+        tracker = trackers.setdefault(name, LatencyTracker(config.HEDGE_WINDOW))
+    return tracker
+
+
+budget = HedgeBudget(config.HEDGE_BUDGET_RATIO, config.HEDGE_BUDGET_BURST)
+
+
+def hedge_delay(provider: str) -> Optional[float]:
+    """How long to wait for a first byte before hedging, or None while there is too little history."""
+    delay = _tracker(provider).percentile(config.HEDGE_PERCENTILE, config.HEDGE_MIN_SAMPLES)
+    if delay is None:
+        return None
+    return max(delay, config.HEDGE_MIN_DELAY_MS / 1000.0)
+
+
+def hedged(provider: str, attempt: Callable[[float], T], backup: Optional[Callable[[float], T]] = None,
+           limiter: Optional[str] = None) -> Callable[[float], T]:
+    """
+    Wrap an upstream attempt so a slow one is raced against a second request.
+
+    If the attempt has no first byte after the provider's HEDGE_PERCENTILE of
+    recent first-byte latency, and the hedge budget and a free concurrency
+    slot allow it, `backup` (or the same attempt again) is started too. The
+    first to succeed wins and the other is cancelled. Returns `attempt`
+    unchanged when hedging is disabled.
+
+    Args:
+        provider (str): Provider or LLM backend name, selecting latency history
+        attempt (Callable[[float], T]): One attempt given its timeout in seconds
+        backup (Optional[Callable[[float], T]]): Alternative attempt for the
+            hedge, e.g. a different backend
+        limiter (Optional[str]): Limiter checked for a free slot; defaults to `provider`
+
+    Returns:
+        Callable[[float], T]: The hedged attempt, with the same signature
+    """
+    if not config.HEDGING_ENABLED:
+        return attempt
+
+    def run(timeout: float) -> T:
+        HEDGE_CALLS.labels(provider).inc()
+        budget.earn()
+        started = time.perf_counter()
+        primary = _Attempt(attempt, timeout, _tracker(provider))
+
+        delay = hedge_delay(provider)
+        if delay is None or delay >= timeout or primary.first_byte.wait(delay) or primary.future.done():
+            return primary.future.result()
+        if not get_limiter(limiter or provider).has_idle_slot():
+            HEDGES.labels(provider, "no_capacity").inc()
+            return primary.future.result()
+        if not budget.spend():
+            HEDGES.labels(provider, "over_budget").inc()
+            return primary.future.result()
+
+        HEDGES.labels(provider, "fired").inc()
+        secondary = _Attempt(backup or attempt, timeout - (time.perf_counter() - started), _tracker(provider))
+        pending = {primary.future, secondary.future}
+        first_error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    winner, loser = (secondary, primary) if future is secondary.future else (primary, secondary)
+                    loser.cancel()
+                    if winner is secondary:
+                        HEDGES.labels(provider, "won").inc()
+                    return future.result()
+                first_error = first_error or error
+        raise first_error
+
+    return run
+
+
+def snapshot() -> Dict[str, Optional[float]]:
+    """Current hedge delay in milliseconds per provider."""
+    delays = {name: hedge_delay(name) for name in list(trackers)}
+    return {name: None if delay is None else round(delay * 1000.0, 1) for name, delay in delays.items()}
@@ -0,0 +1,309 @@
+import copy
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import config
+from errors import RateLimitedError, UpstreamUnavailableError
+from limiter import session_scope
+from metrics import JOB_ITEM_SECONDS, JOB_ITEMS, JOBS_ACTIVE
+
+logger = logging.getLogger(__name__)
+
+# Job and item states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+# A running job's file is rewritten at most this often; a restart redoes at
+# most this much finished work
+SAVE_INTERVAL_SECONDS = 1.0
+
+# Longest wait before retrying an item our own limits refused
+MAX_RETRY_DELAY_SECONDS = 30.0
+
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# Processes one item given the job ID, the job's parameters and the item.
+# Returns fields to record on the item; raising fails it.
+ItemHandler = Callable[[str, Dict[str, Any], Dict[str, Any]], Dict[str, Any]]
+
+# Frees what a handler keeps between attempts, given the job ID and the item.
+# Called once the item is done or has failed for good.
+ItemCleanup = Callable[[str, Dict[str, Any]], None]
+
+
+def _write_json(path: str, data: Any):
+    # Readers on other workers see the old file or the new one, never half of it
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # A killed worker nobody has reaped yet still answers signals
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (OSError, IndexError):
+        return True
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+class JobStore:
+    """
+    Batch jobs persisted as one JSON file each under `directory`, so any
+    worker can report progress and a restarted worker can finish what a
+    previous one started.
+
+    The worker running a job holds it through a lock file with its pid; a
+    lock whose process is gone is taken over on resume.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # Jobs this worker is running, with when each was last written
+        self._running: Dict[str, Dict[str, Any]] = {}
+        self._saved: Dict[str, float] = {}
+        self._changed = threading.Condition(self._lock)
+
+    def path(self, job_id: str, suffix: str = ".json") -> str:
+        return os.path.join(self.directory, job_id + suffix)
+
+    def create(self, kind: str, params: Dict[str, Any], items: List[Dict[str, Any]],
+               job_id: Optional[str] = None) -> Dict[str, Any]:
+        """Persist a new queued job. Each item gets its index and status."""
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        job = {
+            "id": job_id or new_job_id(),
+            "kind": kind,
+            "status": QUEUED,
+            "created": now,
+            "updated": now,
+            "params": params,
+            "items": [dict(item, index=index, status=QUEUED) for index, item in enumerate(items)],
+        }
+        _write_json(self.path(job["id"]), job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A snapshot of the job, or None if there is no such job."""
+        if not _JOB_ID.match(job_id):
+            return None
+        with self._lock:
+            job = self._running.get(job_id)
+            if job is not None:
+                return copy.deepcopy(job)
+        try:
+            with open(self.path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Persisted jobs with items left, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        jobs = [self.get(name[:-5]) for name in names if name.endswith(".json")]
+        return sorted((job for job in jobs if job is not None and job["status"] != DONE), key=lambda job: job["created"])
+
+    def claim(self, job: Dict[str, Any]) -> bool:
+        """Take the job for this worker. False if another live worker has it."""
+        path = self.path(job["id"], ".lock")
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(path) as f:
+                        pid = int(f.read() or 0)
+                except (OSError, ValueError):
+                    pid = 0
+                # A restarted container can hand us the dead worker's pid
+                if pid and pid != os.getpid() and _process_alive(pid):
+                    return False
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(str(os.getpid()))
+            with self._lock:
+                self._running[job["id"]] = job
+                self._saved[job["id"]] = time.monotonic()
+            return True
+        return False
+
+    def update_item(self, job_id: str, index: int, fields: Dict[str, Any]):
+        """Record fields on an item of a job this worker is running."""
+        with self._lock:
+            job = self._running[job_id]
+            item = job["items"][index]
+            item.update(fields)
+            if item["status"] in FINISHED:
+                # Wall clock rather than a counter, so items redone after a
+                # restart still sort after everything a reader has seen
+                item["finished_at"] = time.time()
+            job["updated"] = time.time()
+            statuses = {item["status"] for item in job["items"]}
+            if statuses <= set(FINISHED):
+                job["status"] = DONE
+            elif statuses != {QUEUED}:
+                job["status"] = RUNNING
+            now = time.monotonic()
+            if job["status"] == DONE or now - self._saved[job_id] >= SAVE_INTERVAL_SECONDS:
+                _write_json(self.path(job_id), job)
+                self._saved[job_id] = now
+            self._changed.notify_all()
+
+    def wait_for_change(self, timeout: float):
+        """Block until any running job changes, or `timeout` seconds pass."""
+        with self._lock:
+            self._changed.wait(timeout)
+
+    def release(self, job_id: str):
+        """Write the job out and give up this worker's claim on it."""
+        with self._lock:
+            job = self._running.pop(job_id, None)
+            self._saved.pop(job_id, None)
+            if job is not None:
+                _write_json(self.path(job_id), job)
+            self._changed.notify_all()
+        try:
+            os.remove(self.path(job_id, ".lock"))
+        except FileNotFoundError:
+            pass
+
+
+def summary(job: Dict[str, Any], items: bool = True) -> Dict[str, Any]:
+    """A job's progress as returned by the API."""
+    counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+    for item in job["items"]:
+        counts[item["status"]] += 1
+    result = {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "created": job["created"],
+        "updated": job["updated"],
+        "total": len(job["items"]),
+        "progress": round((counts[DONE] + counts[FAILED]) / max(1, len(job["items"])), 4),
+        **counts,
+    }
+    if items:
+        result["items"] = job["items"]
+    return result
+
+
+class JobRunner:
+    """
+    Runs the items of batch jobs on one bounded pool shared by all jobs.
+
+    Each job's upstream calls count as one session, so the upstream limiters
+    share capacity fairly between a job and interactive requests.
+    """
+    def __init__(self, store: JobStore, max_workers: int):
+        self.store = store
+        self._handlers: Dict[str, ItemHandler] = {}
+        self._cleanups: Dict[str, ItemCleanup] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="job")
+        self._remaining: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def register(self, kind: str, handler: ItemHandler, cleanup: Optional[ItemCleanup] = None):
+        self._handlers[kind] = handler
+        if cleanup is not None:
+            self._cleanups[kind] = cleanup
+
+    def start(self, job: Dict[str, Any]) -> bool:
+        """Claim a job and queue its unfinished items. False if it can't be run here."""
+        if job["kind"] not in self._handlers or not self.store.claim(job):
+            return False
+        pending = [item["index"] for item in job["items"] if item["status"] not in FINISHED]
+        if not pending:
+            self.store.release(job["id"])
+            return True
+        with self._lock:
+            self._remaining[job["id"]] = len(pending)
+        JOBS_ACTIVE.labels(job["kind"]).inc()
+        for index in pending:
+            self._executor.submit(self._run_item, job["id"], job["kind"], job["params"], dict(job["items"][index]))
+        return True
+
+    def resume(self) -> int:
+        """Start the persisted jobs no live worker is running. Returns how many were started."""
+        started = sum(self.start(job) for job in self.store.unfinished())
+        if started:
+            logger.info(f"Resumed {started} unfinished batch jobs")
+        return started
+
+    def shutdown(self):
+        """Drop queued items; they are picked up again on the next resume."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_item(self, job_id: str, kind: str, params: Dict[str, Any], item: Dict[str, Any]):
+        self.store.update_item(job_id, item["index"], {"status": RUNNING})
+        started = time.perf_counter()
+        attempts = max(1, config.JOBS_ITEM_ATTEMPTS)
+        for attempt in range(1, attempts + 1):
+            try:
+                with session_scope(f"job:{job_id}"):
+                    fields = dict(self._handlers[kind](job_id, params, item), status=DONE)
+                break
+            except (UpstreamUnavailableError, RateLimitedError) as e:
+                # Refused by our own limits or a provider that is down: not
+                # the item's fault, so wait as asked and try again
+                fields = {"status": FAILED, "error": e.detail}
+                if attempt < attempts:
+                    delay = float((e.headers or {}).get("Retry-After", attempt))
+                    time.sleep(min(MAX_RETRY_DELAY_SECONDS, delay))
+            except Exception as e:
+                logger.warning(f"{kind} job {job_id} item {item['index']} failed: {str(e)}")
+                fields = {"status": FAILED, "error": str(e) or type(e).__name__}
+                break
+        elapsed = time.perf_counter() - started
+        fields["seconds"] = round(elapsed, 3)
+        JOB_ITEMS.labels(kind, "cached" if fields.get("cached") else fields["status"]).inc()
+        JOB_ITEM_SECONDS.labels(kind).observe(elapsed)
+        self.store.update_item(job_id, item["index"], fields)
+        cleanup = self._cleanups.get(kind)
+        if cleanup is not None:
+            try:
+                cleanup(job_id, item)
+            except Exception as e:
+                logger.warning(f"{kind} job {job_id} item {item['index']} cleanup failed: {str(e)}")
+
+        with self._lock:
+            self._remaining[job_id] -= 1
+            finished = self._remaining[job_id] == 0
+            if finished:
+                del self._remaining[job_id]
+        if finished:
+            JOBS_ACTIVE.labels(kind).dec()
+            self.store.release(job_id)
+
+
+store = JobStore(config.JOBS_DIR)
+runner = JobRunner(store, config.JOBS_MAX_WORKERS)
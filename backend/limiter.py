@@ -0,0 +1,205 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional
+
+import cancellation
+import config
+from errors import RequestCancelledError, UpstreamUnavailableError
+from metrics import UPSTREAM_ACTIVE, UPSTREAM_QUEUE_DEPTH, UPSTREAM_QUEUE_SECONDS, UPSTREAM_QUEUE_TIMEOUTS
+from ratelimit import admission, admit, client_address
+from timing import PHASE_LIMIT, current_stage, record
+
+# Provider names, also used as metric labels
+OPENROUTER = "openrouter"
+WHISPER = "whisper"
+ELEVENLABS = "elevenlabs"
+
+# Session the current request belongs to; set by SessionMiddleware and carried
+# into worker threads with the rest of the context
+_session: contextvars.ContextVar[str] = contextvars.ContextVar("session", default="")
+
+SESSION_HEADER = b"x-session-id"
+
+
+def current_session() -> str:
+    return _session.get()
+
+
+@contextmanager
+def session_scope(session: str) -> Iterator[None]:
+    """Attribute upstream calls inside the block to `session`, e.g. a background job."""
+    token = _session.set(session)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+def client_key(scope) -> str:
+    """
+    The session a request belongs to: the X-Session-ID header, else the client
+    address, read through trusted proxies the same way as for rate limiting.
+    """
+    for name, value in scope.get("headers", []):
+        if name == SESSION_HEADER and value:
+            return "session:" + value.decode("latin-1")[:128]
+    return "ip:" + client_address(scope)
+
+
+class SessionMiddleware:
+    """ASGI middleware that tags the request context with its session key."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        token = _session.set(client_key(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _session.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class ProviderLimiter:
+    """
+    Caps concurrent calls to one upstream provider.
+
+    Callers over the limit queue per session, and freed slots go to sessions
+    in round-robin order, so a client with many requests in flight waits
+    behind its own requests rather than everyone else's. A caller that waits
+    longer than `queue_timeout` gets UpstreamUnavailableError.
+    """
+    def __init__(self, name: str, max_concurrency: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        # session -> waiters, in the order sessions get their next turn
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._active_gauge = UPSTREAM_ACTIVE.labels(name)
+        self._depth_gauge = UPSTREAM_QUEUE_DEPTH.labels(name)
+        self._wait_histogram = UPSTREAM_QUEUE_SECONDS.labels(name)
+        self._timeouts = UPSTREAM_QUEUE_TIMEOUTS.labels(name)
+
+    def acquire(self, session: Optional[str] = None, timeout: Optional[float] = None):
+        # Rate limits and load shedding apply once per request, before it
+        # takes a slot or joins a queue
+        admit()
+        session = current_session() if session is None else session
+        started = time.perf_counter()
+        with self._lock:
+            if self._active < self.max_concurrency and not self._queued:
+                self._active += 1
+                self._active_gauge.set(self._active)
+                waiter = None
+            else:
+                waiter = _Waiter()
+                self._queues.setdefault(session, deque()).append(waiter)
+                self._queued += 1
+                self._depth_gauge.set(self._queued)
+
+        queue_timeout = self.queue_timeout if timeout is None else min(self.queue_timeout, timeout)
+        if waiter is not None:
+            # A cancelled request stops waiting at once and gives up its place
+            token = cancellation.current_token()
+            unregister = token.on_cancel(waiter.event.set) if token is not None else None
+            waiter.event.wait(queue_timeout)
+            if unregister is not None:
+                unregister()
+            with self._lock:
+                # The slot may have been handed over just as the wait ended
+                if not waiter.granted:
+                    queue = self._queues.get(session)
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[session]
+                    self._queued -= 1
+                    self._depth_gauge.set(self._queued)
+                    if token is not None and token.cancelled:
+                        cancellation.count_cancelled("queued")
+                        raise RequestCancelledError()
+                    self._timeouts.inc()
+                    admission.observe(time.perf_counter() - started)
+                    raise UpstreamUnavailableError(
+                        f"{self.name} is at capacity; try again shortly",
+                        retry_after=max(1, int(queue_timeout)),
+                    )
+
+        waited = time.perf_counter() - started
+        self._wait_histogram.observe(waited)
+        admission.observe(waited)
+        stage = current_stage()
+        if stage is not None and waiter is not None:
+            record(stage, PHASE_LIMIT, waited)
+
+    def release(self):
+        with self._lock:
+            if self._queues:
+                # Hand the slot to the session whose turn it is, then move
+                # that session to the back of the line
+                session, queue = next(iter(self._queues.items()))
+                waiter = queue.popleft()
+                if queue:
+                    self._queues.move_to_end(session)
+                else:
+                    del self._queues[session]
+                self._queued -= 1
+                self._depth_gauge.set(self._queued)
+                waiter.granted = True
+                waiter.event.set()
+            else:
+                self._active -= 1
+                self._active_gauge.set(self._active)
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None) -> Iterator[None]:
+        """Hold one of the provider's concurrency slots for the duration of the block."""
+        self.acquire(timeout=timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def has_idle_slot(self) -> bool:
+        with self._lock:
+            return self._active < self.max_concurrency and not self._queued
+
+    def state(self) -> Dict[str, int]:
+        with self._lock:
+            return {"active": self._active, "queued": self._queued, "limit": self.max_concurrency,
+                    "sessions_waiting": len(self._queues)}
+
+
+limiters: Dict[str, ProviderLimiter] = {
+    name: ProviderLimiter(name, config.UPSTREAM_MAX_CONCURRENCY[name], config.UPSTREAM_QUEUE_TIMEOUT_SECONDS[name])
+    for name in (OPENROUTER, WHISPER, ELEVENLABS)
+}
+
+
+def get_limiter(name: str) -> ProviderLimiter:
+    """The limiter for a provider; providers not in config share the OpenRouter defaults."""
+    limiter = limiters.get(name)
+    if limiter is None:
+        limiter = limiters.setdefault(name, ProviderLimiter(
+            name, config.UPSTREAM_MAX_CONCURRENCY[OPENROUTER], config.UPSTREAM_QUEUE_TIMEOUT_SECONDS[OPENROUTER]))
+    return limiter
+
+
+def snapshot() -> Dict[str, Dict[str, int]]:
+    """Current slot usage and queue length per provider."""
+    return {name: limiter.state() for name, limiter in list(limiters.items())}
@@ -1,15 +1,24 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+# First, so the cold start profile covers every import after it
+import startup
+
+with startup.timed_import("fastapi"):
+    from fastapi import FastAPI, UploadFile, File, Form, HTTPException, WebSocket, WebSocketDisconnect
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse, Response, StreamingResponse
 import os
 import tempfile
 import io
 import json
+import asyncio
 import logging
 import sys
-import traceback
 from typing import Optional, List, Dict
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from models import TextRequest, TtsJobRequest
 
 # Configure logging first
 logging.basicConfig(
@@ -18,56 +27,91 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-try:
-    # Now attempt to import optional dependencies
+with startup.timed_import("dotenv"):
     from dotenv import load_dotenv
-    
-    # Load environment variables
-    load_dotenv()
-    logger.info("Environment variables loaded")
-    
-    # Import conditional dependencies with error handling
-    try:
-        from openai import OpenAI
-        logger.info("OpenAI imported successfully")
-    except ImportError as e:
-        logger.error(f"Error importing OpenAI: {str(e)}")
-        
-    try:
-        from elevenlabs import generate, save, set_api_key
-        logger.info("ElevenLabs imported successfully")
-    except ImportError as e:
-        logger.error(f"Error importing ElevenLabs: {str(e)}")
-    
-    # Import custom error handling
-    try:
-        from errors import setup_exception_handlers, APIKeyMissingError, AudioProcessingError, TextGenerationError, SpeechGenerationError
-        logger.info("Custom error handlers imported successfully")
-    except ImportError as e:
-        logger.error(f"Error importing custom error handlers: {str(e)}")
-    
-    # Import utility functions
-    try:
-        from utils import (
-            process_audio_file,
-            generate_ai_response,
-            generate_speech,
-            setup_logging,
-            validate_api_keys
-        )
-        logger.info("Utility functions imported successfully")
-    except ImportError as e:
-        logger.error(f"Error importing utility functions: {str(e)}")
 
-except Exception as e:
-    error_msg = f"Critical error during initialization: {str(e)}\n{traceback.format_exc()}"
-    logger.error(error_msg)
-    # Continue - we'll create a minimal app below
+# Load environment variables before anything that reads config is imported
+load_dotenv()
+logger.info("Environment variables loaded")
+
+# The app's own modules. A failed import here is a broken deployment, so it
+# stops startup rather than leaving routes silently missing.
+
+# Provider SDKs are imported on first use, or by the warm-up after startup
+with startup.timed_import("providers"):
+    import providers
+
+with startup.timed_import("errors"):
+    from errors import setup_exception_handlers, AudioProcessingError, TextGenerationError, SpeechGenerationError, RequestCancelledError
+
+with startup.timed_import("metrics"):
+    from metrics import REGISTRY, MetricsMiddleware
+
+# Stage timing instrumentation
+with startup.timed_import("timing"):
+    from timing import ServerTimingMiddleware, run_blocking, snapshot as timing_snapshot
+
+# Upstream concurrency limiting, rate limits and circuit breakers
+with startup.timed_import("limiter"):
+    from limiter import SessionMiddleware, snapshot as limiter_snapshot
+    from ratelimit import RateLimitMiddleware, admission_ticket, admit, rate_limit_key
+    from resilience import snapshot as breaker_snapshot, turn_budget
+    from hedging import snapshot as hedge_snapshot
+
+# Request cancellation
+with startup.timed_import("cancellation"):
+    from cancellation import CancelToken, DisconnectMiddleware, cancel_scope
+
+with startup.timed_import("utils"):
+    from utils import (
+        process_audio_file,
+        iter_long_audio_transcription,
+        transcribe_long_audio,
+        generate_ai_response,
+        generate_speech,
+        generate_speech_with_key,
+        speculate_after_turn,
+        llm_router,
+        setup_logging,
+        validate_api_keys
+    )
+
+# Audio preprocessing and upload checks
+with startup.timed_import("audio"):
+    from audio import normalize_audio, sniff_audio_format, wav_duration
+    from uploads import UploadGuardMiddleware
+    import config
+
+# Response serialization and compression
+with startup.timed_import("responses"):
+    from responses import FastJSONResponse, ndjson_line
+    from compression import CompressionMiddleware
+
+# Audio by content hash and batch jobs
+with startup.timed_import("media"):
+    from media import audio_response
+    from cache import tts_cache
+with startup.timed_import("jobs"):
+    import jobs
+    import tts_jobs
+    import stt_jobs
+logger.info("Modules imported")
 
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 logger.info("FastAPI app initialized")
 
+# Register custom exception handlers and the error handling middleware
+setup_exception_handlers(app)
+logger.info("Exception handlers configured")
+
+# Reject oversized or non-audio uploads before the form parser buffers them
+app.add_middleware(UploadGuardMiddleware, paths=["/api/speech-to-text"])
+# Batch uploads may be ZIP archives, so only their size is checked up front
+app.add_middleware(UploadGuardMiddleware, paths=["/api/stt-jobs"], max_bytes=config.STT_JOB_MAX_BYTES,
+                   audio_only=False)
+logger.info("Upload guard middleware configured")
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -75,23 +119,62 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Content-Location", "ETag", "Content-Range"],
 )
 logger.info("CORS middleware configured")
 
+# Abandon upstream work for requests whose client has disconnected
+app.add_middleware(DisconnectMiddleware)
+logger.info("Disconnect middleware configured")
+
+# Tag each request with its session so upstream slots are shared fairly
+app.add_middleware(SessionMiddleware)
+logger.info("Session middleware configured")
+
+# Per-client rate limits and load shedding, checked when a request first
+# needs an upstream call
+app.add_middleware(RateLimitMiddleware)
+logger.info("Rate limit middleware configured")
+
+# Brotli/gzip for text and JSON bodies, inside the metrics middleware so
+# route latency includes the compression time
+if config.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+    logger.info("Compression middleware configured")
+
+# Request rate, per-route latency and in-flight requests for /metrics
+app.add_middleware(MetricsMiddleware)
+logger.info("Metrics middleware configured")
+
+# Per-stage latency histograms and the Server-Timing response header, outermost so
+# every response carries it (including CORS preflights)
+app.add_middleware(ServerTimingMiddleware)
+logger.info("Server-Timing middleware configured")
+
+# Pick up batch jobs a previous worker left unfinished, and leave queued
+# items for the next one on shutdown
+@app.on_event("startup")
+async def resume_jobs():
+    await run_in_threadpool(jobs.runner.resume)
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    jobs.runner.shutdown()
+
+# Import the provider SDKs in the background once the app is up, so neither
+# the cold start nor the first reply waits for them
+if config.PROVIDER_WARMUP:
+    @app.on_event("startup")
+    async def warm_up_providers():
+        providers.warm_up()
+
 # Try to setup logging and validate keys, but don't fail if they're not available
 try:
     setup_logging()
     validate_api_keys()
-except NameError:
-    logger.warning("Could not setup logging or validate API keys - continuing with minimal app")
 except Exception as e:
     logger.error(f"Error in setup: {str(e)}")
 
-# Define request models
-class TextRequest(BaseModel):
-    message: str
-    conversation_history: List[Dict[str, str]] = []
-
 @app.get("/")
 async def read_root():
     env_info = {
@@ -125,61 +208,278 @@ async def debug_info():
         "installed_packages": installed_packages,
         "working_directory": os.getcwd(),
         "files_in_directory": os.listdir("."),
+        "stage_timings": timing_snapshot(),
+        "upstream_limiters": limiter_snapshot(),
+        "upstream_circuits": breaker_snapshot(),
+        "hedge_delay_ms": hedge_snapshot(),
+        "llm_backends": llm_router.snapshot(),
+        "cold_start": startup.snapshot(),
+        "provider_sdks": providers.snapshot(),
     }
 
-# Only add API endpoints if the necessary functions were imported successfully
-if all(func in globals() for func in ["process_audio_file", "generate_ai_response", "generate_speech"]):
-    @app.post("/api/speech-to-text")
-    async def speech_to_text(audio_file: UploadFile = File(...)):
-        try:
-            if not audio_file:
-                raise AudioProcessingError("No audio file provided")
-            
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for this worker, or for all workers in multiprocess mode"""
+    body = await run_in_threadpool(REGISTRY.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/api/speech-to-text")
+async def speech_to_text(audio_file: UploadFile = File(...), stream: bool = False):
+    try:
+        if not audio_file:
+            raise AudioProcessingError("No audio file provided")
+        
+        # Size, duration and format were already checked by UploadGuardMiddleware
+        audio_bytes = await audio_file.read()
+        audio_format = sniff_audio_format(audio_bytes[:16]) or "wav"
+
+        # Downmix/resample off the event loop; it is CPU bound on long clips
+        audio_bytes = await run_blocking("normalize", normalize_audio, audio_bytes)
+
+        # Long recordings are split at silences and transcribed in parallel
+        duration = wav_duration(audio_bytes)
+        if duration is not None and duration > config.STT_LONG_AUDIO_SECONDS:
+            if stream:
+                # Admit before the 200 goes out; a refusal mid-stream would cut it short
+                await run_in_threadpool(admit)
+                # Partial transcripts as NDJSON, one line per finished segment
+                events = iter_long_audio_transcription(audio_bytes)
+                return StreamingResponse(
+                    (ndjson_line(event) for event in events),
+                    media_type="application/x-ndjson"
+                )
+            text = await run_blocking("stt", transcribe_long_audio, audio_bytes)
+        else:
             # Process the audio file
-            text = process_audio_file(audio_file)
-            return JSONResponse({"response": text})
+            text = await run_blocking("stt", process_audio_file, io.BytesIO(audio_bytes), f"audio.{audio_format}")
+
+        if stream:
+            return StreamingResponse(
+                iter([ndjson_line({"response": text})]),
+                media_type="application/x-ndjson"
+            )
+        return FastJSONResponse({"response": text})
+    
+    except HTTPException:
+        # Ours, with the right status: 4xx for the request, 5xx for upstreams
+        raise
+    except Exception as e:
+        logger.error(f"Error in speech_to_text: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/generate-text")
+async def generate_text(request: TextRequest):
+    try:
+        if not request.message:
+            raise TextGenerationError("No message provided")
         
-        except Exception as e:
-            logger.error(f"Error in speech_to_text: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e))
+        response = await run_blocking("llm", generate_ai_response, request.message, request.conversation_history)
+        return FastJSONResponse({"response": response})
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in generate_text: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-    @app.post("/api/generate-text")
-    async def generate_text(request: TextRequest):
-        try:
-            if not request.message:
-                raise TextGenerationError("No message provided")
-            
-            response = generate_ai_response(request.message, request.conversation_history)
-            return JSONResponse({"response": response})
+@app.post("/api/text-to-speech")
+async def text_to_speech(text: str = Form(...), redirect: bool = False):
+    """
+    Speech for a reply. With ?redirect=true the audio is stored and the
+    response is a 303 to its /api/audio URL instead of the audio itself.
+    Otherwise the Content-Location header gives that URL only if the same
+    audio was stored before, e.g. by a batch job.
+    """
+    try:
+        if not text:
+            raise SpeechGenerationError("No text provided")
         
-        except Exception as e:
-            logger.error(f"Error in generate_text: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e))
+        cache_key, audio_data = await run_blocking("tts", generate_speech_with_key, text)
+        
+        # Prepare the likely next answers while this one plays
+        speculate_after_turn()
+        
+        # tts_cache is per worker and evicts, so only link audio stored on
+        # disk, which every worker can serve and which does not expire
+        location = f"/api/audio/{cache_key}"
+        if redirect:
+            await run_in_threadpool(tts_jobs.store_audio, cache_key, audio_data)
+            return Response(status_code=303, headers={"Location": location})
+        headers = {"Content-Disposition": 'attachment; filename="response.mp3"'}
+        if await run_in_threadpool(tts_jobs.is_stored, cache_key):
+            headers["Content-Location"] = location
+        return Response(audio_data, media_type="audio/mpeg", headers=headers)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in text_to_speech: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-    @app.post("/api/text-to-speech")
-    async def text_to_speech(text: str = Form(...)):
+async def run_voice_turn(websocket: WebSocket, request: TextRequest, token: "CancelToken"):
+    """Reply and speech for one WebSocket turn; sends nothing once the turn is cancelled."""
+    with cancel_scope(token), admission_ticket(rate_limit_key(websocket.scope)), turn_budget():
         try:
-            if not text:
-                raise SpeechGenerationError("No text provided")
-            
-            audio_data = generate_speech(text)
-            
-            # Create a temporary file to store the audio
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-                temp_file.write(audio_data)
-                temp_file_path = temp_file.name
-            
-            return FileResponse(
-                temp_file_path,
-                media_type="audio/mpeg",
-                filename="response.mp3"
-            )
-        
+            response = await run_blocking("llm", generate_ai_response, request.message, request.conversation_history)
+            if token.cancelled:
+                return
+            await websocket.send_json({"type": "reply", "response": response})
+            audio_data = await run_blocking("tts", generate_speech, response)
+            if token.cancelled:
+                return
+            await websocket.send_bytes(audio_data)
+            await websocket.send_json({"type": "done"})
+            speculate_after_turn()
+        except RequestCancelledError:
+            pass
+        except HTTPException as e:
+            if not token.cancelled:
+                await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
         except Exception as e:
-            logger.error(f"Error in text_to_speech: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e))
-else:
-    logger.warning("Not all required functions are available - API endpoints will be limited")
+            logger.error(f"Error in voice turn: {str(e)}")
+            if not token.cancelled:
+                await websocket.send_json({"type": "error", "status": 500, "detail": str(e)})
+
+@app.websocket("/ws/voice")
+async def voice_socket(websocket: WebSocket):
+    """
+    Voice turns over one connection, so the client can barge in.
+
+    Send {"type": "turn", "message": ..., "conversation_history": [...]}
+    to get {"type": "reply", "response": ...}, the speech as one binary
+    message, then {"type": "done"}. {"type": "barge_in"}, a new turn or
+    closing the socket abandons the turn in progress, including its
+    upstream calls; barge_in is answered with {"type": "cancelled"}.
+    """
+    await websocket.accept()
+    turn: Optional[asyncio.Task] = None
+    token: Optional[CancelToken] = None
+    try:
+        while True:
+            message = await websocket.receive_json()
+            kind = message.get("type")
+            if kind in ("turn", "barge_in") and turn is not None and not turn.done():
+                token.cancel("barge_in")
+                if kind == "barge_in":
+                    await websocket.send_json({"type": "cancelled"})
+            if kind == "turn":
+                try:
+                    request = TextRequest(**message)
+                except ValueError as e:
+                    await websocket.send_json({"type": "error", "status": 422, "detail": str(e)})
+                    continue
+                if not request.message:
+                    await websocket.send_json({"type": "error", "status": 400, "detail": "No message provided"})
+                    continue
+                token = CancelToken()
+                turn = asyncio.ensure_future(run_voice_turn(websocket, request, token))
+            elif kind != "barge_in":
+                await websocket.send_json({"type": "error", "status": 400, "detail": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        if turn is not None and not turn.done():
+            token.cancel("disconnect")
+
+@app.api_route("/api/audio/{content_hash}", methods=["GET", "HEAD"])
+async def get_audio(content_hash: str, request: Request):
+    """
+    Synthesized speech by its content hash, as linked from
+    /api/text-to-speech and returned by batch TTS jobs. Supports ETag
+    revalidation and byte ranges, so players can seek and resume.
+    """
+    audio = tts_cache.get(content_hash)
+    if audio is None:
+        audio = await run_in_threadpool(tts_jobs.stored_audio, content_hash)
+    if audio is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    return audio_response(request, audio)
+
+async def get_tts_job(job_id: str) -> Dict:
+    job = await run_in_threadpool(jobs.store.get, job_id)
+    if job is None or job["kind"] != tts_jobs.KIND:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/api/tts-jobs", status_code=202)
+async def create_tts_job(request: TtsJobRequest):
+    """
+    Queue texts to be rendered to speech in the background.
+
+    Returns the job's progress, as GET /api/tts-jobs/{job_id} does. When
+    it is done, download everything from /api/tts-jobs/{job_id}/archive
+    or single items from /api/tts-jobs/{job_id}/audio/{content_hash}.
+    """
+    try:
+        job = await run_in_threadpool(tts_jobs.create_job, request.texts, request.voice_id, request.output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(jobs.summary(job), status_code=202)
+
+@app.get("/api/tts-jobs/{job_id}")
+async def tts_job_status(job_id: str, items: bool = True):
+    return FastJSONResponse(jobs.summary(await get_tts_job(job_id), items))
+
+@app.get("/api/tts-jobs/{job_id}/archive")
+async def tts_job_archive(job_id: str):
+    job = await get_tts_job(job_id)
+    path = await run_in_threadpool(tts_jobs.build_archive, job)
+    return FileResponse(
+        path,
+        media_type="application/zip",
+        filename=f"tts-{job_id}.zip",
+        background=BackgroundTask(os.remove, path)
+    )
+
+@app.get("/api/tts-jobs/{job_id}/audio/{content_hash}")
+async def tts_job_audio(job_id: str, content_hash: str, request: Request):
+    job = await get_tts_job(job_id)
+    audio = await run_in_threadpool(tts_jobs.job_audio, job, content_hash)
+    if audio is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    return audio_response(request, audio)
+
+async def get_stt_job(job_id: str) -> Dict:
+    job = await run_in_threadpool(jobs.store.get, job_id)
+    if job is None or job["kind"] != stt_jobs.KIND:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/api/stt-jobs", status_code=202)
+async def create_stt_job(files: List[UploadFile] = File(...)):
+    """
+    Queue audio files, or ZIP archives of them, for transcription in the background.
+
+    Returns the job's progress, as GET /api/stt-jobs/{job_id} does.
+    GET /api/stt-jobs/{job_id}/results streams each file's transcript and
+    timings as NDJSON as soon as it is done.
+    """
+    uploads = [(upload.filename or f"file{index}", upload.file) for index, upload in enumerate(files)]
+    try:
+        job = await run_in_threadpool(stt_jobs.create_job, uploads)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(jobs.summary(job), status_code=202)
+
+@app.get("/api/stt-jobs/{job_id}")
+async def stt_job_status(job_id: str, items: bool = True):
+    job = await get_stt_job(job_id)
+    return FastJSONResponse(dict(jobs.summary(job, items), **stt_jobs.job_stats(job)))
+
+@app.get("/api/stt-jobs/{job_id}/results")
+async def stt_job_results(job_id: str, after: float = 0.0):
+    """
+    One NDJSON line per transcribed file as it finishes, then a summary line
+    with the job's totals. Pass the last "finished_at" seen as `after` to
+    resume an interrupted stream.
+    """
+    await get_stt_job(job_id)
+    return StreamingResponse(
+        (ndjson_line(result) for result in stt_jobs.iter_results(job_id, after)),
+        media_type="application/x-ndjson"
+    )
+
+ready = startup.mark_ready()
+logger.info(f"App ready {ready * 1000:.0f} ms after startup; slowest imports: "
+            + ", ".join(f"{entry['module']} {entry['ms']:.0f} ms" for entry in startup.slowest()))
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,87 @@
+import hashlib
+import re
+from typing import Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Audio under a content hash never changes meaning, so browsers and CDNs may
+# keep it for a year without asking again
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def audio_etag(audio: bytes) -> str:
+    """
+    Strong ETag over the audio bytes themselves.
+
+    Not the cache key: speech synthesized again after eviction can differ
+    byte for byte, and a client resuming a download must notice.
+    """
+    return '"' + hashlib.blake2b(audio, digest_size=16).hexdigest() + '"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    The byte span asked for by a single-range Range header.
+
+    Args:
+        header (str): The Range header, e.g. "bytes=0-1023" or "bytes=-500"
+        size (int): Length of the whole body
+
+    Returns:
+        Optional[Tuple[int, int]]: Inclusive first and last byte; None if the
+            header is malformed or asks for several ranges, which is answered
+            with the whole body
+
+    Raises:
+        ValueError: The range lies entirely outside the body
+    """
+    match = _BYTE_RANGE.match(header.strip())
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = size - 1 if last == "" else min(int(last), size - 1)
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def audio_response(request: Request, audio: bytes, media_type: str = "audio/mpeg",
+                   cache_control: str = IMMUTABLE_CACHE_CONTROL) -> Response:
+    """
+    Serve audio with a strong ETag, conditional GET and single byte ranges.
+
+    If-None-Match answers 304, Range answers 206 (or 416 when out of bounds)
+    unless an If-Range validator no longer matches, in which case the whole
+    body is sent.
+    """
+    etag = audio_etag(audio)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            span = parse_range(range_header, len(audio))
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{len(audio)}"
+            return Response(status_code=416, headers=headers)
+        if span is not None:
+            start, end = span
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(audio)}"
+            return Response(audio[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
+    return Response(audio, media_type=media_type, headers=headers)
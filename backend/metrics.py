@@ -0,0 +1,437 @@
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, roughly 1.5x apart from 1 ms to 60 s
+LATENCY_BUCKETS = (
+    0.001, 0.002, 0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75,
+    1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 30.0, 60.0,
+)
+
+# Multiprocess mode: every worker periodically writes its values to this
+# directory and /metrics on any worker reports the sum over all of them.
+# Empty the directory when the server (re)starts.
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+MULTIPROC_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(value: str) -> str:
+    # HELP text escapes backslashes and line feeds but not quotes
+    return value.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def get(self) -> float:
+        return self.value
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def state(self) -> Tuple[List[int], int, float]:
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile (0 < q <= 1)."""
+        counts, total, _ = self.state()
+        return _bucket_percentile(self.buckets, counts, total, q)
+
+
+def _bucket_percentile(buckets, counts, total, q) -> Optional[float]:
+    if total == 0:
+        return None
+    rank = q * total
+    running = 0
+    for index, bucket_count in enumerate(counts):
+        running += bucket_count
+        if running >= rank:
+            return float(buckets[index]) if index < len(buckets) else float("inf")
+    return float("inf")
+
+
+class _Metric:
+    """A metric family: one child per combination of label values."""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(str(kwargs[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            # Only creating a child takes the family lock
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def children(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+
+class Registry:
+    """
+    Holds every metric and renders them in the Prometheus text format.
+
+    Updates only take the lock of the child being updated, so recording from
+    the event loop and from worker threads never contends on a global lock.
+    """
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._flusher_pid: Optional[int] = None
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    # Local state <-> JSON, used for multiprocess files
+
+    def dump(self) -> dict:
+        data = {}
+        for metric in self._metrics.values():
+            samples = []
+            for values, child in metric.children():
+                if metric.kind == "histogram":
+                    counts, count, total = child.state()
+                    samples.append([list(values), {"counts": counts, "count": count, "sum": total}])
+                else:
+                    samples.append([list(values), child.get()])
+            data[metric.name] = samples
+        return data
+
+    def _merged_state(self) -> Dict[str, Dict[Tuple[str, ...], object]]:
+        """Sum the dumps of every worker. Gauges of workers that are gone are dropped."""
+        merged: Dict[str, Dict[Tuple[str, ...], object]] = {name: {} for name in self._metrics}
+        for filename in os.listdir(MULTIPROC_DIR):
+            if not (filename.startswith("metrics-") and filename.endswith(".json")):
+                continue
+            pid = int(filename[len("metrics-"):-len(".json")])
+            try:
+                with open(os.path.join(MULTIPROC_DIR, filename)) as handle:
+                    dump = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            alive = _pid_alive(pid)
+            for name, samples in dump.items():
+                metric = self._metrics.get(name)
+                if metric is None or (metric.kind == "gauge" and not alive):
+                    continue
+                target = merged[name]
+                for values, value in samples:
+                    key = tuple(values)
+                    if metric.kind == "histogram":
+                        existing = target.get(key)
+                        if existing is None:
+                            target[key] = {"counts": list(value["counts"]), "count": value["count"], "sum": value["sum"]}
+                        else:
+                            existing["counts"] = [a + b for a, b in zip(existing["counts"], value["counts"])]
+                            existing["count"] += value["count"]
+                            existing["sum"] += value["sum"]
+                    else:
+                        target[key] = target.get(key, 0.0) + value
+        return merged
+
+    def _local_state(self) -> Dict[str, Dict[Tuple[str, ...], object]]:
+        state = {}
+        for metric in self._metrics.values():
+            children = {}
+            for values, child in metric.children():
+                if metric.kind == "histogram":
+                    counts, count, total = child.state()
+                    children[values] = {"counts": counts, "count": count, "sum": total}
+                else:
+                    children[values] = child.get()
+            state[metric.name] = children
+        return state
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format (0.0.4)."""
+        if MULTIPROC_DIR:
+            self.flush()
+            state = self._merged_state()
+        else:
+            state = self._local_state()
+
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for values, value in sorted(state.get(name, {}).items()):
+                if metric.kind == "histogram":
+                    running = 0
+                    for bound, bucket_count in zip(metric.buckets + (float("inf"),), value["counts"]):
+                        running += bucket_count
+                        labels = _format_labels(metric.labelnames, values, ("le", _format_value(bound)))
+                        lines.append(f"{name}_bucket{labels} {running}")
+                    labels = _format_labels(metric.labelnames, values)
+                    lines.append(f"{name}_sum{labels} {_format_value(value['sum'])}")
+                    lines.append(f"{name}_count{labels} {value['count']}")
+                else:
+                    lines.append(f"{name}{_format_labels(metric.labelnames, values)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    # Multiprocess support
+
+    def flush(self):
+        """Write this worker's values to the multiprocess directory."""
+        if not MULTIPROC_DIR:
+            return
+        path = os.path.join(MULTIPROC_DIR, f"metrics-{os.getpid()}.json")
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, "w") as handle:
+                json.dump(self.dump(), handle)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics file {path}: {str(e)}")
+
+    def ensure_flusher(self):
+        """Start the background flush thread for this process (idempotent, fork-safe)."""
+        if not MULTIPROC_DIR or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def loop():
+            while True:
+                time.sleep(MULTIPROC_FLUSH_SECONDS)
+                self.flush()
+
+        threading.Thread(target=loop, name="metrics-flush", daemon=True).start()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+REGISTRY = Registry()
+
+# HTTP server
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests handled", ["route", "method", "status"])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency until the response completes", ["route"])
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being handled", ["route"])
+COMPRESSED_RESPONSES = REGISTRY.counter("http_compressed_responses_total", "Responses sent compressed", ["encoding"])
+COMPRESSION_SAVED_BYTES = REGISTRY.counter("http_compression_saved_bytes_total", "Response bytes saved by compression", ["encoding"])
+
+# Pipeline stages (see timing.py)
+STAGE_SECONDS = REGISTRY.histogram("stage_duration_seconds", "Pipeline stage latency by phase", ["stage", "phase"])
+
+# Upstream APIs
+UPSTREAM_REQUESTS = REGISTRY.counter("upstream_requests_total", "Requests made to upstream APIs", ["upstream", "outcome"])
+UPSTREAM_SECONDS = REGISTRY.histogram("upstream_request_duration_seconds", "Upstream latency until response headers", ["upstream"])
+UPSTREAM_ACTIVE = REGISTRY.gauge("upstream_active_calls", "Upstream calls holding a concurrency slot", ["provider"])
+UPSTREAM_QUEUE_DEPTH = REGISTRY.gauge("upstream_queue_depth", "Upstream calls waiting for a concurrency slot", ["provider"])
+UPSTREAM_QUEUE_SECONDS = REGISTRY.histogram("upstream_queue_wait_seconds", "Time spent waiting for an upstream concurrency slot", ["provider"])
+UPSTREAM_QUEUE_TIMEOUTS = REGISTRY.counter("upstream_queue_timeouts_total", "Upstream calls that gave up waiting for a slot", ["provider"])
+UPSTREAM_RETRIES = REGISTRY.counter("upstream_retries_total", "Upstream calls retried after a transient failure", ["provider"])
+BREAKER_STATE = REGISTRY.gauge("upstream_circuit_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open", ["provider"])
+BREAKER_REJECTIONS = REGISTRY.counter("upstream_circuit_rejections_total", "Calls refused because the circuit was open", ["provider"])
+HEDGE_CALLS = REGISTRY.counter("upstream_hedgeable_calls_total", "Upstream calls eligible for hedging", ["provider"])
+HEDGES = REGISTRY.counter("upstream_hedges_total", "Hedge decisions: fired, won (hedge answered first), over_budget, no_capacity", ["provider", "outcome"])
+
+# Rate limiting and admission control
+RATE_LIMITED = REGISTRY.counter("rate_limited_requests_total", "Requests refused by rate limiting or load shedding", ["reason"])
+ADMISSION_OVERLOADED = REGISTRY.gauge("admission_overloaded", "1 while new requests are being shed")
+ADMISSION_QUEUE_DELAY = REGISTRY.gauge("admission_queue_delay_seconds", "Shortest queueing delay in the last admission interval")
+
+# Caches
+CACHE_REQUESTS = REGISTRY.counter("cache_requests_total", "Cache lookups by result", ["cache", "result"])
+CACHE_BYTES = REGISTRY.gauge("cache_bytes", "Bytes currently held by a cache", ["cache"])
+SPECULATION = REGISTRY.counter("speculation_total", "Speculative answers: generated, hit, miss (next turn not prepared), expired, busy, over_budget, wasted", ["outcome"])
+TTS_CHUNKS = REGISTRY.counter("tts_chunks_total", "Sentence chunks of long replies: cached, synthesized", ["outcome"])
+
+# LLM routing
+LLM_ROUTED = REGISTRY.counter("llm_routed_requests_total", "LLM requests by backend and result: ok, failover (served after another failed), failed", ["backend", "result"])
+LLM_BACKEND_TTFT = REGISTRY.gauge("llm_backend_ttft_seconds", "Moving average of time to first token per backend", ["backend"])
+LLM_BACKEND_ERROR_RATE = REGISTRY.gauge("llm_backend_error_rate", "Moving average of the error rate per backend", ["backend"])
+LLM_TURNS = REGISTRY.counter("llm_turns_total", "Turns by class: greeting, canned, persona, open", ["turn_class"])
+LLM_TURN_SECONDS = REGISTRY.histogram("llm_turn_reply_seconds", "Reply generation latency by turn class", ["turn_class"])
+LLM_TURN_TOKENS = REGISTRY.counter("llm_turn_completion_tokens_total", "Completion tokens by turn class", ["turn_class"])
+
+# Cancellation
+CLIENT_CANCELLATIONS = REGISTRY.counter("client_cancellations_total", "Requests and voice turns abandoned by the client: disconnect, barge_in", ["reason"])
+CANCELLED_UPSTREAM = REGISTRY.counter("cancelled_upstream_calls_total", "Upstream calls saved by cancellation: skipped (never sent), queued (left the queue), aborted (cut off mid-response)", ["stage", "phase"])
+
+# Batch jobs
+JOB_ITEMS = REGISTRY.counter("job_items_total", "Batch job items finished: done, cached (no upstream call), failed", ["kind", "outcome"])
+JOB_ITEM_SECONDS = REGISTRY.histogram("job_item_duration_seconds", "Batch job item processing time", ["kind"])
+JOBS_ACTIVE = REGISTRY.gauge("jobs_active", "Batch jobs with items left on this worker", ["kind"])
+
+# Usage
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "LLM tokens used", ["kind"])
+AUDIO_BYTES = REGISTRY.counter("audio_bytes_total", "Audio bytes processed", ["stage"])
+UPLOAD_REJECTIONS = REGISTRY.counter("upload_rejections_total", "Uploads rejected before buffering", ["reason"])
+
+
+def _route_label(scope) -> str:
+    app = scope.get("app")
+    router = getattr(app, "router", None)
+    if router is None:
+        return "unmatched"
+    from starlette.routing import Match
+
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts, latency and in-flight requests per route."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        REGISTRY.ensure_flusher()
+        route = _route_label(scope)
+        in_flight = HTTP_IN_FLIGHT.labels(route)
+        in_flight.inc()
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_SECONDS.labels(route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(route, scope["method"], status).inc()
@@ -0,0 +1,15 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+# Define request models
+class TextRequest(BaseModel):
+    message: str
+    conversation_history: List[Dict[str, str]] = []
+
+
+class TtsJobRequest(BaseModel):
+    texts: List[str]
+    voice_id: Optional[str] = None
+    output_format: Optional[str] = None
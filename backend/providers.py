@@ -0,0 +1,62 @@
+import importlib
+import logging
+import threading
+from types import ModuleType
+from typing import Any, Dict, Optional
+
+import startup
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """
+    A provider SDK imported on first use instead of at startup.
+
+    SDKs like openai pull in hundreds of modules, which a serverless cold
+    start would otherwise pay for even on a health check. `load` is safe to
+    call from several threads; the import happens once.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    with startup.timed_import(self.name, lazy=True):
+                        self._module = importlib.import_module(self.name)
+        return self._module
+
+
+openai_sdk = LazyModule("openai")
+
+PROVIDERS: Dict[str, LazyModule] = {sdk.name: sdk for sdk in (openai_sdk,)}
+
+
+def _warm_up():
+    for sdk in PROVIDERS.values():
+        try:
+            sdk.load()
+        except ImportError as e:
+            logger.error(f"Error importing {sdk.name}: {str(e)}")
+
+
+def warm_up() -> threading.Thread:
+    """
+    Import the provider SDKs on a background thread, so the first request
+    needing one doesn't wait for the import.
+    """
+    thread = threading.Thread(target=_warm_up, name="provider-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def snapshot() -> Dict[str, Any]:
+    return {name: {"loaded": sdk.loaded} for name, sdk in PROVIDERS.items()}
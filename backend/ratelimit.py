@@ -0,0 +1,278 @@
+import contextvars
+import hashlib
+import ipaddress
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import config
+from errors import RateLimitedError, UpstreamUnavailableError
+from metrics import ADMISSION_OVERLOADED, ADMISSION_QUEUE_DELAY, RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+# Drop idle buckets once there are this many, so one-off clients don't pile up
+BUCKET_PRUNE_THRESHOLD = 10000
+
+
+class LocalBuckets:
+    """Token buckets per client key, held in this process."""
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> float:
+        """Take one token; return 0 if one was available, else seconds until there is one."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1.0:
+                tokens -= 1.0
+            else:
+                wait = (1.0 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > BUCKET_PRUNE_THRESHOLD:
+                self._prune(now)
+        return wait
+
+    def _prune(self, now: float):
+        full_after = self.burst / self.rate
+        for key in [k for k, (_, updated) in self._buckets.items() if now - updated > full_after]:
+            del self._buckets[key]
+
+
+# Atomic token bucket in a Redis hash, using the server clock so every worker agrees
+_REDIS_TAKE = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """
+    Token buckets shared by every worker through Redis. If Redis is
+    unreachable requests are let through rather than failed.
+    """
+    def __init__(self, url: str, rate: float, burst: float, prefix: str = "voicebot:ratelimit:"):
+        import redis
+
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        self._take = self._client.register_script(_REDIS_TAKE)
+
+    def take(self, key: str) -> float:
+        try:
+            return float(self._take(keys=[self.prefix + key], args=[self.rate, self.burst]))
+        except Exception as e:
+            logger.warning(f"Rate limit backend unavailable, allowing request: {str(e)}")
+            return 0.0
+
+
+class AdmissionController:
+    """
+    Sheds new work while this worker is persistently backed up.
+
+    Every wait for a worker thread or an upstream slot is observed. If even
+    the shortest wait in an interval exceeded the target, there is a standing
+    queue rather than a burst, and new requests are refused until an interval
+    passes with a wait under the target.
+    """
+    def __init__(self, target_delay: float, interval: float):
+        self.target_delay = target_delay
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_min = math.inf
+        self._overloaded = False
+
+    def observe(self, delay: float):
+        if self.target_delay <= 0:
+            return
+        with self._lock:
+            self._roll(time.monotonic())
+            self._window_min = min(self._window_min, delay)
+
+    def _roll(self, now: float):
+        if now - self._window_start < self.interval:
+            return
+        if self._window_min != math.inf:
+            self._overloaded = self._window_min > self.target_delay
+            ADMISSION_QUEUE_DELAY.set(self._window_min)
+        else:
+            # Nothing waited at all
+            self._overloaded = False
+            ADMISSION_QUEUE_DELAY.set(0.0)
+        ADMISSION_OVERLOADED.set(1 if self._overloaded else 0)
+        self._window_start = now
+        self._window_min = math.inf
+
+    def overloaded(self) -> bool:
+        if self.target_delay <= 0:
+            return False
+        with self._lock:
+            self._roll(time.monotonic())
+            return self._overloaded
+
+
+def _make_buckets():
+    if config.RATE_LIMIT_PER_MINUTE <= 0:
+        return None
+    rate = config.RATE_LIMIT_PER_MINUTE / 60.0
+    if config.RATE_LIMIT_REDIS_URL:
+        try:
+            buckets = RedisBuckets(config.RATE_LIMIT_REDIS_URL, rate, config.RATE_LIMIT_BURST)
+            logger.info("Rate limits shared through Redis")
+            return buckets
+        except ImportError:
+            logger.error("RATE_LIMIT_REDIS_URL is set but the redis package is not installed; using per-process rate limits")
+    return LocalBuckets(rate, config.RATE_LIMIT_BURST)
+
+
+buckets = _make_buckets()
+admission = AdmissionController(config.ADMISSION_TARGET_DELAY_MS / 1000.0, config.ADMISSION_INTERVAL_SECONDS)
+
+
+class _Ticket:
+    """Admission state shared by every thread working on one request."""
+    __slots__ = ("key", "admitted", "lock")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.admitted = False
+        self.lock = threading.Lock()
+
+
+_ticket: contextvars.ContextVar[Optional[_Ticket]] = contextvars.ContextVar("admission_ticket", default=None)
+
+
+@contextmanager
+def admission_ticket(key: str) -> Iterator[None]:
+    """Treat the upstream calls made inside the block as one rate-limited request for `key`."""
+    token = _ticket.set(_Ticket(key))
+    try:
+        yield
+    finally:
+        _ticket.reset(token)
+
+
+def admit():
+    """
+    Admit the current request the first time it needs an upstream call.
+
+    Requests that never reach an upstream (health checks, metrics, cache hits)
+    never get here and so are never limited. Raises UpstreamUnavailableError
+    while the worker is overloaded and RateLimitedError when the client is out
+    of tokens.
+    """
+    ticket = _ticket.get()
+    if ticket is None:
+        return
+    with ticket.lock:
+        if ticket.admitted:
+            return
+        if admission.overloaded():
+            RATE_LIMITED.labels("overload").inc()
+            raise UpstreamUnavailableError("Server is busy; try again shortly",
+                                           retry_after=max(1, math.ceil(admission.interval)))
+        if buckets is not None:
+            wait = buckets.take(ticket.key)
+            if wait > 0:
+                RATE_LIMITED.labels("client").inc()
+                raise RateLimitedError(retry_after=max(1, math.ceil(wait)))
+        ticket.admitted = True
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name and value:
+            return value.decode("latin-1")
+    return None
+
+
+def _trusted_proxy(address: str, any_peer: bool = False) -> bool:
+    # "*" vouches for the peer we are talking to, never for addresses it forwards
+    if any_peer and "*" in config.RATE_LIMIT_TRUSTED_PROXIES:
+        return True
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    for network in config.RATE_LIMIT_TRUSTED_PROXIES:
+        try:
+            if ip in ipaddress.ip_network(network, strict=False):
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def client_address(scope) -> str:
+    """
+    The client's address. Behind a trusted proxy this is the last address in
+    X-Forwarded-For that isn't a trusted proxy itself, so clients can't pick
+    their own bucket by sending the header. With "*" only the peer is
+    trusted, so that is the entry the peer appended.
+    """
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if not config.RATE_LIMIT_TRUSTED_PROXIES or not _trusted_proxy(address, any_peer=True):
+        return address
+    hops: List[str] = []
+    for key, value in scope.get("headers", []):
+        if key == b"x-forwarded-for":
+            hops.extend(hop.strip() for hop in value.decode("latin-1").split(","))
+    hops = [hop for hop in hops if hop]
+    for hop in reversed(hops):
+        if not _trusted_proxy(hop):
+            return hop
+    # Every hop is a listed proxy, so the request started inside their network
+    return hops[0] if hops else address
+
+
+def rate_limit_key(scope) -> str:
+    """The client a request is charged to, per RATE_LIMIT_KEY, falling back to its address."""
+    if config.RATE_LIMIT_KEY == "api_key":
+        credential = _header(scope, b"x-api-key") or _header(scope, b"authorization")
+        if credential:
+            return "key:" + hashlib.sha256(credential.encode("utf-8")).hexdigest()[:32]
+    elif config.RATE_LIMIT_KEY == "session":
+        session = _header(scope, b"x-session-id")
+        if session:
+            return "session:" + session[:128]
+    return "ip:" + client_address(scope)
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware that opens an admission ticket per HTTP request. The
+    check itself runs lazily in admit(), so fast paths cost one contextvar set.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with admission_ticket(rate_limit_key(scope)):
+            await self.app(scope, receive, send)
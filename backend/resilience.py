@@ -0,0 +1,228 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, ContextManager, Dict, Iterator, Optional, TypeVar
+
+import httpx
+
+import cancellation
+import config
+from errors import RateLimitedError, RequestCancelledError, UpstreamTimeoutError, UpstreamUnavailableError
+from metrics import BREAKER_REJECTIONS, BREAKER_STATE, UPSTREAM_RETRIES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Upstream statuses worth another attempt; anything else is the request's fault
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+# Absolute time.monotonic() by which the current request's upstream work must finish
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """Limit the upstream work inside the block to `seconds`, or less if an outer deadline is sooner."""
+    limit = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(limit if outer is None else min(outer, limit))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def turn_budget() -> ContextManager[None]:
+    """Deadline for a whole voice turn: transcription, reply and speech."""
+    return deadline(config.TURN_BUDGET_SECONDS)
+
+
+def stage_deadline(stage: str) -> ContextManager[None]:
+    """Deadline for one pipeline stage: its share of the turn budget."""
+    return deadline(config.TURN_BUDGET_SECONDS * config.STAGE_BUDGET_SHARES[stage])
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current deadline, or None if there is none."""
+    limit = _deadline.get()
+    return None if limit is None else limit - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Fails calls to a provider fast after repeated failures.
+
+    Closed: calls go through and consecutive failures are counted. After
+    `failure_threshold` of them the breaker opens and calls are refused for
+    `reset_timeout` seconds. Then it lets one probe call through (half-open):
+    success closes it, failure opens it again.
+    """
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._state_gauge = BREAKER_STATE.labels(name)
+        self._rejections = BREAKER_REJECTIONS.labels(name)
+        self._state_gauge.set(self.CLOSED)
+
+    def before_call(self):
+        """Raise UpstreamUnavailableError if the call should not be attempted."""
+        with self._lock:
+            if self._state == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    self._rejections.inc()
+                    raise UpstreamUnavailableError(f"{self.name} is unavailable; try again shortly",
+                                                   retry_after=max(1, int(remaining + 0.5)))
+                self._set_state(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN:
+                if self._probing:
+                    self._rejections.inc()
+                    raise UpstreamUnavailableError(f"{self.name} is recovering; try again shortly")
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+                self._set_state(self.CLOSED)
+
+    def release(self):
+        """End a call without judging the provider, e.g. when our own limits refused it."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def _set_state(self, state: int):
+        self._state = state
+        self._state_gauge.set(state)
+
+    @property
+    def state(self) -> str:
+        return {self.CLOSED: "closed", self.HALF_OPEN: "half_open", self.OPEN: "open"}[self._state]
+
+
+breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """The circuit breaker for a provider or LLM backend, created on first use."""
+    breaker = breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = breakers.get(name)
+            if breaker is None:
+                breaker = breakers[name] = CircuitBreaker(name, config.BREAKER_FAILURE_THRESHOLD, config.BREAKER_RESET_SECONDS)
+    return breaker
+
+
+def upstream_timeout(seconds: float) -> httpx.Timeout:
+    """httpx timeout for one upstream attempt with `seconds` left in its budget."""
+    return httpx.Timeout(seconds, connect=min(10.0, seconds))
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    # httpx.HTTPStatusError carries the response; the OpenAI SDK's errors the status
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Whether a failed upstream call may succeed if sent again."""
+    if isinstance(exc, httpx.TransportError) or isinstance(exc.__cause__, httpx.TransportError):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUSES
+
+
+def backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (1-based)."""
+    ceiling = min(config.RETRY_MAX_DELAY_SECONDS, config.RETRY_BASE_DELAY_SECONDS * (2 ** (attempt - 1)))
+    return random.uniform(0.0, ceiling)
+
+
+def call_upstream(provider: str, attempt: Callable[[float], T]) -> T:
+    """
+    Call an idempotent upstream operation with deadline, retries and circuit breaker.
+
+    Args:
+        provider (str): Provider name, selecting the circuit breaker
+        attempt (Callable[[float], T]): Makes one attempt given its timeout in
+            seconds; raises on failure
+
+    Returns:
+        T: The first successful attempt's result
+
+    Raises:
+        UpstreamUnavailableError: The provider's circuit is open, or it still
+            failed when the retries ran out
+        UpstreamTimeoutError: The deadline passed before a call succeeded
+        RequestCancelledError: The client went away; no further attempts were made
+    """
+    breaker = get_breaker(provider)
+    attempts = max(1, config.RETRY_MAX_ATTEMPTS)
+    for number in range(1, attempts + 1):
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise UpstreamTimeoutError(f"{provider} did not respond within the time budget")
+        cancellation.check_cancelled()
+        breaker.before_call()
+        try:
+            result = attempt(config.UPSTREAM_TIMEOUT_SECONDS if remaining is None else remaining)
+        except (UpstreamUnavailableError, RateLimitedError, RequestCancelledError):
+            # Our own limits refused the call, or the client went away; it
+            # says nothing about the provider
+            breaker.release()
+            raise
+        except Exception as exc:
+            if cancellation.cancelled():
+                # SDKs wrap the transport's RequestCancelledError in their own errors
+                breaker.release()
+                raise RequestCancelledError() from exc
+            if not is_retryable(exc):
+                # The provider answered; the request itself was bad
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            delay = backoff(number)
+            remaining = remaining_time()
+            if number == attempts or (remaining is not None and remaining <= delay):
+                if isinstance(exc, httpx.TimeoutException) or isinstance(exc.__cause__, httpx.TimeoutException):
+                    raise UpstreamTimeoutError(f"{provider} did not respond within the time budget") from exc
+                raise UpstreamUnavailableError(f"{provider} is unavailable; try again shortly") from exc
+            UPSTREAM_RETRIES.labels(provider).inc()
+            logger.warning(f"{provider} call failed ({str(exc)}); retry {number} in {delay:.2f}s")
+            cancellation.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+def snapshot() -> Dict[str, str]:
+    """Circuit state per provider."""
+    return {name: breaker.state for name, breaker in list(breakers.items())}
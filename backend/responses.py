@@ -0,0 +1,38 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize to compact UTF-8 JSON, with orjson when it is installed.
+
+    Both paths produce the same document for the plain dicts, lists, strings
+    and numbers the API returns; orjson writes NaN as null where json.dumps
+    would raise.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            # Types orjson doesn't know (e.g. subclasses of str with custom
+            # state) fall through to the standard encoder
+            pass
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def ndjson_line(content: Any) -> bytes:
+    """One NDJSON record for a streaming response."""
+    return dumps(content) + b"\n"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with `dumps`; the app's default response class."""
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
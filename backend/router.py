@@ -0,0 +1,199 @@
+import logging
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+import config
+from errors import RateLimitedError, RequestCancelledError, UpstreamUnavailableError
+from hedging import hedged
+from limiter import get_limiter
+from metrics import LLM_BACKEND_ERROR_RATE, LLM_BACKEND_TTFT, LLM_ROUTED
+from providers import openai_sdk
+from resilience import call_upstream, get_breaker, is_retryable, upstream_timeout
+from timing import first_byte_listener
+
+logger = logging.getLogger(__name__)
+
+
+class BackendStats:
+    """Exponentially weighted time to first token and error rate for one backend."""
+    def __init__(self, name: str, alpha: float):
+        self.alpha = alpha
+        self.ttft: Optional[float] = None
+        self.error_rate = 0.0
+        self._lock = threading.Lock()
+        self._ttft_gauge = LLM_BACKEND_TTFT.labels(name)
+        self._error_gauge = LLM_BACKEND_ERROR_RATE.labels(name)
+
+    def observe(self, ttft: Optional[float], failed: bool):
+        with self._lock:
+            if ttft is not None:
+                self.ttft = ttft if self.ttft is None else self.ttft + self.alpha * (ttft - self.ttft)
+                self._ttft_gauge.set(self.ttft)
+            self.error_rate += self.alpha * ((1.0 if failed else 0.0) - self.error_rate)
+            self._error_gauge.set(self.error_rate)
+
+
+class Backend:
+    """One OpenAI-compatible chat completion endpoint and model."""
+    def __init__(self, name: str, model: str, base_url: str, api_key: str, http_client: httpx.Client,
+                 provider: str = "openrouter", family: str = "", cost_per_mtok: float = 0.0, tier: str = "standard"):
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.provider = provider
+        self.family = family
+        self.cost_per_mtok = cost_per_mtok
+        self.tier = tier
+        self.stats = BackendStats(name, config.LLM_EWMA_ALPHA)
+        self._http_client = http_client
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """
+        The SDK client, built on first use so the SDK isn't imported on a cold
+        start. Reused afterwards; retries are ours (call_upstream), so the
+        SDK's own are disabled.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = openai_sdk.load().OpenAI(api_key=self.api_key or "unset", base_url=self.base_url,
+                                                            http_client=self._http_client, max_retries=0)
+        return self._client
+
+    def healthy(self) -> bool:
+        return get_breaker(self.name).state != "open" and self.stats.error_rate < config.LLM_MAX_ERROR_RATE
+
+    def attempt(self, messages: List[Dict[str, str]], **params):
+        """One chat completion attempt, for call_upstream/hedged; records time to first token."""
+        def run(timeout: float):
+            started = time.perf_counter()
+            first_byte: List[float] = []
+
+            def on_first_byte():
+                if not first_byte:
+                    first_byte.append(time.perf_counter() - started)
+
+            with first_byte_listener(on_first_byte):
+                with get_limiter(self.provider).slot(timeout):
+                    response = self.client.chat.completions.create(
+                        model=self.model, messages=messages, timeout=upstream_timeout(timeout), **params
+                    )
+            self.stats.observe(first_byte[0] if first_byte else time.perf_counter() - started, failed=False)
+            return response
+        return run
+
+
+class Policy:
+    """Constraints on which backends a request may use. Empty fields don't constrain."""
+    def __init__(self, max_cost_per_mtok: float = 0.0, family: str = "", tier: str = ""):
+        self.max_cost_per_mtok = max_cost_per_mtok
+        self.family = family
+        self.tier = tier
+
+    def allows(self, backend: Backend) -> bool:
+        if self.max_cost_per_mtok and backend.cost_per_mtok > self.max_cost_per_mtok:
+            return False
+        if self.family and backend.family != self.family:
+            return False
+        if self.tier and backend.tier != self.tier:
+            return False
+        return True
+
+
+DEFAULT_POLICY = Policy(config.LLM_MAX_COST_PER_MTOK, config.LLM_MODEL_FAMILY)
+
+
+class Router:
+    """
+    Sends each chat completion to the fastest healthy backend the policy
+    allows, failing over to the next one when a backend errors out.
+
+    Backends with no latency history rank first so every one gets measured,
+    and a small share of requests (LLM_ROUTER_EXPLORE) picks at random so
+    the averages of slower backends stay current.
+    """
+    def __init__(self, backends: List[Backend]):
+        self.backends = backends
+
+    def rank(self, policy: Policy) -> List[Backend]:
+        allowed = [b for b in self.backends if b.api_key and policy.allows(b)]
+        if not allowed and policy.tier:
+            # A tier nobody configured falls back to the rest of the policy
+            allowed = [b for b in self.backends if b.api_key and Policy(policy.max_cost_per_mtok, policy.family).allows(b)]
+        healthy = [b for b in allowed if b.healthy()]
+        ranked = sorted(healthy, key=lambda b: -1.0 if b.stats.ttft is None else b.stats.ttft)
+        # Unhealthy backends are the last resort rather than no resort
+        ranked += [b for b in allowed if b not in healthy]
+        if len(ranked) > 1 and random.random() < config.LLM_ROUTER_EXPLORE:
+            # Exploring also gives a backend with a poor error rate the
+            # chance to win it back, as long as its circuit is not open
+            candidates = [b for b in ranked[1:] if get_breaker(b.name).state != "open"]
+            if candidates:
+                choice = random.choice(candidates)
+                ranked.remove(choice)
+                ranked.insert(0, choice)
+        return ranked
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Routing state per backend."""
+        return {
+            b.name: {
+                "model": b.model,
+                "ttft_ms": None if b.stats.ttft is None else round(b.stats.ttft * 1000.0, 1),
+                "error_rate": round(b.stats.error_rate, 3),
+                "healthy": b.healthy(),
+            }
+            for b in self.backends
+        }
+
+    def complete(self, messages: List[Dict[str, str]], policy: Optional[Policy] = None, **params):
+        """
+        Create a chat completion on the best available backend.
+
+        Args:
+            messages (List[Dict[str, str]]): Chat messages
+            policy (Optional[Policy]): Backend constraints; DEFAULT_POLICY if omitted
+            **params: Extra completion parameters, e.g. max_tokens
+
+        Returns:
+            The OpenAI SDK completion object
+        """
+        ranked = self.rank(policy or DEFAULT_POLICY)
+        if not ranked:
+            raise ValueError("No LLM backend is configured with an API key for this policy")
+
+        last_error: Optional[Exception] = None
+        for index, backend in enumerate(ranked):
+            # Hedges go to the next backend in line, if there is one
+            backup = ranked[index + 1].attempt(messages, **params) if index + 1 < len(ranked) else None
+            try:
+                response = call_upstream(
+                    backend.name,
+                    hedged(backend.name, backend.attempt(messages, **params), backup, limiter=backend.provider),
+                )
+            except (RateLimitedError, RequestCancelledError):
+                raise
+            except Exception as e:
+                if not (isinstance(e, UpstreamUnavailableError) or is_retryable(e)):
+                    raise
+                backend.stats.observe(None, failed=True)
+                LLM_ROUTED.labels(backend.name, "failed").inc()
+                logger.warning(f"LLM backend {backend.name} failed ({str(e)}), trying the next one")
+                last_error = e
+                continue
+            LLM_ROUTED.labels(backend.name, "ok" if index == 0 else "failover").inc()
+            return response
+        raise last_error
+
+
+def build_router(http_client: httpx.Client) -> Router:
+    """The router for the backends in config.LLM_BACKENDS."""
+    return Router([Backend(http_client=http_client, **spec) for spec in config.LLM_BACKENDS])
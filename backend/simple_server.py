@@ -7,6 +7,8 @@ import io
 import requests
 from elevenlabs import generate, set_api_key
 
+import config
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,7 +23,7 @@ os.environ["ELEVENLABS_API_KEY"] = "sk_cce18174bb752b10a10abbe0a3cad218905a389cd
 # Initialize OpenAI client with OpenRouter base URL
 client = OpenAI(
     api_key=os.environ.get("OPENROUTER_API_KEY"),
-    base_url="https://openrouter.ai/api/v1",
+    base_url=config.OPENROUTER_BASE_URL,
 )
 
 # Initialize ElevenLabs
@@ -117,7 +119,7 @@ def generate_ai_response(message, conversation_history=None):
         
         # Call OpenRouter API
         response = client.chat.completions.create(
-            model="openai/gpt-3.5-turbo",  # OpenAI GPT-3.5 Turbo model
+            model=config.LLM_MODEL,
             messages=messages,
             max_tokens=500,
             temperature=0.7
@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import config
+from metrics import SPECULATION
+
+logger = logging.getLogger(__name__)
+
+# The order interviews usually take through the canned question types
+INTERVIEW_SCRIPT = ["life_story", "superpower", "growth_areas", "misconception", "pushing_boundaries"]
+
+# How each question type is usually asked, for generating a reply ahead of time
+SCRIPT_QUESTIONS = {
+    "life_story": "Tell me about yourself.",
+    "superpower": "What's your number one superpower?",
+    "growth_areas": "What are the top three areas you'd like to grow in?",
+    "misconception": "What misconception do your coworkers have about you?",
+    "pushing_boundaries": "How do you push your boundaries and limits?",
+}
+
+
+def predict_next(asked: List[str], count: int) -> List[str]:
+    """
+    The question types most likely to come next: those not asked yet, in
+    script order starting after the most recent one.
+
+    Args:
+        asked (List[str]): Question types asked so far, oldest first
+        count (int): How many to return
+
+    Returns:
+        List[str]: Up to `count` question types, most likely first
+    """
+    start = INTERVIEW_SCRIPT.index(asked[-1]) + 1 if asked and asked[-1] in INTERVIEW_SCRIPT else 0
+    ordered = INTERVIEW_SCRIPT[start:] + INTERVIEW_SCRIPT[:start]
+    return [question_type for question_type in ordered if question_type not in asked][:count]
+
+
+class _SessionState:
+    __slots__ = ("asked", "history", "spent_chars", "replies", "pending", "scheduled")
+
+    def __init__(self):
+        self.asked: List[str] = []
+        self.history: List[Dict[str, str]] = []
+        self.spent_chars = 0
+        # Question type -> reply text generated ahead of time, and when
+        self.replies: Dict[str, Tuple[str, float]] = {}
+        # Speech cache keys synthesized ahead of time and not used yet
+        self.pending: Set[str] = set()
+        self.scheduled = False
+
+
+class SpeculationStore:
+    """
+    What each session has been asked and what was prepared for it ahead of
+    time. Sessions are kept in LRU order up to `max_sessions`.
+    """
+    def __init__(self, max_sessions: int):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, session: str) -> _SessionState:
+        # Callers hold the lock
+        state = self._sessions.get(session)
+        if state is None:
+            state = self._sessions[session] = _SessionState()
+            while len(self._sessions) > self.max_sessions:
+                _, evicted = self._sessions.popitem(last=False)
+                SPECULATION.labels("wasted").inc(len(evicted.pending))
+        self._sessions.move_to_end(session)
+        return state
+
+    def observe_turn(self, session: str, question_type: Optional[str], history: List[Dict[str, str]]) -> Optional[str]:
+        """
+        Note a new turn. Returns the reply prepared for its question type,
+        if any was prepared within SPECULATION_TTL_SECONDS.
+        """
+        with self._lock:
+            state = self._state(session)
+            state.history = list(history)
+            if question_type is None:
+                return None
+            if question_type not in state.asked:
+                state.asked.append(question_type)
+            prepared = state.replies.pop(question_type, None)
+        if prepared is None:
+            return None
+        reply, prepared_at = prepared
+        if time.monotonic() - prepared_at > config.SPECULATION_TTL_SECONDS:
+            SPECULATION.labels("expired").inc()
+            return None
+        return reply
+
+    def note_speech(self, session: str, cache_key: str, cached: bool):
+        """Count a speculation hit or miss for a turn's speech, if anything was prepared for the session."""
+        with self._lock:
+            state = self._sessions.get(session)
+            if state is None or not state.pending:
+                return
+            if cache_key in state.pending:
+                state.pending.discard(cache_key)
+                if cached:
+                    SPECULATION.labels("hit").inc()
+                    return
+            SPECULATION.labels("miss").inc()
+
+    def plan(self, session: str, count: int) -> List[str]:
+        """The question types to prepare replies for next; expired replies are prepared again."""
+        with self._lock:
+            state = self._state(session)
+            oldest = time.monotonic() - config.SPECULATION_TTL_SECONDS
+            return [t for t in predict_next(state.asked, count) if t not in state.replies or state.replies[t][1] < oldest]
+
+    def history(self, session: str) -> List[Dict[str, str]]:
+        with self._lock:
+            return list(self._state(session).history)
+
+    def charge(self, session: str, chars: int) -> bool:
+        """Spend `chars` of the session's budget; False, spending nothing, if it would run over."""
+        with self._lock:
+            state = self._state(session)
+            if state.spent_chars + chars > config.SPECULATION_SESSION_CHAR_BUDGET:
+                return False
+            state.spent_chars += chars
+            return True
+
+    def refund(self, session: str, chars: int):
+        with self._lock:
+            state = self._state(session)
+            state.spent_chars = max(0, state.spent_chars - chars)
+
+    def prepared(self, session: str, question_type: str, reply: str, cache_key: str):
+        with self._lock:
+            state = self._state(session)
+            state.replies[question_type] = (reply, time.monotonic())
+            state.pending.add(cache_key)
+
+    def try_schedule(self, session: str) -> bool:
+        with self._lock:
+            state = self._state(session)
+            if state.scheduled:
+                return False
+            state.scheduled = True
+            return True
+
+    def finished(self, session: str):
+        with self._lock:
+            state = self._sessions.get(session)
+            if state is not None:
+                state.scheduled = False
+
+
+store = SpeculationStore(config.SPECULATION_MAX_SESSIONS)
+
+# One speculative job at a time: it only uses capacity nobody else wants
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculate")
+
+
+def schedule(session: str, job: Callable[[str], None]):
+    """
+    Run `job(session)` in the background unless speculation is off or a job
+    for the session is already queued or running.
+    """
+    if not config.SPECULATION_ENABLED or not store.try_schedule(session):
+        return
+
+    def run():
+        try:
+            job(session)
+        except Exception as e:
+            logger.warning(f"Speculation for {session} failed: {str(e)}")
+        finally:
+            store.finished(session)
+
+    _executor.submit(run)
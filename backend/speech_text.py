@@ -0,0 +1,243 @@
+import re
+from typing import List, Match
+
+from timing import timed
+
+# Characters ElevenLabs would read out or stumble over, mapped to what a
+# speaker would say or to plain ASCII punctuation.
+PUNCTUATION_MAP = str.maketrans({
+    "‘": "'", "’": "'", "‚": "'", "‛": "'",
+    "“": '"', "”": '"', "„": '"', "‟": '"',
+    "–": ", ", "—": ", ", "―": ", ",
+    "…": "...",
+    " ": " ", " ": " ", " ": " ", "​": "",
+    "•": " ", "●": " ", "▪": " ", "‣": " ",
+    "\\": " ",
+})
+
+_CODE_FENCE = re.compile(r"^\s*```[^\n]*$", re.MULTILINE)
+_IMAGE = re.compile(r"!\[([^\]]*)\]\([^)]*\)")
+_LINK = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+# Only real HTML: a known element with its closing tag, a void element, or a
+# stray closing tag. "a<b and c>d" is a comparison, not a <b> tag.
+_HTML_ELEMENTS = (r"(?:a|abbr|b|blockquote|code|del|div|em|h[1-6]|i|ins|kbd|li|mark|ol|p|pre|q|s|small|span"
+                  r"|strong|sub|sup|table|tbody|td|th|thead|tr|u|ul)")
+_HTML_PAIR = re.compile(r"<(" + _HTML_ELEMENTS + r")(?:\s[^<>]*)?>(.*?)</\1\s*>", re.IGNORECASE | re.DOTALL)
+_HTML_VOID = re.compile(r"<(?:br|hr|img|wbr)\b[^<>]*>", re.IGNORECASE)
+_HTML_CLOSE = re.compile(r"</" + _HTML_ELEMENTS + r"\s*>", re.IGNORECASE)
+_AUTOLINK = re.compile(r"<((?:https?://|www\.|mailto:)[^<>\s]+)>", re.IGNORECASE)
+_HEADING = re.compile(r"^[ \t]{0,3}#{1,6}[ \t]+", re.MULTILINE)
+_BLOCKQUOTE = re.compile(r"^[ \t]{0,3}>[ \t]?", re.MULTILINE)
+_RULE = re.compile(r"^[ \t]*([-*_])([ \t]*\1){2,}[ \t]*$", re.MULTILINE)
+_TABLE_DIVIDER = re.compile(r"^[ \t]*\|?[ \t]*:?-{3,}:?[ \t]*(\|[ \t]*:?-{3,}:?[ \t]*)*\|?[ \t]*$", re.MULTILINE)
+_LIST_MARKER = re.compile(r"^[ \t]*(?:[-*+]|\d{1,3}[.)])[ \t]+", re.MULTILINE)
+_EMPHASIS = re.compile(r"(?<![\w*])(\*{1,3})(?=\S)(.+?)(?<=\S)\1(?![\w*])|(?<!\w)(_{1,3})(?=\S)(.+?)(?<=\S)\3(?!\w)")
+_INLINE_CODE = re.compile(r"`+([^`]*)`+")
+
+_URL = re.compile(r"\b(?:https?://|www\.)[^\s<>()\"']+", re.IGNORECASE)
+_EMAIL = re.compile(r"\b([\w.+-]+)@([\w-]+(?:\.[\w-]+)+)\b")
+# Only shapes that are clearly phone numbers, so years in a list or ISBNs
+# aren't read digit by digit
+_PHONE = re.compile(
+    r"(?<![\w.+-])(?:"
+    r"\+\d{1,3}(?:[ .-]?\(?\d{1,4}\)?){2,5}"  # +44 20 7946 0958, +1 (555) 123-4567
+    r"|\(\d{3}\)[ .-]?\d{3}[ .-]\d{4}"  # (555) 123-4567
+    r"|\d{3}([ .-])\d{3}\1\d{4}"  # 555-123-4567, 555.123.4567
+    r")(?!\w|[.-]\d)"
+)
+_PERCENT = re.compile(r"(\d)\s?%")
+_CURRENCY = re.compile(r"([$£€])\s?(\d[\d,]*(?:\.\d+)?)(?:\s?(k|m|bn|million|billion|thousand)\b)?", re.IGNORECASE)
+_RANGE = re.compile(r"(?<![\d-])(\d+(?:\.\d+)?)\s?-\s?(\d+(?:\.\d+)?)(?![\d-])")
+_THOUSANDS = re.compile(r"\b(\d{1,3}(?:,\d{3})+)\b")
+_PLUS = re.compile(r"(\d)\+(?!\d)")
+_SPACED_DASH = re.compile(r"[ \t]+-[ \t]+")
+# "2^10", "x^2", "(a+b)^2" or "2 ^ 10"; not "^C"
+_POWER = re.compile(r"(?<=[\w)])\^(?=-?\w)|(?<=\d) \^ (?=-?\d)")
+_APPROXIMATELY = re.compile(r"~\s?(?=[\d$£€])")
+
+# Emoji and pictographs say nothing when spoken
+_EMOJI = re.compile(
+    "[\U0001F000-\U0001FAFF\U00002600-\U000027BF\U0001F900-\U0001F9FF\U0000FE0F\U0000200D\U00002B00-\U00002BFF]"
+)
+
+_REPEATED_MARKS = re.compile(r"([!?])[!?]+|\.{4,}|,(?:\s*,)+")
+_COMMA_AFTER_MARK = re.compile(r"([.!?:;])\s*,")
+_SPACE_BEFORE_MARK = re.compile(r"\s+([,.;:!?])")
+_MISSING_SPACE = re.compile(r"([,;:!?])(?=[A-Za-z])")
+_WHITESPACE = re.compile(r"[ \t\r\f\v]+")
+_SENTENCE_END = ".!?:;,"
+
+CURRENCY_NAMES = {"$": "dollars", "£": "pounds", "€": "euros"}
+MAGNITUDES = {"k": "thousand", "m": "million", "bn": "billion"}
+
+
+def _unemphasize(match: Match) -> str:
+    return match.group(2) if match.group(2) is not None else match.group(4)
+
+
+def _speak_url(match: Match) -> str:
+    # Read the site, not the path: "https://www.example.com/a?b=c" -> "example.com"
+    url = match.group(0).rstrip(".,;:!?")
+    trailing = match.group(0)[len(url):]
+    host = re.sub(r"^(?:https?://)?(?:www\.)?", "", url, flags=re.IGNORECASE).split("/", 1)[0].split("?", 1)[0]
+    return host.lower() + trailing
+
+
+def _speak_phone(match: Match) -> str:
+    # Digit by digit, pausing between the groups as written
+    groups = re.findall(r"\d+", match.group(0))
+    if sum(len(group) for group in groups) < 7:
+        return match.group(0)
+    spoken = ", ".join(" ".join(group) for group in groups)
+    return ("plus " if match.group(0).startswith("+") else "") + spoken
+
+
+def _speak_currency(match: Match) -> str:
+    symbol, amount, magnitude = match.groups()
+    words = [amount]
+    if magnitude:
+        words.append(MAGNITUDES.get(magnitude.lower(), magnitude.lower()))
+    words.append(CURRENCY_NAMES[symbol])
+    return " ".join(words)
+
+
+def _end_lines(text: str) -> str:
+    # List items, headings and paragraphs become sentences, so the voice
+    # pauses between them instead of running them together
+    lines = [line.strip(" ,") for line in text.split("\n")]
+    sentences = []
+    for line in lines:
+        if not line:
+            continue
+        if line[-1] not in _SENTENCE_END and not line.endswith('"'):
+            line += "."
+        sentences.append(line)
+    return " ".join(sentences)
+
+
+@timed("tts_normalize")
+def normalize_for_speech(text: str) -> str:
+    """
+    Rewrite an LLM reply as the plain text a speaker would say.
+
+    Strips markdown (emphasis, headings, lists, links, code, tables, HTML),
+    reads URLs as their site and emails with "at", spells out phone numbers
+    digit by digit, says percentages, currencies and ranges in words,
+    canonicalizes punctuation and collapses whitespace. The result is
+    deterministic, so equivalent replies share one TTS cache entry.
+
+    Args:
+        text (str): The reply as generated
+
+    Returns:
+        str: Text to synthesize; the stripped input if nothing speakable is left
+    """
+    # Addresses first, before any of their characters are read as words
+    spoken = _AUTOLINK.sub(r"\1", text)
+    spoken = _URL.sub(_speak_url, spoken)
+    spoken = _EMAIL.sub(r"\1 at \2", spoken)
+
+    spoken = spoken.translate(PUNCTUATION_MAP)
+    spoken = _EMOJI.sub("", spoken)
+
+    # Markdown structure
+    spoken = _CODE_FENCE.sub("", spoken)
+    spoken = _IMAGE.sub(r"\1", spoken)
+    spoken = _LINK.sub(r"\1", spoken)
+    # Until nothing changes, for elements nested in elements
+    count = 1
+    while count:
+        spoken, count = _HTML_PAIR.subn(r"\2", spoken)
+    spoken = _HTML_VOID.sub(" ", spoken)
+    spoken = _HTML_CLOSE.sub("", spoken)
+    spoken = _TABLE_DIVIDER.sub("", spoken)
+    spoken = _RULE.sub("", spoken)
+    spoken = _HEADING.sub("", spoken)
+    spoken = _BLOCKQUOTE.sub("", spoken)
+    spoken = _LIST_MARKER.sub("", spoken)
+    spoken = _INLINE_CODE.sub(r"\1", spoken)
+    # Twice, for emphasis nested in emphasis
+    spoken = _EMPHASIS.sub(_unemphasize, spoken)
+    spoken = _EMPHASIS.sub(_unemphasize, spoken)
+    # Headings and paired emphasis are gone; a "#" or "*" left is part of the
+    # text, as in "C#" or "a*b"
+    spoken = spoken.replace("|", ", ")
+
+    # Things that are written one way and said another
+    spoken = spoken.replace("&", " and ")
+    spoken = _POWER.sub(" to the power of ", spoken)
+    spoken = _APPROXIMATELY.sub("about ", spoken)
+    spoken = _CURRENCY.sub(_speak_currency, spoken)
+    spoken = _PERCENT.sub(r"\1 percent", spoken)
+    spoken = _PHONE.sub(_speak_phone, spoken)
+    spoken = _RANGE.sub(r"\1 to \2", spoken)
+    spoken = _THOUSANDS.sub(lambda m: m.group(1).replace(",", ""), spoken)
+    spoken = _PLUS.sub(r"\1 plus", spoken)
+    spoken = _SPACED_DASH.sub(", ", spoken)
+
+    # Sentences, punctuation and whitespace
+    spoken = _WHITESPACE.sub(" ", spoken)
+    spoken = _end_lines(spoken)
+    spoken = _REPEATED_MARKS.sub(lambda m: m.group(1) or ("..." if m.group(0)[0] == "." else ","), spoken)
+    spoken = _SPACE_BEFORE_MARK.sub(r"\1", spoken)
+    spoken = _COMMA_AFTER_MARK.sub(r"\1", spoken)
+    spoken = _MISSING_SPACE.sub(r"\1 ", spoken)
+    spoken = _WHITESPACE.sub(" ", spoken).strip()
+    return spoken or text.strip()
+
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+(?=\S)")
+_CLAUSE_BREAK = re.compile(r"(?<=[,;:])\s+")
+
+# Sentences shorter than this are read together with the next one, so a chunk
+# never holds just "Yes." and the voice keeps its intonation across them
+MIN_CHUNK_CHARS = 40
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    # At clauses if possible, else at words
+    pieces: List[str] = []
+    for words in (_CLAUSE_BREAK.split(sentence), sentence.split(" ")):
+        pieces = []
+        for word in words:
+            if pieces and len(pieces[-1]) + 1 + len(word) <= max_chars:
+                pieces[-1] += " " + word
+            else:
+                pieces.append(word)
+        if all(len(piece) <= max_chars for piece in pieces):
+            break
+    return pieces
+
+
+def split_for_speech(text: str, max_chars: int) -> List[str]:
+    """
+    Split text for synthesis in chunks at sentence boundaries.
+
+    Each chunk is one sentence, so the same sentence in another reply gets the
+    same chunk and cache entry. Short sentences are joined with the next one;
+    sentences over `max_chars` are split at clauses, or words if need be.
+
+    Args:
+        text (str): Normalized reply text
+        max_chars (int): Longest chunk wanted
+
+    Returns:
+        List[str]: Chunks in reading order
+    """
+    chunks: List[str] = []
+    pending = ""
+    for sentence in _SENTENCE_BREAK.split(text.strip()):
+        sentence = f"{pending} {sentence}" if pending else sentence
+        pending = ""
+        if len(sentence) < MIN_CHUNK_CHARS:
+            pending = sentence
+        elif len(sentence) > max_chars:
+            chunks.extend(_split_long(sentence, max_chars))
+        else:
+            chunks.append(sentence)
+    if pending:
+        if chunks and len(chunks[-1]) + 1 + len(pending) <= max_chars:
+            chunks[-1] += " " + pending
+        else:
+            chunks.append(pending)
+    return chunks
@@ -0,0 +1,55 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Imported first by main.py, so this is as close to the start of a cold
+# start as the app can see
+_started = time.perf_counter()
+_ready: Optional[float] = None
+_imports: List[Dict[str, Any]] = []
+_lock = threading.Lock()
+
+
+@contextmanager
+def timed_import(name: str, lazy: bool = False) -> Iterator[None]:
+    """
+    Record how long the imports in the block take, under `name`.
+
+    Imports inside the block that were already loaded by an earlier one
+    cost nothing here, so each module is charged to the first block that
+    needs it. `lazy` marks imports made after startup, on first use.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _imports.append({
+                "module": name,
+                "ms": round(elapsed * 1000, 1),
+                "phase": "lazy" if lazy else "startup",
+                "at_ms": round((start - _started) * 1000, 1),
+            })
+
+
+def mark_ready() -> float:
+    """Note that the app is built and can serve requests. Returns the seconds it took."""
+    global _ready
+    _ready = time.perf_counter() - _started
+    return _ready
+
+
+def slowest(limit: int = 5) -> List[Dict[str, Any]]:
+    with _lock:
+        return sorted(_imports, key=lambda entry: entry["ms"], reverse=True)[:limit]
+
+
+def snapshot() -> Dict[str, Any]:
+    """Time to ready and the import time of each module, in the order they were imported."""
+    with _lock:
+        return {
+            "ready_ms": None if _ready is None else round(_ready * 1000, 1),
+            "imports": list(_imports),
+        }
@@ -0,0 +1,212 @@
+import os
+import shutil
+import struct
+import time
+import zipfile
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+
+import config
+from audio import (TARGET_SAMPLE_RATE, WavFormatError, downmix, encode_wav_pcm16, is_wav, parse_wav, resample,
+                   sniff_audio_format, trim_silence)
+from jobs import DONE, FINISHED, new_job_id, runner, store, summary
+from utils import iter_long_audio_transcription, transcribe_audio_bytes
+
+KIND = "stt"
+
+# How long a results stream waits for news before checking the job again,
+# e.g. when another worker is running it
+POLL_SECONDS = 1.0
+
+
+def input_path(job_id: str, item: Dict[str, Any]) -> str:
+    """Where an item's uploaded audio is kept until it is transcribed."""
+    return os.path.join(store.path(job_id, ""), f"{item['index']:04d}.{item['format']}")
+
+
+def _copy_limited(source: BinaryIO, path: str, budget: int) -> int:
+    copied = 0
+    with open(path, "wb") as target:
+        while True:
+            chunk = source.read(1024 * 1024)
+            if not chunk:
+                return copied
+            copied += len(chunk)
+            if copied > budget:
+                raise ValueError(f"Upload exceeds {config.STT_JOB_MAX_BYTES} bytes")
+            target.write(chunk)
+
+
+def _audio_sources(uploads: List[Tuple[str, BinaryIO]]) -> Iterator[Tuple[str, str, BinaryIO]]:
+    # Name, format and reader of every audio file, with ZIP archives expanded
+    for name, source in uploads:
+        head = source.read(16)
+        source.seek(0)
+        if head[:4] != b"PK\x03\x04":
+            audio_format = sniff_audio_format(head)
+            if audio_format is None:
+                raise ValueError(f"{name} is neither a supported audio file nor a ZIP archive")
+            yield name, audio_format, source
+            continue
+        with zipfile.ZipFile(source) as archive:
+            for entry in archive.infolist():
+                if entry.is_dir() or os.path.basename(entry.filename).startswith(".") or entry.filename.startswith("__MACOSX/"):
+                    continue
+                with archive.open(entry) as member:
+                    audio_format = sniff_audio_format(member.read(16))
+                # Transcripts, notes and the like travel in archives too
+                if audio_format is None:
+                    continue
+                with archive.open(entry) as member:
+                    yield f"{name}/{entry.filename}", audio_format, member
+
+
+def create_job(uploads: List[Tuple[str, BinaryIO]]) -> Dict[str, Any]:
+    """
+    Queue audio files, or ZIP archives of them, to be transcribed in the background.
+
+    Files are kept under the job's directory until they are transcribed, so
+    a restarted worker can carry on with the rest.
+
+    Args:
+        uploads (List[Tuple[str, BinaryIO]]): File name and seekable reader per upload
+
+    Returns:
+        Dict[str, Any]: The new job
+
+    Raises:
+        ValueError: No audio, too many files or bytes, or a file that is neither
+            audio nor a ZIP archive
+    """
+    job_id = new_job_id()
+    directory = store.path(job_id, "")
+    os.makedirs(directory, exist_ok=True)
+    items: List[Dict[str, Any]] = []
+    budget = config.STT_JOB_MAX_BYTES
+    try:
+        for name, audio_format, source in _audio_sources(uploads):
+            if len(items) == config.JOBS_MAX_ITEMS:
+                raise ValueError(f"At most {config.JOBS_MAX_ITEMS} files per job")
+            item = {"index": len(items), "name": name, "format": audio_format}
+            item["bytes"] = _copy_limited(source, input_path(job_id, item), budget)
+            budget -= item["bytes"]
+            items.append(item)
+        if not items:
+            raise ValueError("No audio files provided")
+    except (ValueError, zipfile.BadZipFile) as e:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise ValueError(str(e))
+
+    job = store.create(KIND, {}, [{key: item[key] for key in ("name", "format", "bytes")} for item in items], job_id)
+    runner.start(job)
+    return job
+
+
+def _transcribe_long(wav: bytes) -> Tuple[str, int]:
+    segments = 0
+    response = ""
+    for event in iter_long_audio_transcription(wav):
+        if "segment" in event:
+            segments += 1
+        response = event.get("response", response)
+    return response, segments
+
+
+def discard_input(job_id: str, item: Dict[str, Any]):
+    """Delete an item's uploaded audio once it is done or has failed, and the job's directory with its last file."""
+    path = input_path(job_id, item)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass
+
+
+def transcribe_item(job_id: str, params: Dict[str, Any], item: Dict[str, Any]) -> Dict[str, Any]:
+    path = input_path(job_id, item)
+    with open(path, "rb") as f:
+        data = f.read()
+
+    # WAV files are trimmed, downmixed and resampled to what Whisper uses;
+    # compressed formats can't be decoded here and go up as they are
+    timings: Dict[str, float] = {}
+    result: Dict[str, Any] = {}
+    wav = None
+    started = time.perf_counter()
+    try:
+        samples, sample_rate = parse_wav(data) if is_wav(data) else (None, 0)
+    except (WavFormatError, struct.error, ValueError):
+        samples = None
+    if samples is not None:
+        mono = downmix(samples)
+        result["duration"] = round(len(mono) / sample_rate, 2)
+        if config.STT_JOB_TRIM_SILENCE:
+            start, end = trim_silence(mono, sample_rate)
+            mono = mono[start:end]
+        result["speech_seconds"] = round(len(mono) / sample_rate, 2)
+        timings["trim"] = time.perf_counter() - started
+        if len(mono) == 0:
+            return dict(result, text="", segments=0, timings={stage: round(value, 3) for stage, value in timings.items()})
+
+        started = time.perf_counter()
+        if sample_rate > TARGET_SAMPLE_RATE:
+            mono = resample(mono, sample_rate, TARGET_SAMPLE_RATE)
+            sample_rate = TARGET_SAMPLE_RATE
+        wav = encode_wav_pcm16(mono, sample_rate)
+        timings["normalize"] = time.perf_counter() - started
+
+    # Long recordings are split at silences and their segments transcribed in parallel
+    started = time.perf_counter()
+    if wav is not None and result["speech_seconds"] > config.STT_LONG_AUDIO_SECONDS:
+        text, segments = _transcribe_long(wav)
+    else:
+        text = transcribe_audio_bytes(wav or data, f"audio.{'wav' if wav else item['format']}")
+        segments = 1
+    timings["transcribe"] = time.perf_counter() - started
+
+    result.update(text=text, segments=segments, timings={stage: round(value, 3) for stage, value in timings.items()})
+    if result.get("duration"):
+        result["realtime_factor"] = round(sum(timings.values()) / result["duration"], 4)
+    return result
+
+
+def job_stats(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Totals over a job's transcribed files: audio, speech kept after trimming, and processing time."""
+    done = [item for item in job["items"] if item["status"] == DONE]
+    audio = sum(item.get("duration", 0.0) for item in done)
+    speech = sum(item.get("speech_seconds", item.get("duration", 0.0)) for item in done)
+    seconds = sum(item.get("seconds", 0.0) for item in done)
+    return {
+        "audio_seconds": round(audio, 2),
+        "speech_seconds": round(speech, 2),
+        "processing_seconds": round(seconds, 3),
+        "realtime_factor": round(seconds / audio, 4) if audio else None,
+    }
+
+
+def iter_results(job_id: str, after: float = 0.0) -> Iterator[Dict[str, Any]]:
+    """
+    Finished files of a job in the order they finish, waiting for the rest,
+    then the job's summary and totals.
+
+    Each result carries "finished_at"; a client that lost the stream passes
+    the last one it saw as `after` to pick up from there.
+    """
+    while True:
+        job = store.get(job_id)
+        if job is None:
+            return
+        finished = [item for item in job["items"] if item["status"] in FINISHED and item.get("finished_at", 0.0) > after]
+        for item in sorted(finished, key=lambda item: item["finished_at"]):
+            after = item["finished_at"]
+            yield item
+        if job["status"] == DONE:
+            yield dict(summary(job, items=False), **job_stats(job))
+            return
+        store.wait_for_change(POLL_SECONDS)
+
+
+# Inputs are kept through retries and removed whether the item succeeds or not
+runner.register(KIND, transcribe_item, discard_input)
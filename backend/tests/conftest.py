@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Make the backend modules importable when pytest runs from the backend directory or the repo root
+project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_dir not in sys.path:
+    sys.path.insert(0, project_dir)
@@ -0,0 +1,204 @@
+import struct
+
+import numpy as np
+import pytest
+
+from audio import (WAVE_FORMAT_EXTENSIBLE, WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, Mp3FormatError, WavFormatError,
+                   concatenate_mp3, downmix, encode_wav_pcm16, mp3_frames, normalize_audio, parse_wav, resample,
+                   split_on_silence)
+
+RATE = 16000
+
+
+def tone(seconds: float) -> np.ndarray:
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (0.5 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * RATE), dtype=np.float32)
+
+
+def assert_covers(segments, total):
+    assert segments[0].start == 0
+    assert segments[-1].end == total
+    for previous, segment in zip(segments, segments[1:]):
+        assert segment.start == previous.end - segment.overlap
+
+
+@pytest.mark.parametrize("max_seconds", [0, -5, 0.00001])
+def test_split_on_silence_rejects_a_non_positive_length(max_seconds):
+    with pytest.raises(ValueError):
+        split_on_silence(tone(1), RATE, max_seconds)
+
+
+def test_short_audio_is_one_segment():
+    samples = tone(3)
+    assert split_on_silence(samples, RATE, 10) == [(0, len(samples), 0)]
+
+
+def test_cuts_fall_inside_pauses():
+    samples = np.concatenate([tone(4), silence(1), tone(4), silence(1), tone(4)])
+    segments = split_on_silence(samples, RATE, 6)
+    assert_covers(segments, len(samples))
+    assert all(segment.end - segment.start <= 6 * RATE for segment in segments)
+    assert all(segment.overlap == 0 for segment in segments)
+    for segment in segments[:-1]:
+        assert samples[segment.end - 10:segment.end + 10].max() == 0
+
+
+def test_speech_without_pauses_is_cut_hard_with_overlap():
+    samples = tone(25)
+    segments = split_on_silence(samples, RATE, 10, overlap_seconds=1)
+    assert_covers(segments, len(samples))
+    assert [segment.overlap for segment in segments] == [0, RATE, RATE]
+    assert all(segment.end - segment.start <= 10 * RATE for segment in segments)
+
+
+# MPEG-1 Layer III, 128 kbps: 417 bytes per frame at 44.1 kHz, 384 at 48 kHz
+FRAME_HEADERS = {(44100, 2): b"\xff\xfb\x90\x00", (44100, 1): b"\xff\xfb\x90\xc0", (48000, 2): b"\xff\xfb\x94\x00"}
+FRAME_LENGTHS = {44100: 417, 48000: 384}
+
+
+def mp3_frame(sample_rate=44100, channels=2, fill=b"\x55"):
+    return FRAME_HEADERS[sample_rate, channels] + fill * (FRAME_LENGTHS[sample_rate] - 4)
+
+
+def info_frame(tag=b"Info"):
+    # Stereo MPEG-1 side information is 32 bytes, so the tag follows at 36
+    frame = bytearray(mp3_frame(fill=b"\x00"))
+    frame[36:40] = tag
+    return bytes(frame)
+
+
+def id3v2(body_length=100):
+    size = bytes((body_length >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x04\x00\x00" + size + b"\x00" * body_length
+
+
+def test_mp3_frames_skips_tags_and_info_frame():
+    data = id3v2() + info_frame(b"Xing") + mp3_frame() * 3 + b"TAG" + b"\x00" * 125
+    frames = mp3_frames(data)
+    assert [frame.offset for frame in frames] == [110 + 417 * n for n in (1, 2, 3)]
+    assert all((frame.length, frame.sample_rate, frame.channels, frame.samples) == (417, 44100, 2, 1152)
+               for frame in frames)
+
+
+def test_mp3_frames_drops_truncated_last_frame():
+    data = mp3_frame() * 2 + mp3_frame()[:200]
+    assert [frame.offset for frame in mp3_frames(data)] == [0, 417]
+
+
+def test_concatenate_mp3_joins_audio_frames_only():
+    first = id3v2() + info_frame() + mp3_frame(fill=b"\x11") * 2
+    second = id3v2(30) + info_frame(b"Xing") + mp3_frame(fill=b"\x22") * 3 + mp3_frame()[:100]
+    joined = concatenate_mp3([first, second])
+    assert joined == mp3_frame(fill=b"\x11") * 2 + mp3_frame(fill=b"\x22") * 3
+    assert len(mp3_frames(joined)) == 5
+    assert len(joined) == 5 * 417
+
+
+@pytest.mark.parametrize("other", [
+    mp3_frame(sample_rate=48000),
+    mp3_frame(channels=1),
+])
+def test_concatenate_mp3_rejects_mismatched_formats(other):
+    with pytest.raises(Mp3FormatError, match="differ"):
+        concatenate_mp3([mp3_frame() * 2, other * 2])
+
+
+def test_concatenate_mp3_rejects_part_without_frames():
+    with pytest.raises(Mp3FormatError, match="no audio frames"):
+        concatenate_mp3([mp3_frame(), id3v2()])
+
+
+def wav_file(payload: bytes, format_tag=WAVE_FORMAT_PCM, channels=1, sample_rate=RATE, bits=16, extensible=False):
+    block_align = channels * bits // 8
+    fields = struct.pack("<HHIIHH", WAVE_FORMAT_EXTENSIBLE if extensible else format_tag, channels, sample_rate,
+                         sample_rate * block_align, block_align, bits)
+    if extensible:
+        # cbSize, valid bits, channel mask, then the SubFormat GUID led by the real tag
+        fields += struct.pack("<HHIH", 22, bits, 0, format_tag) + b"\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x008\x9bq"
+    fmt = b"fmt " + struct.pack("<I", len(fields)) + fields
+    data = b"data" + struct.pack("<I", len(payload)) + payload
+    return b"RIFF" + struct.pack("<I", 4 + len(fmt) + len(data)) + b"WAVE" + fmt + data
+
+
+EXPECTED = [0.0, 0.5, -0.5, -1.0]
+
+
+def int24(values):
+    return b"".join(struct.pack("<i", value)[:3] for value in values)
+
+
+@pytest.mark.parametrize("format_tag, bits, payload", [
+    (WAVE_FORMAT_PCM, 8, bytes([128, 192, 64, 0])),
+    (WAVE_FORMAT_PCM, 16, struct.pack("<4h", 0, 16384, -16384, -32768)),
+    (WAVE_FORMAT_PCM, 24, int24([0, 1 << 22, -(1 << 22), -(1 << 23)])),
+    (WAVE_FORMAT_PCM, 32, struct.pack("<4i", 0, 1 << 30, -(1 << 30), -(1 << 31))),
+    (WAVE_FORMAT_IEEE_FLOAT, 32, struct.pack("<4f", *EXPECTED)),
+    (WAVE_FORMAT_IEEE_FLOAT, 64, struct.pack("<4d", *EXPECTED)),
+])
+@pytest.mark.parametrize("extensible", [False, True])
+def test_parse_wav_decodes_sample_formats(format_tag, bits, payload, extensible):
+    samples, sample_rate = parse_wav(wav_file(payload, format_tag, bits=bits, sample_rate=22050, extensible=extensible))
+    assert sample_rate == 22050
+    assert samples.dtype == np.float32
+    assert samples.shape == (4, 1)
+    np.testing.assert_allclose(samples[:, 0], EXPECTED)
+
+
+@pytest.mark.parametrize("format_tag, bits", [(WAVE_FORMAT_PCM, 12), (WAVE_FORMAT_IEEE_FLOAT, 16), (0x0055, 16)])
+def test_parse_wav_rejects_unsupported_formats(format_tag, bits):
+    with pytest.raises(WavFormatError):
+        parse_wav(wav_file(b"\x00" * 8, format_tag, bits=bits))
+
+
+def test_parse_wav_reads_interleaved_channels_and_downmixes():
+    payload = struct.pack("<6h", 16384, -16384, 8192, 8192, 0, -32768)
+    samples, _ = parse_wav(wav_file(payload, channels=2))
+    np.testing.assert_allclose(samples, [[0.5, -0.5], [0.25, 0.25], [0.0, -1.0]])
+    np.testing.assert_allclose(downmix(samples), [0.0, 0.25, -0.5])
+
+
+@pytest.mark.parametrize("source_rate", [48000, 44100, 22050])
+def test_resample_keeps_rate_and_tone(source_rate):
+    t = np.arange(source_rate) / source_rate
+    output = resample(np.sin(2 * np.pi * 440 * t).astype(np.float32), source_rate, RATE)
+    assert output.dtype == np.float32
+    assert len(output) == RATE
+    expected = np.sin(2 * np.pi * 440 * np.arange(RATE) / RATE)
+    # Away from the edges, where the filter runs into padding
+    middle = slice(RATE // 10, -RATE // 10)
+    assert np.max(np.abs(output[middle] - expected[middle])) < 0.01
+
+
+def test_resample_rounds_output_length_up():
+    assert len(resample(np.zeros(1001, dtype=np.float32), 48000, RATE)) == 334
+
+
+def test_encode_wav_pcm16_round_trips():
+    samples = np.linspace(-1.0, 1.0, 101, dtype=np.float32)
+    decoded, sample_rate = parse_wav(encode_wav_pcm16(samples, 8000))
+    assert sample_rate == 8000
+    np.testing.assert_allclose(decoded[:, 0], samples, atol=1 / 32768)
+
+
+def test_normalize_audio_downmixes_and_resamples():
+    stereo = np.zeros((48000, 2), dtype="<i2")
+    stereo[:, 0] = 8192
+    data = wav_file(stereo.tobytes(), channels=2, sample_rate=48000)
+    samples, sample_rate = parse_wav(normalize_audio(data))
+    assert sample_rate == RATE
+    assert samples.shape == (RATE, 1)
+    np.testing.assert_allclose(samples[RATE // 10:-RATE // 10, 0], 0.125, atol=1e-3)
+
+
+@pytest.mark.parametrize("data", [
+    b"OggS" + b"\x00" * 100,
+    b"RIFF\x00\x00\x00\x00WAVEjunk",
+    # Already 16 kHz mono 16-bit: re-encoding would not make it smaller
+    encode_wav_pcm16(np.zeros(100, dtype=np.float32), RATE),
+])
+def test_normalize_audio_passes_other_input_through(data):
+    assert normalize_audio(data) is data
@@ -0,0 +1,94 @@
+import gzip
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import compression
+from compression import CompressionMiddleware, is_compressible, negotiate
+
+needs_brotli = pytest.mark.skipif(compression.brotli is None, reason="brotli is not installed")
+
+
+@pytest.mark.parametrize("header, encoding", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("deflate, gzip;q=0.5", "gzip"),
+    ("*;q=0.1", "br" if compression.brotli is not None else "gzip"),
+])
+def test_negotiate(header, encoding):
+    assert negotiate(header) == encoding
+
+
+@needs_brotli
+@pytest.mark.parametrize("header, encoding", [
+    ("gzip, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("gzip;q=1.0, br;q=1.0", "br"),
+    ("br;q=0, *", "gzip"),
+    ("br;q=bad, gzip;q=0.2", "gzip"),
+])
+def test_negotiate_weighs_brotli_against_gzip(header, encoding):
+    assert negotiate(header) == encoding
+
+
+def test_brotli_is_not_offered_without_the_package(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert negotiate("br") is None
+    assert negotiate("br, gzip;q=0.1") == "gzip"
+
+
+@pytest.mark.parametrize("content_type, expected", [
+    ("application/json", True),
+    ("text/html; charset=utf-8", True),
+    ("application/problem+json", True),
+    ("audio/mpeg", False),
+    ("application/zip", False),
+])
+def test_is_compressible(content_type, expected):
+    assert is_compressible(content_type) == expected
+
+
+BODY = "hello world " * 200
+
+
+def client() -> TestClient:
+    async def text(request):
+        return PlainTextResponse(BODY, headers={"ETag": '"abc"'})
+
+    async def small(request):
+        return PlainTextResponse("hi")
+
+    async def audio(request):
+        return Response(BODY.encode(), media_type="audio/mpeg")
+
+    async def lines(request):
+        return StreamingResponse((f"line {index}\n" for index in range(3)), media_type="application/x-ndjson")
+
+    app = Starlette(routes=[Route(path, endpoint) for path, endpoint in
+                            [("/text", text), ("/small", small), ("/audio", audio), ("/lines", lines)]])
+    return TestClient(CompressionMiddleware(app, minimum_size=100))
+
+
+def test_text_is_gzipped_with_a_weak_etag():
+    response = client().get("/text", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.text == BODY
+
+
+def test_small_and_binary_bodies_pass_through():
+    assert "content-encoding" not in client().get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client().get("/audio", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_streams_are_compressed_chunk_by_chunk():
+    with client().stream("GET", "/lines", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        raw = b"".join(response.iter_raw())
+    assert gzip.decompress(raw) == b"line 0\nline 1\nline 2\n"
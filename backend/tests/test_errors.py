@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from starlette.testclient import TestClient
+
+from errors import (AudioRejectedError, ErrorHandlingMiddleware, UpstreamRejectedError, UpstreamTimeoutError,
+                    UpstreamUnavailableError, setup_exception_handlers)
+
+
+def build_app():
+    app = FastAPI()
+    setup_exception_handlers(app)
+
+    @app.get("/unavailable")
+    async def unavailable():
+        raise UpstreamUnavailableError("whisper is unavailable; try again shortly", retry_after=7)
+
+    @app.get("/timeout")
+    def timeout():
+        raise UpstreamTimeoutError()
+
+    @app.get("/rejected")
+    def rejected():
+        raise UpstreamRejectedError()
+
+    @app.get("/audio")
+    def audio():
+        raise AudioRejectedError()
+
+    @app.get("/boom")
+    def boom():
+        raise RuntimeError("secret internals")
+
+    @app.get("/stream")
+    def stream():
+        def body():
+            yield b"first part"
+            raise RuntimeError("broke mid-stream")
+        return StreamingResponse(body(), media_type="text/plain")
+
+    return app
+
+
+@pytest.fixture
+def client():
+    return TestClient(build_app())
+
+
+@pytest.mark.parametrize("path, status, detail", [
+    ("/unavailable", 503, "whisper is unavailable; try again shortly"),
+    ("/timeout", 504, "Upstream service timed out"),
+    ("/rejected", 502, "Upstream service rejected the request"),
+    ("/audio", 422, "Audio could not be transcribed"),
+])
+def test_upstream_errors_are_json(client, path, status, detail):
+    response = client.get(path)
+    assert response.status_code == status
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == {"detail": detail}
+
+
+def test_unavailable_says_when_to_retry(client):
+    assert client.get("/unavailable").headers["retry-after"] == "7"
+
+
+def test_unexpected_errors_are_a_generic_500(client):
+    response = client.get("/boom")
+    assert response.status_code == 500
+    assert response.json() == {"detail": "An unexpected error occurred. Please try again later."}
+    assert "secret" not in response.text
+
+
+def call(app, path):
+    scope = {"type": "http", "method": "GET", "path": path, "raw_path": path.encode(), "query_string": b"",
+             "headers": [], "http_version": "1.1", "scheme": "http", "server": ("test", 80), "client": ("test", 1),
+             "root_path": ""}
+    sent = []
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    error = None
+    try:
+        asyncio.run(app(scope, receive, send))
+    except Exception as exc:
+        error = exc
+    return sent, error
+
+
+def test_error_after_the_response_started_is_not_answered_twice():
+    sent, error = call(build_app(), "/stream")
+    starts = [message for message in sent if message["type"] == "http.response.start"]
+    # The 200 and the first chunk went out; the server is left to drop the connection
+    assert [message["status"] for message in starts] == [200]
+    assert b"first part" in b"".join(message.get("body", b"") for message in sent)
+    assert b"unexpected error" not in b"".join(message.get("body", b"") for message in sent)
+    assert isinstance(error, RuntimeError)
+
+
+def test_middleware_answers_before_the_response_started():
+    async def app(scope, receive, send):
+        raise RuntimeError("early")
+
+    sent, error = call(ErrorHandlingMiddleware(app), "/")
+    assert error is None
+    assert sent[0]["status"] == 500
+
+
+def test_middleware_passes_other_scopes_through():
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(scope["type"])
+
+    asyncio.run(ErrorHandlingMiddleware(app)({"type": "websocket"}, None, None))
+    assert seen == ["websocket"]
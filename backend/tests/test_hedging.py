@@ -0,0 +1,91 @@
+import threading
+import time
+
+import httpx
+import pytest
+
+import config
+import hedging
+from cancellation import CancellableTransport, CancelToken, cancel_scope
+from errors import RequestCancelledError
+from limiter import get_limiter
+
+PROVIDER = "hedge-test"
+
+
+class _Body(httpx.SyncByteStream):
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        yield b"slow"
+
+    def close(self):
+        self.closed.set()
+
+
+class SlowTransport(httpx.BaseTransport):
+    """/slow answers only once `release` is set; everything else at once."""
+    def __init__(self):
+        self.release = threading.Event()
+        self.slow_body = _Body()
+
+    def handle_request(self, request):
+        if request.url.path == "/slow":
+            self.release.wait(5)
+            return httpx.Response(200, stream=self.slow_body)
+        return httpx.Response(200, content=b"fast")
+
+
+@pytest.fixture
+def hedge_now(monkeypatch):
+    monkeypatch.setattr(config, "HEDGING_ENABLED", True)
+    monkeypatch.setattr(config, "HEDGE_MIN_DELAY_MS", 10)
+    monkeypatch.setattr(hedging, "budget", hedging.HedgeBudget(1.0, 10))
+    tracker = hedging.LatencyTracker(config.HEDGE_WINDOW)
+    for _ in range(config.HEDGE_MIN_SAMPLES):
+        tracker.add(0.02)
+    monkeypatch.setitem(hedging.trackers, PROVIDER, tracker)
+
+
+def test_losing_attempt_is_cancelled_and_frees_its_slot(hedge_now):
+    transport = SlowTransport()
+    client = httpx.Client(transport=CancellableTransport(transport))
+    limiter = get_limiter(PROVIDER)
+    attempts = []
+
+    def attempt(path):
+        def run(timeout):
+            with limiter.slot(timeout):
+                attempts.append(path)
+                return client.get(f"http://upstream{path}").read()
+        return run
+
+    with cancel_scope():
+        started = time.perf_counter()
+        result = hedging.hedged(PROVIDER, attempt("/slow"), attempt("/fast"))(5.0)
+    assert result == b"fast"
+    assert attempts == ["/slow", "/fast"]
+
+    # The loser stops waiting for headers and gives its slot back long before its timeout
+    deadline = time.perf_counter() + 1.0
+    while limiter.state()["active"] and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert limiter.state()["active"] == 0
+    assert time.perf_counter() - started < 1.0
+
+    # Its response is closed unread when it finally arrives
+    transport.release.set()
+    assert transport.slow_body.closed.wait(2)
+
+
+def test_abandoned_request_raises_at_once():
+    transport = SlowTransport()
+    client = httpx.Client(transport=CancellableTransport(transport))
+    token = CancelToken(abandon_in_flight=True)
+    threading.Timer(0.05, token.cancel, args=("test",), kwargs={"client": False}).start()
+    started = time.perf_counter()
+    with cancel_scope(token), pytest.raises(RequestCancelledError):
+        client.get("http://upstream/slow")
+    assert time.perf_counter() - started < 1.0
+    transport.release.set()
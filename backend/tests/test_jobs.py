@@ -0,0 +1,170 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import config
+import jobs
+from errors import UpstreamUnavailableError
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobRunner, JobStore, summary
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path))
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def saved(store, job_id):
+    with open(store.path(job_id)) as f:
+        return json.load(f)
+
+
+def run(store, job, handler, kind="test"):
+    runner = JobRunner(store, max_workers=2)
+    runner.register(kind, handler)
+    started = runner.start(job)
+    while started and os.path.exists(store.path(job["id"], ".lock")):
+        store.wait_for_change(0.05)
+    runner.shutdown()
+    return started
+
+
+def test_create_persists_a_queued_job(store):
+    job = store.create("test", {"voice": "a"}, [{"text": "one"}, {"text": "two"}])
+    assert job["status"] == QUEUED
+    assert [(item["index"], item["status"]) for item in job["items"]] == [(0, QUEUED), (1, QUEUED)]
+    assert store.get(job["id"]) == job
+    assert saved(store, job["id"]) == job
+
+
+def test_get_refuses_unknown_and_malformed_ids(store):
+    assert store.get(jobs.new_job_id()) is None
+    assert store.get("../etc/passwd") is None
+
+
+def test_update_item_tracks_job_status_and_saves_when_done(store, monkeypatch):
+    monkeypatch.setattr(jobs, "SAVE_INTERVAL_SECONDS", 3600.0)
+    job = store.create("test", {}, [{}, {}])
+    assert store.claim(job)
+
+    store.update_item(job["id"], 0, {"status": RUNNING})
+    assert store.get(job["id"])["status"] == RUNNING
+    # Running state is served from memory between saves
+    assert saved(store, job["id"])["status"] == QUEUED
+
+    store.update_item(job["id"], 0, {"status": DONE, "text": "hi"})
+    store.update_item(job["id"], 1, {"status": FAILED, "error": "nope"})
+    on_disk = saved(store, job["id"])
+    assert on_disk["status"] == DONE
+    assert on_disk["items"][0]["text"] == "hi"
+    assert all("finished_at" in item for item in on_disk["items"])
+    store.release(job["id"])
+    assert store.get(job["id"]) == on_disk
+
+
+def test_claim_writes_a_pid_lock(store):
+    job = store.create("test", {}, [{}])
+    assert store.claim(job)
+    with open(store.path(job["id"], ".lock")) as f:
+        assert int(f.read()) == os.getpid()
+    store.release(job["id"])
+    assert not os.path.exists(store.path(job["id"], ".lock"))
+
+
+def test_claim_respects_a_live_worker(store):
+    job = store.create("test", {}, [{}])
+    with open(store.path(job["id"], ".lock"), "w") as f:
+        # Our parent is alive and is not us
+        f.write(str(os.getppid()))
+    assert not store.claim(job)
+
+
+def test_claim_takes_over_a_dead_worker_s_lock(store):
+    job = store.create("test", {}, [{}])
+    with open(store.path(job["id"], ".lock"), "w") as f:
+        f.write(str(dead_pid()))
+    assert store.claim(job)
+    with open(store.path(job["id"], ".lock")) as f:
+        assert int(f.read()) == os.getpid()
+
+
+def test_resume_runs_only_unfinished_items(store):
+    job = store.create("test", {}, [{"n": 0}, {"n": 1}, {"n": 2}])
+    # A previous worker finished the first item and died with the second in flight
+    job["items"][0].update(status=DONE, result=0)
+    job["items"][1].update(status=RUNNING)
+    job["status"] = RUNNING
+    jobs._write_json(store.path(job["id"]), job)
+    with open(store.path(job["id"], ".lock"), "w") as f:
+        f.write(str(dead_pid()))
+    done = store.create("test", {}, [{"n": 9}])
+    done["status"] = DONE
+    jobs._write_json(store.path(done["id"]), done)
+
+    assert [unfinished["id"] for unfinished in store.unfinished()] == [job["id"]]
+    handled = []
+
+    def handler(job_id, params, item):
+        handled.append(item["n"])
+        return {"result": item["n"]}
+
+    runner = JobRunner(store, max_workers=1)
+    runner.register("test", handler)
+    assert runner.resume() == 1
+    while os.path.exists(store.path(job["id"], ".lock")):
+        store.wait_for_change(0.05)
+    runner.shutdown()
+
+    assert sorted(handled) == [1, 2]
+    finished = store.get(job["id"])
+    assert finished["status"] == DONE
+    assert [item["result"] for item in finished["items"]] == [0, 1, 2]
+
+
+def test_failing_item_fails_alone(store, monkeypatch):
+    monkeypatch.setattr(config, "JOBS_ITEM_ATTEMPTS", 1)
+    job = store.create("test", {}, [{"n": 0}, {"n": 1}])
+
+    def handler(job_id, params, item):
+        if item["n"] == 1:
+            raise ValueError("bad input")
+        return {"result": "ok"}
+
+    assert run(store, job, handler)
+    finished = store.get(job["id"])
+    assert finished["status"] == DONE
+    assert [item["status"] for item in finished["items"]] == [DONE, FAILED]
+    assert finished["items"][1]["error"] == "bad input"
+    assert summary(finished, items=False)["progress"] == 1.0
+    assert summary(finished, items=False)[FAILED] == 1
+
+
+def test_item_is_retried_after_an_outage(store, monkeypatch):
+    monkeypatch.setattr(config, "JOBS_ITEM_ATTEMPTS", 3)
+    monkeypatch.setattr(jobs.time, "sleep", lambda seconds: None)
+    job = store.create("test", {}, [{}])
+    attempts = []
+
+    def handler(job_id, params, item):
+        attempts.append(1)
+        raise UpstreamUnavailableError("upstream is down")
+
+    assert run(store, job, handler)
+    item = store.get(job["id"])["items"][0]
+    assert len(attempts) == 3
+    assert item["status"] == FAILED
+    assert item["error"] == "upstream is down"
+
+
+def test_unknown_kind_is_not_started(store):
+    job = store.create("other", {}, [{}])
+    assert not run(store, job, lambda job_id, params, item: {}, kind="test")
+    assert not os.path.exists(store.path(job["id"], ".lock"))
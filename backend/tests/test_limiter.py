@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+import config
+from cancellation import CancelToken, cancel_scope
+from errors import RequestCancelledError, UpstreamUnavailableError
+from limiter import ProviderLimiter, client_key
+
+
+def scope(peer, forwarded=None, session=None):
+    headers = []
+    if forwarded is not None:
+        headers.append((b"x-forwarded-for", forwarded.encode()))
+    if session is not None:
+        headers.append((b"x-session-id", session.encode()))
+    return {"type": "http", "client": (peer, 50000), "headers": headers}
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_client_key_prefers_session_header(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_TRUSTED_PROXIES", [])
+    assert client_key(scope("10.0.0.5", session="abc")) == "session:abc"
+    assert client_key(scope("10.0.0.5")) == "ip:10.0.0.5"
+
+
+def test_client_key_reads_address_through_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_TRUSTED_PROXIES", ["10.0.0.0/8"])
+    assert client_key(scope("10.0.0.5", "203.0.113.7")) == "ip:203.0.113.7"
+    # An untrusted peer's header is ignored
+    assert client_key(scope("192.0.2.1", "203.0.113.7")) == "ip:192.0.2.1"
+
+
+def test_freed_slots_go_to_sessions_in_turn():
+    limiter = ProviderLimiter("test", max_concurrency=1, queue_timeout=5.0)
+    limiter.acquire(session="busy")
+    served = []
+    lock = threading.Lock()
+
+    def call(session):
+        limiter.acquire(session=session)
+        with lock:
+            served.append(session)
+
+    threads = []
+    # The busy session queues three requests before the quiet one queues its only one
+    for session in ("busy", "busy", "busy", "quiet"):
+        thread = threading.Thread(target=call, args=(session,))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: limiter.state()["queued"] == len(threads))
+    assert limiter.state()["sessions_waiting"] == 2
+
+    for expected in range(1, 5):
+        limiter.release()
+        wait_for(lambda: len(served) == expected)
+    for thread in threads:
+        thread.join()
+    # The quiet session waits behind one of the busy session's requests, not all three
+    assert served == ["busy", "quiet", "busy", "busy"]
+    limiter.release()
+    assert limiter.state() == {"active": 0, "queued": 0, "limit": 1, "sessions_waiting": 0}
+
+
+def test_queue_timeout_raises_unavailable():
+    limiter = ProviderLimiter("test", max_concurrency=1, queue_timeout=0.05)
+    limiter.acquire(session="a")
+    started = time.perf_counter()
+    with pytest.raises(UpstreamUnavailableError):
+        limiter.acquire(session="b")
+    assert time.perf_counter() - started < 1.0
+    # The timed-out caller gave up its place
+    assert limiter.state()["queued"] == 0
+    limiter.release()
+    assert limiter.state()["active"] == 0
+
+
+def test_cancelled_request_leaves_the_queue():
+    limiter = ProviderLimiter("test", max_concurrency=1, queue_timeout=5.0)
+    limiter.acquire(session="a")
+    token = CancelToken()
+    errors = []
+
+    def call():
+        with cancel_scope(token):
+            try:
+                limiter.acquire(session="b")
+            except Exception as exc:
+                errors.append(exc)
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    wait_for(lambda: limiter.state()["queued"] == 1)
+    started = time.perf_counter()
+    token.cancel("client disconnected")
+    thread.join(2.0)
+    assert not thread.is_alive()
+    assert time.perf_counter() - started < 1.0
+    assert len(errors) == 1 and isinstance(errors[0], RequestCancelledError)
+    assert limiter.state()["queued"] == 0
+    # The slot stays with its holder and frees normally
+    limiter.release()
+    assert limiter.state()["active"] == 0
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import config
+import utils
+from audio import encode_wav_pcm16
+from errors import UpstreamUnavailableError
+from utils import iter_long_audio_transcription, stitch_transcripts
+
+RATE = 16000
+
+
+@pytest.mark.parametrize("parts, expected", [
+    ([("Hello there.", False), ("How are you?", False)], "Hello there. How are you?"),
+    # Words heard in both segments are kept once, whatever their case and punctuation
+    ([("so we went to the", False), ("To the park, then home.", True)], "so we went to the park, then home."),
+    ([("and that was", False), ("that was it. that was", True), ("that was all", True)], "and that was it. that was all"),
+    # Without an overlap a repeat is real speech
+    ([("that was", False), ("that was it", False)], "that was that was it"),
+    # No common run at the boundary
+    ([("one two", False), ("three four", True)], "one two three four"),
+    # A segment entirely inside the overlap adds nothing
+    ([("see you soon", False), ("soon", True)], "see you soon"),
+])
+def test_stitch_transcripts(parts, expected):
+    assert stitch_transcripts(parts) == expected
+
+
+def test_stitch_transcripts_looks_only_so_far_back():
+    repeated = " ".join(f"w{index}" for index in range(5))
+    assert stitch_transcripts([(repeated, False), (repeated + " end", True)], max_overlap_words=3) == f"{repeated} {repeated} end"
+    assert stitch_transcripts([(repeated, False), (repeated + " end", True)], max_overlap_words=5) == f"{repeated} end"
+
+
+@pytest.mark.parametrize("parts, expected", [
+    ([("", False), ("   ", True), ("Hi.", True)], "Hi."),
+    ([("Hello", False), ("", True), ("", True)], "Hello"),
+    # The third segment shares audio only with the empty second one, so its
+    # first word is not a repeat of the first segment's last
+    ([("I said no", False), ("", True), ("no way", True)], "I said no no way"),
+    ([], ""),
+])
+def test_stitch_transcripts_with_empty_segments(parts, expected):
+    assert stitch_transcripts(parts) == expected
+
+
+@pytest.fixture
+def long_recording(monkeypatch):
+    monkeypatch.setattr(config, "STT_SEGMENT_MAX_SECONDS", 10.0)
+    monkeypatch.setattr(config, "STT_SEGMENT_OVERLAP_SECONDS", 1.0)
+    monkeypatch.setattr(config, "STT_MAX_CONCURRENCY", 1)
+    # Speech without pauses, so it is cut hard into three overlapping segments
+    t = np.arange(25 * RATE) / RATE
+    return encode_wav_pcm16((0.5 * np.sin(2 * np.pi * 220 * t)).astype(np.float32), RATE)
+
+
+def transcribing(monkeypatch, results):
+    pending = list(results)
+
+    def transcribe(data, filename="audio.wav"):
+        result = pending.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(utils, "transcribe_audio_bytes", transcribe)
+
+
+def test_long_audio_is_stitched_across_overlaps(long_recording, monkeypatch):
+    transcribing(monkeypatch, ["the quick brown", "brown fox jumps over", "over the lazy dog"])
+    events = list(iter_long_audio_transcription(long_recording))
+    assert sorted(event["segment"] for event in events[:-1]) == [0, 1, 2]
+    assert events[-1] == {"response": "the quick brown fox jumps over the lazy dog"}
+
+
+def test_failed_segment_fails_the_transcription(long_recording, monkeypatch):
+    transcribing(monkeypatch, ["the quick brown", UpstreamUnavailableError("whisper is unavailable"), "over the lazy dog"])
+    events = []
+    with pytest.raises(UpstreamUnavailableError):
+        for event in iter_long_audio_transcription(long_recording):
+            events.append(event)
+    # No stitched transcript with a hole in it
+    assert all("response" not in event for event in events)
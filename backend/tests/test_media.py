@@ -0,0 +1,69 @@
+import pytest
+from starlette.requests import Request
+
+from media import audio_etag, audio_response, parse_range
+
+AUDIO = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize("header, span", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 1023)),
+    ("bytes=-100", (924, 1023)),
+    ("bytes=-5000", (0, 1023)),
+    ("bytes=1000-5000", (1000, 1023)),
+    (" bytes=5-5 ", (5, 5)),
+])
+def test_parse_range(header, span):
+    assert parse_range(header, len(AUDIO)) == span
+
+
+@pytest.mark.parametrize("header", ["bytes=-", "items=0-10", "bytes=0-10,20-30", "bytes=a-b"])
+def test_unusable_ranges_are_ignored(header):
+    assert parse_range(header, len(AUDIO)) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=2000-3000", "bytes=10-5", "bytes=-0"])
+def test_unsatisfiable_ranges_raise(header):
+    with pytest.raises(ValueError):
+        parse_range(header, len(AUDIO))
+
+
+def request(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/audio/x",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def test_whole_audio_carries_validators():
+    response = audio_response(request(), AUDIO)
+    assert response.status_code == 200
+    assert response.body == AUDIO
+    assert response.headers["etag"] == audio_etag(AUDIO)
+    assert response.headers["accept-ranges"] == "bytes"
+
+
+def test_matching_etag_is_not_modified():
+    assert audio_response(request(if_none_match=audio_etag(AUDIO)), AUDIO).status_code == 304
+
+
+def test_range_is_partial_content():
+    response = audio_response(request(range="bytes=10-19"), AUDIO)
+    assert response.status_code == 206
+    assert response.body == AUDIO[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(AUDIO)}"
+
+
+def test_range_past_the_end_is_not_satisfiable():
+    response = audio_response(request(range="bytes=5000-"), AUDIO)
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(AUDIO)}"
+
+
+def test_stale_if_range_sends_the_whole_audio():
+    response = audio_response(request(range="bytes=10-19", if_range='"stale"'), AUDIO)
+    assert response.status_code == 200
+    assert response.body == AUDIO
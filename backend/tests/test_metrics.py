@@ -0,0 +1,121 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+import metrics
+from metrics import UPSTREAM_REQUESTS, Registry
+
+
+def samples(text):
+    return [line for line in text.splitlines() if not line.startswith("#")]
+
+
+def test_counter_and_gauge_rendering():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests handled", ["route", "status"])
+    requests.labels("/a", 200).inc()
+    requests.labels(route="/a", status="200").inc(2)
+    requests.labels("/b", 500).inc()
+    in_flight = registry.gauge("in_flight", "Requests in flight")
+    in_flight.inc(3)
+    in_flight.dec()
+    ratio = registry.gauge("ratio", "A fraction")
+    ratio.set(0.25)
+
+    text = registry.render()
+    assert "# HELP requests_total Requests handled\n# TYPE requests_total counter\n" in text
+    assert "# TYPE in_flight gauge\n" in text
+    assert samples(text) == [
+        "in_flight 2",
+        "ratio 0.25",
+        'requests_total{route="/a",status="200"} 3',
+        'requests_total{route="/b",status="500"} 1',
+    ]
+
+
+def test_histogram_rendering():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", ["route"], buckets=(0.1, 0.5, 1.0))
+    for value in (0.05, 0.1, 0.3, 2.0):
+        latency.labels("/a").observe(value)
+
+    assert samples(registry.render()) == [
+        'latency_seconds_bucket{route="/a",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a",le="0.5"} 3',
+        'latency_seconds_bucket{route="/a",le="1"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a"} 2.45',
+        'latency_seconds_count{route="/a"} 4',
+    ]
+    assert latency.labels("/a").percentile(0.5) == 0.1
+    assert latency.labels("/a").percentile(0.75) == 0.5
+    assert latency.labels("/a").percentile(1.0) == float("inf")
+    assert latency.labels("/b").percentile(0.5) is None
+
+
+def test_label_values_and_help_are_escaped():
+    registry = Registry()
+    registry.counter("odd_total", 'Help with a \\ backslash,\na "quote" and a newline', ["name"]).labels('say "hi"\\\n').inc()
+    text = registry.render()
+    assert '# HELP odd_total Help with a \\\\ backslash,\\na "quote" and a newline\n' in text
+    assert samples(text) == ['odd_total{name="say \\"hi\\"\\\\\\n"} 1']
+
+
+@pytest.mark.parametrize("value, rendered", [
+    (3.0, "3"),
+    (-2.0, "-2"),
+    (0.125, "0.125"),
+    (1e20, "1e+20"),
+    (float("inf"), "+Inf"),
+    (float("-inf"), "-Inf"),
+    (float("nan"), "NaN"),
+])
+def test_value_formatting(value, rendered):
+    registry = Registry()
+    registry.gauge("value", "A value").set(value)
+    assert samples(registry.render()) == [f"value {rendered}"]
+
+
+def test_multiprocess_sums_workers_and_drops_dead_gauges(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "MULTIPROC_DIR", str(tmp_path))
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    in_flight = registry.gauge("in_flight", "In flight")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(1.0,))
+    requests.labels("/a").inc(2)
+    in_flight.set(1)
+    latency.observe(0.5)
+
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    with open(os.path.join(tmp_path, f"metrics-{dead.pid}.json"), "w") as f:
+        json.dump({
+            "requests_total": [[["/a"], 5.0], [["/b"], 1.0]],
+            "in_flight": [[[], 4.0]],
+            "latency_seconds": [[[], {"counts": [0, 1], "count": 1, "sum": 3.0}]],
+        }, f)
+
+    # This worker's own file is written as part of rendering
+    assert samples(registry.render()) == [
+        "in_flight 1",
+        'latency_seconds_bucket{le="1"} 1',
+        'latency_seconds_bucket{le="+Inf"} 2',
+        "latency_seconds_sum 3.5",
+        "latency_seconds_count 2",
+        'requests_total{route="/a"} 7',
+        'requests_total{route="/b"} 1',
+    ]
+
+
+def test_metrics_endpoint_exposes_the_registry():
+    UPSTREAM_REQUESTS.labels('test "quoted"\nupstream', "ok").inc()
+    response = TestClient(main.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    assert "# TYPE upstream_requests_total counter" in response.text
+    assert 'upstream_requests_total{upstream="test \\"quoted\\"\\nupstream",outcome="ok"} 1' in response.text
@@ -0,0 +1,58 @@
+import pytest
+
+import config
+from ratelimit import LocalBuckets, client_address, rate_limit_key
+
+
+def scope(peer, forwarded=None, **headers):
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    if forwarded is not None:
+        raw.append((b"x-forwarded-for", forwarded.encode()))
+    return {"type": "http", "client": (peer, 50000), "headers": raw}
+
+
+def test_bucket_allows_burst_then_asks_to_wait():
+    buckets = LocalBuckets(rate=1.0, burst=3)
+    assert [buckets.take("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.take("a") > 0.0
+    # Other clients have their own bucket
+    assert buckets.take("b") == 0.0
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_TRUSTED_PROXIES", [])
+    assert client_address(scope("10.0.0.5", "203.0.113.7")) == "10.0.0.5"
+
+
+def test_forwarded_for_from_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_TRUSTED_PROXIES", ["10.0.0.0/8"])
+    # A spoofed first entry is skipped: the last untrusted hop is the client
+    assert client_address(scope("10.0.0.5", "198.51.100.1, 203.0.113.7, 10.0.0.9")) == "203.0.113.7"
+    # Untrusted peers can't choose their bucket
+    assert client_address(scope("192.0.2.1", "203.0.113.7")) == "192.0.2.1"
+
+
+def test_trust_any_proxy_uses_the_entry_it_appended(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_TRUSTED_PROXIES", ["*"])
+    assert client_address(scope("10.0.0.5", "203.0.113.7")) == "203.0.113.7"
+    # Whatever the client put in front is not believed
+    assert client_address(scope("10.0.0.5", "198.51.100.1, 203.0.113.7")) == "203.0.113.7"
+    assert client_address(scope("10.0.0.5")) == "10.0.0.5"
+
+
+def test_spoofed_forwarded_for_does_not_change_the_bucket(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_TRUSTED_PROXIES", ["*"])
+    keys = {client_address(scope("10.0.0.5", f"192.0.2.{index}, 203.0.113.7")) for index in range(10)}
+    assert keys == {"203.0.113.7"}
+
+
+def test_listed_proxies_are_skipped_alongside_any_peer(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_TRUSTED_PROXIES", ["*", "10.0.0.0/8"])
+    assert client_address(scope("10.0.0.5", "198.51.100.1, 203.0.113.7, 10.0.0.9")) == "203.0.113.7"
+
+
+@pytest.mark.parametrize("key, expected", [("ip", "ip:203.0.113.7"), ("session", "session:abc")])
+def test_rate_limit_key(monkeypatch, key, expected):
+    monkeypatch.setattr(config, "RATE_LIMIT_KEY", key)
+    monkeypatch.setattr(config, "RATE_LIMIT_TRUSTED_PROXIES", ["*"])
+    assert rate_limit_key(scope("10.0.0.5", "203.0.113.7", x_session_id="abc")) == expected
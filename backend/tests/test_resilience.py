@@ -0,0 +1,185 @@
+import io
+
+import httpx
+import pytest
+
+import config
+import resilience
+import utils
+from errors import AudioRejectedError, UpstreamRejectedError, UpstreamTimeoutError, UpstreamUnavailableError
+from resilience import CircuitBreaker
+from router import Backend, Router
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test-open", failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(UpstreamUnavailableError) as refused:
+        breaker.before_call()
+    assert refused.value.headers["Retry-After"] == "30"
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("test-reset", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_breaker_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("test-probe", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 31
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(UpstreamUnavailableError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_failed_probe_opens_the_breaker_again(clock):
+    breaker = CircuitBreaker("test-reopen", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 31
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(UpstreamUnavailableError):
+        breaker.before_call()
+
+
+@pytest.fixture
+def whisper(monkeypatch):
+    """Point transcriptions at a handler and give Whisper a fresh breaker."""
+    monkeypatch.setattr(config, "RETRY_BASE_DELAY_SECONDS", 0.0)
+    monkeypatch.setattr(config, "RETRY_MAX_ATTEMPTS", 2)
+    monkeypatch.delitem(resilience.breakers, "whisper", raising=False)
+
+    def use(handler):
+        monkeypatch.setattr(utils, "http_client", httpx.Client(transport=httpx.MockTransport(handler)))
+    return use
+
+
+def test_transcription_returns_the_text(whisper):
+    whisper(lambda request: httpx.Response(200, json={"text": "hello there"}))
+    assert utils.transcribe_audio_bytes(b"RIFF") == "hello there"
+
+
+def test_transcription_raises_once_retries_are_used_up(whisper):
+    whisper(lambda request: httpx.Response(503))
+    with pytest.raises(UpstreamUnavailableError) as failed:
+        utils.transcribe_audio_bytes(b"RIFF")
+    assert failed.value.status_code == 503
+
+
+def test_transcription_raises_504_when_every_attempt_times_out(whisper):
+    def handler(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+    whisper(handler)
+    with pytest.raises(UpstreamTimeoutError) as failed:
+        utils.transcribe_audio_bytes(b"RIFF")
+    assert failed.value.status_code == 504
+
+
+def test_transcription_raises_while_the_breaker_is_open(whisper):
+    calls = []
+    whisper(lambda request: calls.append(request) or httpx.Response(200, json={"text": "hi"}))
+    breaker = resilience.get_breaker("whisper")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    with pytest.raises(UpstreamUnavailableError):
+        utils.transcribe_audio_bytes(b"RIFF")
+    assert calls == []
+
+
+@pytest.mark.parametrize("status", [400, 413, 415])
+def test_rejected_audio_is_422(whisper, status):
+    whisper(lambda request: httpx.Response(status, json={"error": "bad audio"}))
+    with pytest.raises(AudioRejectedError) as failed:
+        utils.process_audio_file(io.BytesIO(b"RIFF"))
+    assert failed.value.status_code == 422
+
+
+@pytest.mark.parametrize("response", [
+    httpx.Response(401, json={"error": "invalid api key"}),
+    httpx.Response(403),
+    httpx.Response(200, json={"error": "no text"}),
+    httpx.Response(200, text="<html>"),
+])
+def test_refused_or_garbled_transcription_is_502(whisper, response):
+    whisper(lambda request: response)
+    with pytest.raises(UpstreamRejectedError) as failed:
+        utils.transcribe_audio_bytes(b"RIFF")
+    assert failed.value.status_code == 502
+
+
+def test_call_upstream_reports_an_outage_once_retries_run_out(monkeypatch):
+    monkeypatch.setattr(config, "RETRY_BASE_DELAY_SECONDS", 0.0)
+    monkeypatch.setattr(config, "RETRY_MAX_ATTEMPTS", 3)
+    calls = []
+
+    def attempt(timeout):
+        calls.append(timeout)
+        raise httpx.ConnectError("connection refused")
+
+    with pytest.raises(UpstreamUnavailableError) as failed:
+        resilience.call_upstream("test-exhausted", attempt)
+    assert len(calls) == 3
+    assert isinstance(failed.value.__cause__, httpx.ConnectError)
+
+
+def test_call_upstream_passes_on_the_request_s_own_errors(monkeypatch):
+    def attempt(timeout):
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        resilience.call_upstream("test-own-error", attempt)
+
+
+def test_speech_raises_once_retries_are_used_up(whisper, monkeypatch):
+    monkeypatch.delitem(resilience.breakers, "elevenlabs", raising=False)
+    monkeypatch.setattr(config, "HEDGING_ENABLED", False)
+    whisper(lambda request: httpx.Response(503))
+    with pytest.raises(UpstreamUnavailableError) as failed:
+        utils._synthesize("Hello there.", "test-speech-outage")
+    assert failed.value.status_code == 503
+
+
+def overloaded(request):
+    return httpx.Response(503, json={"error": "overloaded"})
+
+
+def timing_out(request):
+    raise httpx.ReadTimeout("timed out", request=request)
+
+
+@pytest.mark.parametrize("failure, error, status", [
+    (overloaded, UpstreamUnavailableError, 503),
+    (timing_out, UpstreamTimeoutError, 504),
+])
+def test_llm_raises_once_every_backend_is_out_of_retries(monkeypatch, failure, error, status):
+    monkeypatch.setattr(config, "RETRY_BASE_DELAY_SECONDS", 0.0)
+    monkeypatch.setattr(config, "RETRY_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(config, "HEDGING_ENABLED", False)
+    client = httpx.Client(transport=httpx.MockTransport(failure))
+    llm = Router([Backend(f"test-llm-{status}-{index}", "model", "http://llm.test/v1", "key", client)
+                  for index in range(2)])
+    with pytest.raises(error) as failed:
+        llm.complete([{"role": "user", "content": "hi"}])
+    assert failed.value.status_code == status
@@ -0,0 +1,114 @@
+import httpx
+import pytest
+
+import config
+import resilience
+from providers import openai_sdk
+from router import Backend, BackendStats, Policy, Router
+
+COMPLETION = {
+    "id": "chatcmpl-test",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "model",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "Hello!"}, "finish_reason": "stop"}],
+}
+
+
+@pytest.fixture(autouse=True)
+def routing(monkeypatch):
+    monkeypatch.setattr(resilience, "breakers", {})
+    monkeypatch.setattr(config, "LLM_ROUTER_EXPLORE", 0.0)
+    monkeypatch.setattr(config, "HEDGING_ENABLED", False)
+    monkeypatch.setattr(config, "RETRY_BASE_DELAY_SECONDS", 0.0)
+    monkeypatch.setattr(config, "RETRY_MAX_ATTEMPTS", 1)
+
+
+def backend(name, client=None, api_key="key", **options):
+    client = client or httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(200, json=COMPLETION)))
+    return Backend(name, "model", f"http://{name}.test/v1", api_key, client, **options)
+
+
+def names(backends):
+    return [b.name for b in backends]
+
+
+def test_stats_are_exponentially_weighted():
+    stats = BackendStats("test-ewma", alpha=0.5)
+    stats.observe(1.0, failed=False)
+    assert stats.ttft == 1.0
+    stats.observe(0.5, failed=False)
+    assert stats.ttft == 0.75
+    stats.observe(None, failed=True)
+    assert stats.ttft == 0.75
+    assert stats.error_rate == 0.5
+
+
+def test_tier_selects_backends():
+    router = Router([backend("fast", tier="fast"), backend("standard"), backend("fast-unkeyed", api_key="", tier="fast")])
+    assert names(router.rank(Policy(tier="fast"))) == ["fast"]
+    assert names(router.rank(Policy(tier="standard"))) == ["standard"]
+    # A tier nobody configured falls back to the rest of the policy
+    assert sorted(names(router.rank(Policy(tier="premium")))) == ["fast", "standard"]
+
+
+def test_policy_filters_cost_and_family():
+    router = Router([backend("cheap", cost_per_mtok=0.5, family="llama"), backend("dear", cost_per_mtok=5.0, family="gpt")])
+    assert names(router.rank(Policy(max_cost_per_mtok=1.0))) == ["cheap"]
+    assert names(router.rank(Policy(family="gpt"))) == ["dear"]
+    assert router.rank(Policy(max_cost_per_mtok=1.0, family="gpt")) == []
+
+
+def test_fastest_first_and_unmeasured_before_all():
+    slow, fast, new = backend("slow"), backend("fast"), backend("new")
+    slow.stats.observe(0.9, failed=False)
+    fast.stats.observe(0.2, failed=False)
+    assert names(Router([slow, fast, new]).rank(Policy())) == ["new", "fast", "slow"]
+    # The averages move with new samples
+    for _ in range(10):
+        fast.stats.observe(2.0, failed=False)
+    assert names(Router([slow, fast]).rank(Policy())) == ["slow", "fast"]
+
+
+def test_open_circuit_backend_goes_last(monkeypatch):
+    monkeypatch.setattr(config, "BREAKER_FAILURE_THRESHOLD", 1)
+    broken, working = backend("broken"), backend("working")
+    broken.stats.observe(0.1, failed=False)
+    working.stats.observe(0.5, failed=False)
+    router = Router([broken, working])
+    assert names(router.rank(Policy())) == ["broken", "working"]
+    resilience.get_breaker("broken").record_failure()
+    assert names(router.rank(Policy())) == ["working", "broken"]
+    assert router.snapshot()["broken"]["healthy"] is False
+
+
+def test_fails_over_to_the_next_backend():
+    down = backend("down", httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(503))))
+    up = backend("up")
+    down.stats.observe(0.1, failed=False)
+    up.stats.observe(0.5, failed=False)
+    response = Router([down, up]).complete([{"role": "user", "content": "hi"}])
+    assert response.choices[0].message.content == "Hello!"
+    assert down.stats.error_rate > 0.0
+    assert up.stats.error_rate == 0.0
+
+
+def test_request_errors_do_not_fail_over():
+    calls = []
+
+    def refuse(request):
+        calls.append(request.url.host)
+        return httpx.Response(400, json={"error": {"message": "bad request"}})
+
+    first = backend("first", httpx.Client(transport=httpx.MockTransport(refuse)))
+    second = backend("second", httpx.Client(transport=httpx.MockTransport(refuse)))
+    first.stats.observe(0.1, failed=False)
+    second.stats.observe(0.5, failed=False)
+    with pytest.raises(openai_sdk.load().BadRequestError):
+        Router([first, second]).complete([{"role": "user", "content": "hi"}])
+    assert calls == ["first.test"]
+
+
+def test_no_backend_for_policy():
+    with pytest.raises(ValueError):
+        Router([backend("unkeyed", api_key="")]).complete([{"role": "user", "content": "hi"}])
@@ -0,0 +1,104 @@
+import pytest
+
+import config
+import speculation
+import utils
+from limiter import session_scope
+from speculation import SpeculationStore, predict_next
+
+
+@pytest.mark.parametrize("asked, expected", [
+    ([], ["life_story", "superpower"]),
+    (["life_story"], ["superpower", "growth_areas"]),
+    # Continues after the latest question, skipping what was asked already
+    (["life_story", "growth_areas"], ["misconception", "pushing_boundaries"]),
+    (["superpower", "pushing_boundaries"], ["life_story", "growth_areas"]),
+    (["small_talk"], ["life_story", "superpower"]),
+    (list(speculation.INTERVIEW_SCRIPT), []),
+])
+def test_predict_next(asked, expected):
+    assert predict_next(asked, 2) == expected
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(speculation.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_prepared_reply_is_served_once_for_its_question(clock):
+    store = SpeculationStore(max_sessions=10)
+    store.prepared("s", "superpower", "Listening.", "key")
+    assert store.observe_turn("s", "superpower", []) == "Listening."
+    assert store.observe_turn("s", "superpower", []) is None
+
+
+def test_other_questions_miss(clock):
+    store = SpeculationStore(max_sessions=10)
+    store.prepared("s", "superpower", "Listening.", "key")
+    assert store.observe_turn("s", "life_story", []) is None
+    # Any other message, whatever its wording
+    assert store.observe_turn("s", None, []) is None
+    # Nor is it served to another session
+    assert store.observe_turn("other", "superpower", []) is None
+    assert store.observe_turn("s", "superpower", []) == "Listening."
+
+
+def test_expired_reply_is_dropped_and_prepared_again(clock, monkeypatch):
+    monkeypatch.setattr(config, "SPECULATION_TTL_SECONDS", 60.0)
+    store = SpeculationStore(max_sessions=10)
+    store.observe_turn("s", "life_story", [])
+    store.prepared("s", "superpower", "Listening.", "key")
+    assert store.plan("s", 2) == ["growth_areas"]
+    clock[0] += 61.0
+    assert store.plan("s", 2) == ["superpower", "growth_areas"]
+    assert store.observe_turn("s", "superpower", []) is None
+
+
+def test_least_recent_sessions_are_evicted(clock):
+    store = SpeculationStore(max_sessions=2)
+    store.prepared("a", "superpower", "A", "key-a")
+    store.prepared("b", "superpower", "B", "key-b")
+    store.history("a")
+    store.prepared("c", "superpower", "C", "key-c")
+    assert store.observe_turn("a", "superpower", []) == "A"
+    assert store.observe_turn("b", "superpower", []) is None
+
+
+def test_budget_is_charged_and_refunded(monkeypatch):
+    monkeypatch.setattr(config, "SPECULATION_SESSION_CHAR_BUDGET", 100)
+    store = SpeculationStore(max_sessions=10)
+    assert store.charge("s", 80)
+    assert not store.charge("s", 30)
+    store.refund("s", 50)
+    assert store.charge("s", 30)
+
+
+@pytest.fixture
+def speculating(monkeypatch):
+    monkeypatch.setattr(config, "SPECULATION_ENABLED", True)
+    monkeypatch.setattr(config, "TURN_CANNED_ANSWERS", False)
+    monkeypatch.setattr(speculation, "store", SpeculationStore(max_sessions=10))
+    monkeypatch.setattr(utils, "_complete_reply", lambda plan, message, history: "Generated just now.")
+    speculation.store.prepared("s", "superpower", "Prepared earlier.", "key")
+
+
+def reply(message):
+    with session_scope("s"):
+        return utils.generate_ai_response(message, [])
+
+
+def test_prepared_reply_answers_the_question_asked_word_for_word(speculating):
+    assert reply("What's your #1 superpower?") == "Prepared earlier."
+
+
+@pytest.mark.parametrize("message", [
+    "What's your superpower at work, compared to your manager's?",
+    "Why is listening your superpower?",
+    "superpower",
+])
+def test_prepared_reply_is_never_served_for_a_different_transcript(speculating, message):
+    assert reply(message) == "Generated just now."
+    # Still there for when the question is actually asked
+    assert reply("What is your superpower?") == "Prepared earlier."
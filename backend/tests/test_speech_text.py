@@ -0,0 +1,78 @@
+import pytest
+
+from speech_text import normalize_for_speech, split_for_speech
+
+
+@pytest.mark.parametrize("text, spoken", [
+    ("Call +1 (555) 123-4567 today.", "Call plus 1, 5 5 5, 1 2 3, 4 5 6 7 today."),
+    ("Call (555) 123-4567.", "Call 5 5 5, 1 2 3, 4 5 6 7."),
+    ("Ring 555.123.4567 now", "Ring 5 5 5, 1 2 3, 4 5 6 7 now."),
+    ("Reach us on +44 20 7946 0958", "Reach us on plus 4 4, 2 0, 7 9 4 6, 0 9 5 8."),
+])
+def test_phone_numbers_are_read_digit_by_digit(text, spoken):
+    assert normalize_for_speech(text) == spoken
+
+
+@pytest.mark.parametrize("text", [
+    "I worked there in 2019 2020 2021 and 2022.",
+    "The ISBN is 978 3 16 148410 0.",
+    "ISBN 978-3-16-148410-0 is on the cover.",
+    "The release was on 2024-03-15.",
+    "We shipped 1234 5678 units.",
+])
+def test_other_numbers_are_left_alone(text):
+    assert normalize_for_speech(text) == text
+
+
+@pytest.mark.parametrize("text, spoken", [
+    ("I write C# and F# daily.", "I write C# and F# daily."),
+    ("The product a*b*c is small.", "The product a*b*c is small."),
+    ("**Bold** and *italic* and ***both***", "Bold and italic and both."),
+    ("# Heading\nSome text", "Heading. Some text."),
+    ("- one\n- two", "one. two."),
+    ("Ranked #1 for speed", "Ranked #1 for speed."),
+])
+def test_markdown_markers_are_stripped_only_where_they_are_markup(text, spoken):
+    assert normalize_for_speech(text) == spoken
+
+
+def test_speech_text_reads_amounts_in_words():
+    assert normalize_for_speech("Up 40% to $1.5M, 10-15 people") == "Up 40 percent to 1.5 million dollars, 10 to 15 people."
+
+
+def test_split_for_speech_keeps_chunks_under_the_limit():
+    text = " ".join(f"Sentence number {index} is here to be spoken aloud." for index in range(20))
+    chunks = split_for_speech(text, 120)
+    assert all(len(chunk) <= 120 for chunk in chunks)
+    assert " ".join(chunks) == text
+
+
+@pytest.mark.parametrize("text, spoken", [
+    ("See https://example.com/search?q=voice&lang=en", "See example.com."),
+    ("Visit <https://www.example.com/docs>.", "Visit example.com."),
+    ("Write to jane.doe@example.com & me", "Write to jane.doe at example.com and me."),
+    ("Tom & Jerry", "Tom and Jerry."),
+])
+def test_addresses_are_read_before_their_characters(text, spoken):
+    assert normalize_for_speech(text) == spoken
+
+
+@pytest.mark.parametrize("text, spoken", [
+    ("Compute 2^10", "Compute 2 to the power of 10."),
+    ("x^2 grows fast", "x to the power of 2 grows fast."),
+    ("Press ^C to stop", "Press ^C to stop."),
+    ("~5 minutes", "about 5 minutes."),
+    ("It costs ~$20", "It costs about 20 dollars."),
+])
+def test_operators_are_spoken_not_dropped(text, spoken):
+    assert normalize_for_speech(text) == spoken
+
+
+@pytest.mark.parametrize("text, spoken", [
+    ("if a<b and c>d then", "if a<b and c>d then."),
+    ("Use <b>bold</b> here", "Use bold here."),
+    ('<p>One <a href="/x">link</a></p><br>Two', "One link Two."),
+    ("Done</p>", "Done."),
+])
+def test_only_real_html_tags_are_stripped(text, spoken):
+    assert normalize_for_speech(text) == spoken
@@ -0,0 +1,159 @@
+import io
+import os
+import zipfile
+
+import numpy as np
+import pytest
+
+import config
+import stt_jobs
+from audio import encode_wav_pcm16
+from errors import UpstreamUnavailableError
+from jobs import DONE, FAILED, JobRunner, JobStore
+
+
+class StubRunner:
+    def __init__(self):
+        self.started = []
+
+    def start(self, job):
+        self.started.append(job)
+        return True
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path))
+    monkeypatch.setattr(stt_jobs, "store", store)
+    monkeypatch.setattr(stt_jobs, "runner", StubRunner())
+    return store
+
+
+def wav(seconds=0.1, rate=16000):
+    return encode_wav_pcm16(np.zeros(int(seconds * rate), dtype=np.float32), rate)
+
+
+def archive(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for name, data in entries.items():
+            zf.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def test_create_job_expands_zip_and_skips_non_audio(store):
+    audio = wav()
+    uploads = [
+        ("single.wav", io.BytesIO(audio)),
+        ("batch.zip", archive({
+            "calls/a.wav": audio,
+            "calls/notes.txt": b"not audio",
+            "__MACOSX/calls/._a.wav": audio,
+            "calls/.hidden.wav": audio,
+            "calls/b.mp3": b"ID3\x04\x00\x00\x00\x00\x00\x00" + b"\x00" * 32,
+        })),
+    ]
+    job = stt_jobs.create_job(uploads)
+
+    assert [item["name"] for item in job["items"]] == ["single.wav", "batch.zip/calls/a.wav", "batch.zip/calls/b.mp3"]
+    assert [item["format"] for item in job["items"]] == ["wav", "wav", "mp3"]
+    assert job["items"][0]["bytes"] == len(audio)
+    for item in job["items"]:
+        with open(stt_jobs.input_path(job["id"], item), "rb") as f:
+            assert len(f.read()) == item["bytes"]
+    assert stt_jobs.runner.started == [job]
+    assert store.get(job["id"])["items"] == job["items"]
+
+
+def test_create_job_rejects_non_audio_upload(store):
+    with pytest.raises(ValueError, match="neither a supported audio file nor a ZIP"):
+        stt_jobs.create_job([("notes.txt", io.BytesIO(b"hello there, not audio"))])
+
+
+def test_create_job_rejects_archive_without_audio(store):
+    with pytest.raises(ValueError, match="No audio files"):
+        stt_jobs.create_job([("notes.zip", archive({"notes.txt": b"just text"}))])
+    # Nothing is left behind
+    assert os.listdir(store.directory) == []
+
+
+def test_create_job_limits_items(store, monkeypatch):
+    monkeypatch.setattr(config, "JOBS_MAX_ITEMS", 2)
+    audio = wav()
+    with pytest.raises(ValueError, match="At most 2 files"):
+        stt_jobs.create_job([("batch.zip", archive({f"{index}.wav": audio for index in range(3)}))])
+    assert os.listdir(store.directory) == []
+
+
+def test_create_job_limits_bytes_across_files(store, monkeypatch):
+    audio = wav()
+    monkeypatch.setattr(config, "STT_JOB_MAX_BYTES", len(audio) * 2 - 1)
+    stt_jobs.create_job([("one.wav", io.BytesIO(audio))])
+    # Two files together go over, even though each fits on its own
+    with pytest.raises(ValueError, match="exceeds"):
+        stt_jobs.create_job([("one.wav", io.BytesIO(audio)), ("two.wav", io.BytesIO(audio))])
+
+
+def test_job_stats_totals_done_items():
+    job = {"items": [
+        {"status": DONE, "duration": 10.0, "speech_seconds": 8.0, "seconds": 1.0},
+        {"status": DONE, "duration": 5.0, "seconds": 0.5},
+        {"status": FAILED, "duration": 100.0, "seconds": 3.0},
+    ]}
+    assert stt_jobs.job_stats(job) == {
+        "audio_seconds": 15.0,
+        "speech_seconds": 13.0,
+        "processing_seconds": 1.5,
+        "realtime_factor": 0.1,
+    }
+
+
+def test_job_stats_without_finished_audio():
+    assert stt_jobs.job_stats({"items": [{"status": FAILED}]})["realtime_factor"] is None
+
+
+def run_job(store, job, handler):
+    runner = JobRunner(store, max_workers=1)
+    runner.register(stt_jobs.KIND, handler, stt_jobs.discard_input)
+    assert runner.start(job)
+    # The claim is given up once the last item is finished and cleaned up
+    while os.path.exists(store.path(job["id"], ".lock")):
+        store.wait_for_change(0.05)
+    runner.shutdown()
+    return store.get(job["id"])
+
+
+def test_failed_item_input_is_discarded(store, monkeypatch):
+    monkeypatch.setattr(config, "JOBS_ITEM_ATTEMPTS", 1)
+    job = stt_jobs.create_job([("a.wav", io.BytesIO(wav()))])
+    directory = store.path(job["id"], "")
+
+    def fail(job_id, params, item):
+        raise RuntimeError("whisper said no")
+
+    finished = run_job(store, job, fail)
+    assert finished["items"][0]["status"] == FAILED
+    # The upload and the job's directory are gone even though the item failed
+    assert not os.path.exists(directory)
+
+
+def test_input_is_kept_for_retries(store, monkeypatch):
+    monkeypatch.setattr(config, "JOBS_ITEM_ATTEMPTS", 2)
+    monkeypatch.setattr("jobs.time.sleep", lambda seconds: None)
+    job = stt_jobs.create_job([("a.wav", io.BytesIO(wav()))])
+    path = stt_jobs.input_path(job["id"], job["items"][0])
+    attempts = []
+
+    def flaky(job_id, params, item):
+        # The retry still finds the upload
+        assert os.path.exists(path)
+        attempts.append(item["index"])
+        if len(attempts) == 1:
+            raise UpstreamUnavailableError("whisper is unavailable")
+        return {"text": "hello"}
+
+    finished = run_job(store, job, flaky)
+    assert attempts == [0, 0]
+    assert finished["items"][0]["status"] == DONE
+    assert not os.path.exists(path)
@@ -0,0 +1,40 @@
+import pytest
+from starlette.testclient import TestClient
+
+import config
+import main
+import tts_jobs
+
+KEY = "ab" * 32
+AUDIO = b"\xff\xfb\x90\x00" + b"\x00" * 412
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "JOBS_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "SPECULATION_ENABLED", False)
+    monkeypatch.setattr(main, "generate_speech_with_key", lambda text: (KEY, AUDIO))
+    return TestClient(main.app)
+
+
+def test_unstored_audio_has_no_content_location(client):
+    response = client.post("/api/text-to-speech", data={"text": "Hello"})
+    assert response.status_code == 200
+    assert response.content == AUDIO
+    # Only this worker's cache has it, so there is no URL to give out
+    assert "content-location" not in response.headers
+
+
+def test_stored_audio_is_linked(client):
+    tts_jobs.store_audio(KEY, AUDIO)
+    response = client.post("/api/text-to-speech", data={"text": "Hello"})
+    assert response.headers["content-location"] == f"/api/audio/{KEY}"
+
+
+def test_redirect_stores_audio_before_linking_it(client):
+    response = client.post("/api/text-to-speech?redirect=true", data={"text": "Hello"}, follow_redirects=False)
+    assert response.status_code == 303
+    assert response.headers["location"] == f"/api/audio/{KEY}"
+    assert tts_jobs.stored_audio(KEY) == AUDIO
+    # Served from disk, so any worker can answer it, whatever its cache holds
+    assert client.get(response.headers["location"]).content == AUDIO
@@ -0,0 +1,76 @@
+import pytest
+
+import config
+import speculation
+from utils import classify_turn, detect_interview_question_type, match_interview_question
+
+
+@pytest.fixture
+def canned_answers(monkeypatch):
+    monkeypatch.setattr(config, "TURN_ROUTING_ENABLED", True)
+    monkeypatch.setattr(config, "TURN_CANNED_ANSWERS", True)
+
+
+def test_standard_questions_go_to_the_llm_unless_canned_answers_are_on(monkeypatch):
+    monkeypatch.setattr(config, "TURN_ROUTING_ENABLED", True)
+    monkeypatch.setattr(config, "TURN_CANNED_ANSWERS", False)
+    plan = classify_turn("Tell me about yourself")
+    assert plan.canned_answer is None
+    assert plan.max_tokens > 0
+
+
+@pytest.mark.parametrize("message, question_type", [
+    ("Tell me about yourself.", "life_story"),
+    ("What's your number one superpower?", "superpower"),
+    ("What’s your #1 superpower?", "superpower"),
+    ("  what are the top three areas you'd like to GROW in ", "growth_areas"),
+    ("How do you push your boundaries and limits?", "pushing_boundaries"),
+])
+def test_standard_questions_get_stored_answers(canned_answers, message, question_type):
+    plan = classify_turn(message)
+    assert plan.turn_class == "canned"
+    assert plan.question_type == question_type
+    assert plan.canned_answer
+
+
+@pytest.mark.parametrize("message", [
+    "How can I improve my Python code?",
+    "What are the limits of GPT-4?",
+    "Explain the development of the transistor",
+    "Where did you grow up?",
+    "Tell me about yourself in one word, then explain quantum tunnelling",
+])
+def test_other_questions_go_to_the_llm(canned_answers, message):
+    plan = classify_turn(message)
+    assert plan.turn_class != "canned"
+    assert plan.canned_answer is None
+    assert plan.max_tokens > 0
+
+
+def test_match_interview_question_is_whole_question_only():
+    assert match_interview_question("What is your superpower") == "superpower"
+    assert match_interview_question("What is your superpower in a team of five?") is None
+
+
+@pytest.mark.parametrize("message, turn_class", [
+    ("Hi there!", "greeting"),
+    ("Where did you study?", "persona"),
+    ("Explain how a transformer model works", "open"),
+])
+def test_class_picks_tier_and_reply_length(monkeypatch, message, turn_class):
+    monkeypatch.setattr(config, "TURN_ROUTING_ENABLED", True)
+    plan = classify_turn(message)
+    assert plan.turn_class == turn_class
+    assert plan.tier == config.TURN_TIERS[turn_class]
+    assert plan.max_tokens == config.TURN_MAX_TOKENS[turn_class]
+
+
+def test_growth_detection_ignores_grow_up():
+    assert detect_interview_question_type("Where did you grow up?") is None
+
+
+def test_scripted_questions_map_to_their_type():
+    # Prepared replies are looked up by the type of the question as asked
+    for question_type, question in speculation.SCRIPT_QUESTIONS.items():
+        assert match_interview_question(question) == question_type
+    assert match_interview_question("Where did you grow up?") is None
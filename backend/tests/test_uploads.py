@@ -0,0 +1,185 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from audio import encode_wav_pcm16, mp3_bitrate, sniff_audio_format
+from uploads import UploadGuardMiddleware
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz: 417 bytes per frame
+MP3_FRAME = b"\xff\xfb\x90\x00" + b"\x55" * 413
+ID3_TAG = b"ID3\x04\x00\x00\x00\x00\x00\x14" + b"\x00" * 20
+
+
+async def upload(request: Request):
+    body = await request.body()
+    return JSONResponse({"received": len(body)})
+
+
+def client(**options):
+    app = Starlette(routes=[Route("/upload", upload, methods=["POST"])])
+    return TestClient(UploadGuardMiddleware(app, paths=["/upload"], **options))
+
+
+def chunks(data: bytes, size: int = 1024):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def test_size_only_guard_accepts_archives():
+    response = client(max_bytes=4096, audio_only=False).post(
+        "/upload", content=b"PK\x03\x04" + b"\x00" * 1000, headers={"Content-Type": "application/zip"})
+    assert response.status_code == 200
+    assert response.json() == {"received": 1004}
+
+
+def test_size_only_guard_refuses_oversized_stream():
+    # No Content-Length, so the limit is enforced as the body streams in
+    response = client(max_bytes=4096, audio_only=False).post(
+        "/upload", content=chunks(b"PK\x03\x04" + b"\x00" * 8192), headers={"Content-Type": "application/zip"})
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize("head, audio_format", [
+    (encode_wav_pcm16(np.zeros(8, dtype=np.float32), 16000), "wav"),
+    (b"OggS\x00\x02" + b"\x00" * 10, "ogg"),
+    (b"\x1a\x45\xdf\xa3" + b"\x00" * 12, "webm"),
+    (b"fLaC" + b"\x00" * 12, "flac"),
+    (b"\x00\x00\x00\x20ftypM4A " + b"\x00" * 4, "m4a"),
+    (ID3_TAG, "mp3"),
+    (MP3_FRAME[:16], "mp3"),
+    (b"PK\x03\x04" + b"\x00" * 12, None),
+    (b"<html><body>", None),
+    (b"", None),
+])
+def test_sniff_audio_format(head, audio_format):
+    assert sniff_audio_format(head) == audio_format
+
+
+@pytest.mark.parametrize("head, bitrate", [
+    (MP3_FRAME, 128000),
+    # Behind an ID3v2 tag
+    (ID3_TAG + MP3_FRAME, 128000),
+    # MPEG-2 Layer III, 64 kbps
+    (b"\xff\xf3\x80\x00" + b"\x00" * 12, 64000),
+    # The bytes inside the tag are not mistaken for a frame
+    (b"ID3\x04\x00\x00\x00\x00\x00\x04\xff\xfb\x90\x00", None),
+    (b"\x00" * 64, None),
+])
+def test_mp3_bitrate(head, bitrate):
+    assert mp3_bitrate(head) == bitrate
+
+
+def guarded(body_received):
+    async def app(scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        body_received.append(len(body))
+        response = JSONResponse({"received": len(body)})
+        await response(scope, receive, send)
+    return app
+
+
+def post(middleware, body_chunks, content_type="application/octet-stream", content_length=None):
+    """Send a request through the middleware at the ASGI level, counting the body chunks it reads."""
+    headers = [(b"content-type", content_type.encode())]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    scope = {"type": "http", "method": "POST", "path": "/upload", "headers": headers, "query_string": b""}
+    pending = list(body_chunks)
+    read = []
+    sent = []
+
+    async def receive():
+        if not pending:
+            return {"type": "http.disconnect"}
+        chunk = pending.pop(0)
+        read.append(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    status = sent[0]["status"]
+    body = json.loads(b"".join(message.get("body", b"") for message in sent[1:]))
+    return status, body, len(read)
+
+
+def test_content_length_over_the_limit_is_refused_unread():
+    received = []
+    middleware = UploadGuardMiddleware(guarded(received), paths=["/upload"], max_bytes=1000)
+    status, body, read = post(middleware, [b"RIFF" + b"\x00" * 2000], content_length=2004)
+    assert (status, read, received) == (413, 0, [])
+    assert "1000 bytes" in body["detail"]
+
+
+def test_oversized_streamed_body_is_refused():
+    received = []
+    middleware = UploadGuardMiddleware(guarded(received), paths=["/upload"], max_bytes=4096)
+    status, _, read = post(middleware, [MP3_FRAME] * 30)
+    assert status == 413
+    # Stopped at the chunk that crossed the limit
+    assert read == 10
+    assert received == []
+
+
+@pytest.mark.parametrize("content_type, body", [
+    ("application/octet-stream", b"just some text, not audio at all"),
+    ("multipart/form-data; boundary=x",
+     b'--x\r\nContent-Disposition: form-data; name="file"; filename="a.txt"\r\n\r\nnot audio at all\r\n--x--\r\n'),
+])
+def test_unsupported_format_is_refused(content_type, body):
+    received = []
+    middleware = UploadGuardMiddleware(guarded(received), paths=["/upload"])
+    status, _, _ = post(middleware, [body], content_type)
+    assert status == 415
+    assert received == []
+
+
+def test_overlong_wav_is_refused_from_its_header():
+    # 16 kHz 16-bit mono is 32000 bytes a second; the header says so up front
+    header = encode_wav_pcm16(np.zeros(0, dtype=np.float32), 16000)
+    received = []
+    middleware = UploadGuardMiddleware(guarded(received), paths=["/upload"], max_seconds=1.0)
+    status, body, read = post(middleware, [header] + [b"\x00" * 8000] * 20)
+    assert status == 413
+    assert "1 seconds" in body["detail"]
+    # Refused as soon as the body passed one second of audio, not at its end
+    assert read == 6
+    assert received == []
+
+
+def test_overlong_mp3_is_refused_from_its_bitrate():
+    received = []
+    middleware = UploadGuardMiddleware(guarded(received), paths=["/upload"], max_seconds=1.0)
+    # 128 kbps is 16000 bytes a second, plus slack for VBR files
+    status, _, read = post(middleware, [MP3_FRAME * 10] * 10)
+    assert status == 413
+    assert read == 5
+
+
+def test_audio_within_limits_passes():
+    received = []
+    middleware = UploadGuardMiddleware(guarded(received), paths=["/upload"], max_seconds=10.0)
+    wav = encode_wav_pcm16(np.zeros(16000, dtype=np.float32), 16000)
+    status, body, _ = post(middleware, [wav[:1000], wav[1000:]])
+    assert status == 200
+    assert body == {"received": len(wav)} and received == [len(wav)]
+
+
+def test_other_paths_are_not_guarded():
+    received = []
+    middleware = UploadGuardMiddleware(guarded(received), paths=["/elsewhere"], max_bytes=10)
+    status, _, _ = post(middleware, [b"plain text body"])
+    assert status == 200
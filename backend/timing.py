@@ -0,0 +1,216 @@
+import contextvars
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from metrics import STAGE_SECONDS, UPSTREAM_REQUESTS, UPSTREAM_SECONDS
+from ratelimit import admission
+
+logger = logging.getLogger(__name__)
+
+# Phases recorded for each stage
+PHASE_QUEUE = "queue"      # waiting for a worker thread
+PHASE_LIMIT = "limit"      # waiting for an upstream concurrency slot
+PHASE_CONNECT = "connect"  # TCP + TLS setup to the upstream
+PHASE_TTFB = "ttfb"        # request sent until upstream response headers
+PHASE_TOTAL = "total"      # whole stage, including the above
+
+# Timings collected for the current request, and the stage being executed
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("request_timings", default=None)
+_current_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_stage", default=None)
+# Called when the upstream request made in this context gets its response headers
+_first_byte_listener: contextvars.ContextVar[Optional[Callable[[], None]]] = contextvars.ContextVar("first_byte_listener", default=None)
+
+
+def record(stage: str, phase: str, seconds: float):
+    """Record one phase duration into its histogram and the current request's timings."""
+    STAGE_SECONDS.labels(stage, phase).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        name = stage if phase == PHASE_TOTAL else f"{stage}-{phase}"
+        timings.append((name, seconds * 1000.0))
+
+
+def snapshot() -> Dict[str, Dict[str, Optional[float]]]:
+    """Summaries of every stage histogram in milliseconds, keyed as 'stage.phase'."""
+    summaries = {}
+    for (stage, phase), child in sorted(STAGE_SECONDS.children()):
+        _, count, total = child.state()
+        summaries[f"{stage}.{phase}"] = {
+            "count": count,
+            "mean_ms": round(total / count * 1000.0, 2) if count else None,
+            "p50_ms": _to_ms(child.percentile(0.50)),
+            "p95_ms": _to_ms(child.percentile(0.95)),
+            "p99_ms": _to_ms(child.percentile(0.99)),
+        }
+    return summaries
+
+
+def current_stage() -> Optional[str]:
+    """The stage active in the calling context, if any."""
+    return _current_stage.get()
+
+
+def _to_ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000.0, 1)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Time a block as `stage`; upstream calls made inside it are attributed to it."""
+    token = _current_stage.set(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, PHASE_TOTAL, time.perf_counter() - start)
+        _current_stage.reset(token)
+
+
+@contextmanager
+def first_byte_listener(callback: Callable[[], None]) -> Iterator[None]:
+    """
+    Call `callback` when an upstream request made inside the block receives
+    its response headers. Listeners of enclosing blocks are still called.
+    """
+    outer = _first_byte_listener.get()
+    if outer is not None:
+        inner = callback
+
+        def callback():
+            inner()
+            outer()
+    token = _first_byte_listener.set(callback)
+    try:
+        yield
+    finally:
+        _first_byte_listener.reset(token)
+
+
+def notify_first_byte():
+    """Signal the current context's first-byte listener, if any. Called by upstream transports."""
+    callback = _first_byte_listener.get()
+    if callback is not None:
+        callback()
+
+
+def timed(stage: str):
+    """Decorator form of stage_timer."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def run_blocking(stage: str, func, *args):
+    """
+    Run a blocking call in the threadpool, recording how long it waited for a
+    worker thread as the stage's queue phase. The wait also feeds admission
+    control.
+    """
+    submitted = time.perf_counter()
+
+    def call():
+        waited = time.perf_counter() - submitted
+        record(stage, PHASE_QUEUE, waited)
+        admission.observe(waited)
+        return func(*args)
+
+    return await run_in_threadpool(call)
+
+
+def submit_with_context(executor, func, *args):
+    """executor.submit that carries the caller's context (request timings, stage) into the worker."""
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+
+class TracingTransport(httpx.HTTPTransport):
+    """
+    httpx transport that records connection setup and time to first byte for
+    every upstream request, using httpcore's trace extension. Durations are
+    attributed to the stage active in the calling thread, and per-upstream
+    latency and outcome are counted in metrics.
+    """
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        stage = _current_stage.get()
+        upstream = request.url.host
+        started = time.perf_counter()
+        marks: Dict[str, float] = {}
+        previous_trace = request.extensions.get("trace")
+
+        def trace(event_name: str, info: dict):
+            now = time.perf_counter()
+            if event_name in ("connection.connect_tcp.started", "connection.connect_unix_socket.started"):
+                marks["connect"] = now
+            elif event_name == "connection.start_tls.complete" or event_name.endswith("connect_tcp.complete"):
+                if "connect" in marks:
+                    marks["connected"] = now
+            elif event_name.endswith("receive_response_headers.complete"):
+                marks["headers"] = now
+            if previous_trace is not None:
+                previous_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            UPSTREAM_REQUESTS.labels(upstream, "error").inc()
+            raise
+
+        notify_first_byte()
+        outcome = "error" if response.status_code >= 500 or response.status_code == 429 else "ok"
+        UPSTREAM_REQUESTS.labels(upstream, outcome).inc()
+        UPSTREAM_SECONDS.labels(upstream).observe(marks.get("headers", time.perf_counter()) - started)
+
+        if stage is not None:
+            if "connect" in marks and "connected" in marks:
+                record(stage, PHASE_CONNECT, marks["connected"] - marks["connect"])
+            if "headers" in marks:
+                record(stage, PHASE_TTFB, marks["headers"] - marks.get("connected", started))
+        return response
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that collects the stage timings recorded while handling a
+    request and returns them in a Server-Timing header, together with the
+    overall app time. The request duration itself is recorded as the
+    'request' stage.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                app_ms = (time.perf_counter() - start) * 1000.0
+                entries = [f"{name};dur={duration:.1f}" for name, duration in timings]
+                entries.append(f"app;dur={app_ms:.1f}")
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", ", ".join(entries).encode("latin-1")))
+                # Let cross-origin frontends read the header
+                headers.append((b"timing-allow-origin", b"*"))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record("request", PHASE_TOTAL, time.perf_counter() - start)
+            _request_timings.reset(token)
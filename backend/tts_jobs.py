@@ -0,0 +1,139 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from typing import Any, Dict, List, Optional
+
+import config
+from cache import tts_cache
+from jobs import DONE, runner, store
+from utils import DEFAULT_SPEECH, TTS_OUTPUT_FORMATS, SpeechOptions, render_speech, speech_text
+
+KIND = "tts"
+
+_VOICE_ID = re.compile(r"^[A-Za-z0-9]{1,64}$")
+_CONTENT_HASH = re.compile(r"^[0-9a-f]{64}$")
+
+# Striped by cache key, so a text repeated within a job or across jobs is
+# synthesized once and the other items find it stored
+_render_locks = [threading.Lock() for _ in range(64)]
+
+
+def audio_path(content_hash: str) -> str:
+    """Where rendered audio is stored, by tts_cache key; shared by all jobs."""
+    return os.path.join(config.JOBS_DIR, "audio", content_hash + ".mp3")
+
+
+def stored_audio(content_hash: str) -> Optional[bytes]:
+    """Audio a job rendered, or None."""
+    if not _CONTENT_HASH.match(content_hash):
+        return None
+    try:
+        with open(audio_path(content_hash), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def is_stored(content_hash: str) -> bool:
+    return os.path.exists(audio_path(content_hash))
+
+
+def store_audio(content_hash: str, audio: bytes):
+    """Keep audio on disk, where every worker can serve it from /api/audio."""
+    path = audio_path(content_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(audio)
+    os.replace(temporary, path)
+
+
+def render_item(job_id: str, params: Dict[str, Any], item: Dict[str, Any]) -> Dict[str, Any]:
+    options = SpeechOptions(params["voice_id"], params["output_format"])
+    text = speech_text(item["text"])
+    key = options.cache_key(text)
+    with _render_locks[int(key[:8], 16) % len(_render_locks)]:
+        path = audio_path(key)
+        if os.path.exists(path):
+            return {"content_hash": key, "bytes": os.path.getsize(path), "cached": True}
+        audio = tts_cache.get(key)
+        cached = audio is not None
+        if audio is None:
+            audio = render_speech(text, key, options)
+        store_audio(key, audio)
+    return {"content_hash": key, "bytes": len(audio), "cached": cached}
+
+
+def create_job(texts: List[str], voice_id: Optional[str] = None,
+               output_format: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Queue a batch of texts to be rendered to speech.
+
+    Texts already in tts_cache or rendered by an earlier job are not
+    synthesized again.
+
+    Args:
+        texts (List[str]): Texts to render, in order
+        voice_id (Optional[str]): ElevenLabs voice; defaults to the bot's voice
+        output_format (Optional[str]): One of TTS_OUTPUT_FORMATS
+
+    Returns:
+        Dict[str, Any]: The new job
+
+    Raises:
+        ValueError: The batch is empty, too large, or names an unknown format
+    """
+    voice_id = voice_id or DEFAULT_SPEECH.voice_id
+    output_format = output_format or DEFAULT_SPEECH.output_format
+    if not texts:
+        raise ValueError("No texts provided")
+    if len(texts) > config.JOBS_MAX_ITEMS:
+        raise ValueError(f"At most {config.JOBS_MAX_ITEMS} texts per job")
+    for index, text in enumerate(texts):
+        if not text.strip():
+            raise ValueError(f"Text {index} is empty")
+        if len(text) > config.TTS_JOB_MAX_TEXT_CHARS:
+            raise ValueError(f"Text {index} is longer than {config.TTS_JOB_MAX_TEXT_CHARS} characters")
+    if not _VOICE_ID.match(voice_id):
+        raise ValueError("Invalid voice_id")
+    if output_format not in TTS_OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {', '.join(TTS_OUTPUT_FORMATS)}")
+
+    job = store.create(KIND, {"voice_id": voice_id, "output_format": output_format}, [{"text": text} for text in texts])
+    runner.start(job)
+    return job
+
+
+def job_audio(job: Dict[str, Any], content_hash: str) -> Optional[bytes]:
+    """Audio of one of the job's finished items, by content hash."""
+    if not any(item.get("content_hash") == content_hash for item in job["items"] if item["status"] == DONE):
+        return None
+    return stored_audio(content_hash)
+
+
+def build_archive(job: Dict[str, Any]) -> str:
+    """
+    Write a ZIP of the job's finished items to a temporary file and return its path.
+
+    Entries are 0000.mp3, 0001.mp3, ... by item index, plus manifest.json
+    listing every item with its text, status, content hash and file.
+    """
+    manifest = []
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".zip") as temp_file:
+        # MP3 doesn't compress further; storing keeps building the archive cheap
+        with zipfile.ZipFile(temp_file, "w", compression=zipfile.ZIP_STORED) as archive:
+            for item in job["items"]:
+                entry = {key: item.get(key) for key in ("index", "text", "status", "content_hash", "error")}
+                audio = stored_audio(item["content_hash"]) if item["status"] == DONE else None
+                if audio is not None:
+                    entry["file"] = f"{item['index']:04d}.mp3"
+                    archive.writestr(entry["file"], audio)
+                manifest.append(entry)
+            archive.writestr("manifest.json", json.dumps({"job_id": job["id"], "params": job["params"], "items": manifest}, indent=2))
+        return temp_file.name
+
+
+runner.register(KIND, render_item)
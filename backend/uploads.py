@@ -0,0 +1,184 @@
+import logging
+import struct
+from typing import Iterable, Optional
+
+from fastapi.responses import JSONResponse
+
+import config
+from audio import WavFormatError, mp3_bitrate, read_wav_header, sniff_audio_format
+from metrics import UPLOAD_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+# How much of the body we hold on to while looking for the file header. Part
+# headers plus a WAV header with a LIST chunk fit comfortably.
+SNIFF_LIMIT_BYTES = 64 * 1024
+
+# MP3 duration is estimated from the first frame's bitrate; allow for VBR files
+# whose first frame is below their average.
+MP3_BITRATE_SLACK = 1.25
+
+
+class UploadRejected(Exception):
+    """Raised from the guarded receive channel when an upload breaks a limit."""
+    def __init__(self, status_code: int, reason: str, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        self.detail = detail
+
+
+class _UploadInspector:
+    """
+    Incrementally inspects a request body as it arrives.
+
+    Finds the start of the uploaded file (the first multipart part with a
+    filename, or the body itself for raw uploads), sniffs its container, and
+    derives a byte budget from UPLOAD_MAX_SECONDS where the format allows it.
+    With `sniff` off only the size is checked.
+    """
+    def __init__(self, content_type: bytes, max_bytes: int, max_seconds: float, sniff: bool = True):
+        self.multipart = content_type.lower().startswith(b"multipart/")
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.received = 0
+        self.head = bytearray()
+        self.sniffing = sniff
+        self.duration_limit: Optional[int] = None
+        self.format: Optional[str] = None
+
+    def feed(self, chunk: bytes, more_body: bool):
+        self.received += len(chunk)
+        if self.received > self.max_bytes:
+            raise UploadRejected(413, "too_large", f"Upload exceeds {self.max_bytes} bytes")
+
+        if self.sniffing:
+            self.head += chunk[:SNIFF_LIMIT_BYTES - len(self.head)]
+            self._sniff(final=not more_body or len(self.head) >= SNIFF_LIMIT_BYTES)
+
+        if self.duration_limit is not None and self.received > self.duration_limit:
+            raise UploadRejected(413, "too_long", f"Audio exceeds {self.max_seconds:g} seconds")
+
+    def _file_start(self) -> Optional[int]:
+        if not self.multipart:
+            return 0
+        marker = self.head.find(b'filename="')
+        if marker < 0:
+            return None
+        end_of_headers = self.head.find(b"\r\n\r\n", marker)
+        return None if end_of_headers < 0 else end_of_headers + 4
+
+    def _sniff(self, final: bool):
+        start = self._file_start()
+        if start is None:
+            if final:
+                # No file part in range; let the endpoint's validation deal with it
+                self._stop()
+            return
+
+        file_head = bytes(self.head[start:])
+        if len(file_head) < 16 and not final:
+            return
+
+        self.format = sniff_audio_format(file_head)
+        if self.format is None:
+            raise UploadRejected(415, "unsupported_format", "Unsupported audio format")
+
+        if self.format == "wav":
+            try:
+                header = read_wav_header(file_head)
+            except (WavFormatError, struct.error):
+                if not final:
+                    return
+                header = None
+            if header is not None:
+                byte_rate = header.sample_rate * header.block_align
+                self.duration_limit = start + header.data_offset + int(self.max_seconds * byte_rate)
+        elif self.format == "mp3":
+            bitrate = mp3_bitrate(file_head)
+            if bitrate is None and not final:
+                return
+            if bitrate:
+                self.duration_limit = start + int(self.max_seconds * bitrate / 8 * MP3_BITRATE_SLACK)
+        self._stop()
+
+    def _stop(self):
+        self.sniffing = False
+        self.head = bytearray()
+
+
+class UploadGuardMiddleware:
+    """
+    ASGI middleware that rejects oversized, overlong or non-audio uploads while
+    the body is still streaming in, before the form parser buffers it.
+
+    A Content-Length over the limit is refused without reading the body at
+    all. Otherwise every chunk passes through an inspector; once it objects,
+    the receive channel raises, whatever the app tries to send is dropped and
+    a 413 or 415 is returned instead.
+
+    With `audio_only` off, e.g. for endpoints that also take ZIP archives,
+    only the size limit applies.
+    """
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = config.UPLOAD_MAX_BYTES,
+                 max_seconds: float = config.UPLOAD_MAX_SECONDS, audio_only: bool = True):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.audio_only = audio_only
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(scope, receive, send, UploadRejected(413, "too_large", f"Upload exceeds {self.max_bytes} bytes"))
+            return
+
+        inspector = _UploadInspector(headers.get(b"content-type", b""), self.max_bytes, self.max_seconds,
+                                     sniff=self.audio_only)
+        rejection: Optional[UploadRejected] = None
+        response_started = False
+
+        async def guarded_receive():
+            nonlocal rejection
+            message = await receive()
+            if message["type"] == "http.request":
+                try:
+                    inspector.feed(message.get("body", b""), message.get("more_body", False))
+                except UploadRejected as exc:
+                    rejection = exc
+                    raise
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if rejection is not None:
+                # The app turned our exception into its own error response
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, guarded_receive, guarded_send)
+        except Exception:
+            if rejection is None:
+                raise
+
+        if rejection is not None and not response_started:
+            await self._reject(scope, receive, send, rejection)
+
+    async def _reject(self, scope, receive, send, rejection: UploadRejected):
+        UPLOAD_REJECTIONS.labels(rejection.reason).inc()
+        logger.warning(f"Rejected upload to {scope['path']}: {rejection.detail}")
+        response = JSONResponse(
+            status_code=rejection.status_code,
+            content={"detail": rejection.detail},
+            headers={"Connection": "close"}
+        )
+        await response(scope, receive, send)
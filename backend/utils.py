@@ -1,10 +1,59 @@
 import os
 import logging
-import tempfile
-import requests
-from openai import OpenAI
-from elevenlabs import generate, set_api_key
-from typing import Dict, List, Any, Optional
+import re
+import string
+import time
+import httpx
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Any, NamedTuple, Optional, Tuple
+
+import config
+from audio import Mp3FormatError, Segment, concatenate_mp3, downmix, encode_wav_pcm16, parse_wav, split_on_silence
+from cache import content_hash, tts_cache
+from cancellation import CancellableTransport, count_cancelled, current_token
+from cassette import upstream_transport
+from errors import AudioRejectedError, RateLimitedError, RequestCancelledError, UpstreamRejectedError, UpstreamUnavailableError
+from hedging import hedged
+from limiter import ELEVENLABS, WHISPER, current_session, limiters
+from ratelimit import admission
+from resilience import RETRYABLE_STATUSES, call_upstream, stage_deadline, upstream_timeout
+from router import Policy, build_router
+from speech_text import normalize_for_speech, split_for_speech
+import speculation
+from metrics import AUDIO_BYTES, LLM_TOKENS, LLM_TURN_SECONDS, LLM_TURN_TOKENS, LLM_TURNS, SPECULATION, TTS_CHUNKS
+from timing import TracingTransport, stage_timer, submit_with_context, timed
+
+# ElevenLabs premade voice "Adam". Using the ID directly saves the voice
+# lookup round trip the SDK makes when given a name.
+ELEVENLABS_VOICE_ID = "pNInz6obpgDQGcFmaJgB"
+ELEVENLABS_MODEL = "eleven_monolingual_v1"
+ELEVENLABS_OUTPUT_FORMAT = "mp3_44100_128"
+
+# Output formats speech can be rendered in; all MP3, so chunked replies can be joined
+TTS_OUTPUT_FORMATS = ("mp3_22050_32", "mp3_44100_32", "mp3_44100_64", "mp3_44100_96", "mp3_44100_128", "mp3_44100_192")
+
+class SpeechOptions(NamedTuple):
+    """Voice and output format to synthesize with."""
+    voice_id: str = ELEVENLABS_VOICE_ID
+    output_format: str = ELEVENLABS_OUTPUT_FORMAT
+
+    def cache_key(self, text: str) -> str:
+        """tts_cache key for `text` (as passed through speech_text) spoken with these options."""
+        return content_hash(self.voice_id, ELEVENLABS_MODEL, self.output_format, text)
+
+DEFAULT_SPEECH = SpeechOptions()
+
+# One pooled client for every upstream call, so connections are reused across
+# requests and connect/TTFB are traced per stage. In record or replay mode the
+# transport also saves or serves the exchanges from a cassette. Calls for a
+# request whose client has gone away are skipped or cut off.
+http_client = httpx.Client(
+    transport=CancellableTransport(upstream_transport(TracingTransport())),
+    timeout=httpx.Timeout(120.0, connect=10.0),
+)
+
+# Picks the LLM backend for each reply from config.LLM_BACKENDS
+llm_router = build_router(http_client)
 
 # Configure logging
 def setup_logging():
@@ -21,90 +70,412 @@ def validate_api_keys():
     if not ELEVENLABS_API_KEY:
         raise ValueError("ELEVENLABS_API_KEY not found in environment variables")
     
-    # Set ElevenLabs API key
-    set_api_key(ELEVENLABS_API_KEY)
-    
     return OPENAI_API_KEY, ELEVENLABS_API_KEY
 
+# Whisper statuses meaning the audio itself was refused, not our request
+AUDIO_REJECTED_STATUSES = frozenset({400, 413, 415, 422})
+
+@timed("stt")
+def transcribe_audio_bytes(data: bytes, filename: str = "audio.wav") -> str:
+    """
+    Send one audio file to the Whisper transcription API.
+
+    Args:
+        data (bytes): The audio file contents
+        filename (str): File name reported upstream; Whisper uses its extension
+
+    Returns:
+        str: The transcript
+
+    Raises:
+        AudioRejectedError: Whisper could not process the audio (422)
+        UpstreamRejectedError: Whisper refused the request, e.g. a bad API key,
+            or answered with something that isn't a transcript (502)
+        UpstreamUnavailableError: Whisper's circuit is open, or it kept failing
+            until the retries ran out (503)
+        UpstreamTimeoutError: No attempt finished within the stage's time budget (504)
+    """
+    OPENROUTER_API_KEY = config.OPENROUTER_API_KEY
+    AUDIO_BYTES.labels("stt").inc(len(data))
+
+    def attempt(timeout: float) -> httpx.Response:
+        with limiters[WHISPER].slot(timeout):
+            response = http_client.post(
+                f"{config.WHISPER_BASE_URL}/audio/transcriptions",
+                headers={"Authorization": f"Bearer {OPENROUTER_API_KEY}"},
+                files={"file": (filename, data)},
+                data={"model": "whisper-1"},
+                timeout=upstream_timeout(timeout),
+            )
+        if response.status_code in RETRYABLE_STATUSES:
+            response.raise_for_status()
+        return response
+
+    # Over capacity, circuit open, out of time or nobody listening all raise
+    # from here; the caller reports them rather than a made-up transcript
+    with stage_deadline("stt"):
+        response = call_upstream(WHISPER, attempt)
+
+    if response.status_code in AUDIO_REJECTED_STATUSES:
+        logging.warning(f"Whisper rejected the audio with status {response.status_code}: {response.text[:200]}")
+        raise AudioRejectedError("The audio could not be transcribed")
+    if response.status_code != 200:
+        logging.error(f"Transcription failed with status {response.status_code}: {response.text[:200]}")
+        raise UpstreamRejectedError(f"Speech-to-text provider refused the request (status {response.status_code})")
+    try:
+        return response.json()["text"]
+    except (ValueError, KeyError, TypeError) as e:
+        logging.error(f"Transcription response had no text: {str(e)}")
+        raise UpstreamRejectedError("Speech-to-text provider returned no transcript") from e
+
 # Process audio file
-def process_audio_file(audio_file):
-    OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
+def process_audio_file(audio_file, filename: str = "audio.wav") -> str:
+    return transcribe_audio_bytes(audio_file.read(), filename)
+
+def _transcript_words(text: str) -> List[str]:
+    return [word.strip(string.punctuation).lower() for word in text.split()]
+
+def stitch_transcripts(parts: List[Tuple[str, bool]], max_overlap_words: int = 12) -> str:
+    """
+    Join segment transcripts in order, dropping words repeated across overlaps.
+
+    Args:
+        parts (List[Tuple[str, bool]]): (transcript, overlaps_previous) per segment
+        max_overlap_words (int): Longest repeated run to look for at a boundary
+
+    Returns:
+        str: The combined transcript
+    """
+    result: List[str] = []
+    previous: List[str] = []
+    for text, overlaps_previous in parts:
+        words = text.split()
+        if overlaps_previous and previous and words:
+            # Longest run that ends the previous segment and starts this one.
+            # Only the adjacent segment shares audio with this one; after an
+            # empty segment there is nothing to repeat.
+            tail = _transcript_words(" ".join(previous[-max_overlap_words:]))
+            head = _transcript_words(" ".join(words[:max_overlap_words]))
+            for size in range(min(len(tail), len(head)), 0, -1):
+                if tail[-size:] == head[:size]:
+                    words = words[size:]
+                    break
+        previous = text.split()
+        result.extend(words)
+    return " ".join(result)
+
+def iter_long_audio_transcription(data: bytes) -> Iterator[Dict[str, Any]]:
+    """
+    Transcribe a long WAV recording as concurrent segments split at silences.
+
+    Yields one event per segment as it finishes (in completion order), then a
+    final event with the stitched transcript:
+
+        {"segment": 2, "start": 40.1, "end": 58.7, "text": "..."}
+        {"response": "..."}
+
+    A segment that fails raises the same errors as transcribe_audio_bytes,
+    and the segments still waiting are dropped.
+
+    Args:
+        data (bytes): A WAV file, ideally already normalized to 16 kHz mono
+
+    Yields:
+        Dict[str, Any]: Segment events followed by the final transcript
+    """
+    samples, sample_rate = parse_wav(data)
+    mono = downmix(samples)
+    segments = split_on_silence(mono, sample_rate, config.STT_SEGMENT_MAX_SECONDS, config.STT_SEGMENT_OVERLAP_SECONDS)
+
+    def transcribe_segment(segment: Segment) -> str:
+        chunk = encode_wav_pcm16(mono[segment.start:segment.end], sample_rate)
+        return transcribe_audio_bytes(chunk)
+
+    texts: Dict[int, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, config.STT_MAX_CONCURRENCY)) as executor:
+        futures = {
+            submit_with_context(executor, transcribe_segment, segment): index
+            for index, segment in enumerate(segments)
+        }
+
+        def cancel_pending():
+            count_cancelled("skipped", "stt", sum(future.cancel() for future in futures))
+
+        # Segments not yet sent are dropped as soon as the client goes away,
+        # or when the consumer stops reading
+        token = current_token()
+        unregister = token.on_cancel(cancel_pending) if token is not None else None
+        try:
+            for future in as_completed(futures):
+                if future.cancelled():
+                    raise RequestCancelledError()
+                index = futures[future]
+                texts[index] = future.result()
+                segment = segments[index]
+                yield {
+                    "segment": index,
+                    "start": round(segment.start / sample_rate, 2),
+                    "end": round(segment.end / sample_rate, 2),
+                    "text": texts[index],
+                }
+        finally:
+            if unregister is not None:
+                unregister()
+            cancel_pending()
+
+    parts = [(texts[index], segment.overlap > 0) for index, segment in enumerate(segments)]
+    yield {"response": stitch_transcripts(parts)}
+
+def transcribe_long_audio(data: bytes) -> str:
+    """Blocking variant of iter_long_audio_transcription that returns only the transcript."""
+    response = ""
+    for event in iter_long_audio_transcription(data):
+        response = event.get("response", response)
+    return response
+
+def build_messages(message: str, conversation_history: List[Dict[str, str]],
+                   length_hint: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    Assemble the chat completion messages for one turn.
+
+    Args:
+        message (str): The user's message
+        conversation_history (List[Dict[str, str]]): Previous turns
+        length_hint (Optional[str]): Instruction on reply length, added to the system prompt
+
+    Returns:
+        List[Dict[str, str]]: System prompt, history and the new message
+    """
+    with stage_timer("prompt"):
+        system_prompt = "You are a helpful AI assistant."
+        if length_hint:
+            system_prompt = f"{system_prompt} {length_hint}"
+        messages = []
+        messages.append({"role": "system", "content": system_prompt})
+        for msg in conversation_history:
+            messages.append(msg)
+        messages.append({"role": "user", "content": message})
+        return messages
+
+def _complete_reply(plan: "TurnPlan", message: str, conversation_history: List[Dict[str, str]]) -> str:
+    if not any(backend.api_key for backend in llm_router.backends):
+        raise ValueError("OpenRouter API key not found")
     
-    # Create a temporary file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_file:
-        # Write the uploaded file to the temporary file
-        temp_file.write(audio_file.read())
-        temp_file_path = temp_file.name
+    # Prepare conversation history
+    messages = build_messages(message, conversation_history, plan.length_hint)
     
-    try:
-        # Attempt to use OpenAI's API directly
-        with open(temp_file_path, "rb") as audio:
-            response = requests.post(
-                "https://api.openai.com/v1/audio/transcriptions",
-                headers={"Authorization": f"Bearer {OPENROUTER_API_KEY}"},
-                files={"file": audio},
-                data={"model": "whisper-1"}
-            )
-            
-            if response.status_code == 200:
-                response_json = response.json()
-                if "text" in response_json:
-                    return response_json["text"]
-            return "I'm sorry, but speech-to-text is currently limited. Please type your message instead."
+    # Call the fastest healthy backend of the turn's tier, failing over to the others
+    policy = Policy(config.LLM_MAX_COST_PER_MTOK, config.LLM_MODEL_FAMILY, plan.tier)
+    with stage_deadline("llm"):
+        response = llm_router.complete(messages, policy, max_tokens=plan.max_tokens, temperature=0.7)
     
-    except Exception as e:
-        logging.error(f"Error processing audio file: {str(e)}")
-        return "I'm sorry, but speech-to-text is currently limited. Please type your message instead."
+    if response.usage is not None:
+        LLM_TOKENS.labels("prompt").inc(response.usage.prompt_tokens)
+        LLM_TOKENS.labels("completion").inc(response.usage.completion_tokens)
+        LLM_TURN_TOKENS.labels(plan.turn_class).inc(response.usage.completion_tokens)
     
-    finally:
-        # Clean up the temporary file
-        os.unlink(temp_file_path)
+    return response.choices[0].message.content
 
 # Generate AI response
+@timed("llm")
 def generate_ai_response(message: str, conversation_history: list = []) -> str:
-    OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
+    started = time.perf_counter()
+    plan = classify_turn(message)
+    LLM_TURNS.labels(plan.turn_class).inc()
     
-    if not OPENROUTER_API_KEY:
-        raise ValueError("OpenRouter API key not found")
+    # A reply prepared ahead of time for this question is served as is; only
+    # the interview questions asked word for word count, so a prepared reply
+    # never answers a question that merely shares a keyword
+    speculated = None
+    if config.SPECULATION_ENABLED:
+        history = conversation_history + [{"role": "user", "content": message}]
+        speculated = speculation.store.observe_turn(current_session(), match_interview_question(message), history)
+    
+    reply = plan.canned_answer or speculated
+    if reply is None:
+        reply = _complete_reply(plan, message, conversation_history)
+    LLM_TURN_SECONDS.labels(plan.turn_class).observe(time.perf_counter() - started)
+    return reply
+
+def _synthesize(text: str, cache_key: str, options: SpeechOptions = DEFAULT_SPEECH) -> bytes:
+    # The default format is what ElevenLabs sends unasked, which keeps
+    # recorded cassettes matching
+    params = {} if options.output_format == ELEVENLABS_OUTPUT_FORMAT else {"output_format": options.output_format}
     
-    # Initialize OpenAI client with OpenRouter base URL
-    client = OpenAI(
-        api_key=OPENROUTER_API_KEY,
-        base_url="https://openrouter.ai/api/v1",
-    )
+    # Generate audio using the ElevenLabs REST API
+    def attempt(timeout: float) -> httpx.Response:
+        with limiters[ELEVENLABS].slot(timeout):
+            response = http_client.post(
+                f"{config.ELEVENLABS_BASE_URL}/text-to-speech/{options.voice_id}",
+                params=params,
+                headers={"xi-api-key": config.ELEVENLABS_API_KEY, "Accept": "audio/mpeg"},
+                json={"text": text, "model_id": ELEVENLABS_MODEL},
+                timeout=upstream_timeout(timeout),
+            )
+        response.raise_for_status()
+        return response
+
+    with stage_deadline("tts"):
+        response = call_upstream(ELEVENLABS, hedged(ELEVENLABS, attempt))
     
-    # Prepare conversation history
-    messages = []
-    messages.append({"role": "system", "content": "You are a helpful AI assistant."})
-    for msg in conversation_history:
-        messages.append(msg)
-    messages.append({"role": "user", "content": message})
-    
-    # Call OpenRouter API
-    response = client.chat.completions.create(
-        model="openai/gpt-3.5-turbo",
-        messages=messages,
-        max_tokens=500,
-        temperature=0.7
-    )
+    audio = response.content
+    AUDIO_BYTES.labels("tts").inc(len(audio))
+    tts_cache.set(cache_key, audio)
+    return audio
+
+def _synthesize_chunked(text: str, cache_key: str, options: SpeechOptions) -> bytes:
+    """
+    Synthesize long text as sentence chunks in parallel and join them into one MP3.
+
+    Chunks are cached on their own, so a sentence already spoken in another
+    reply is not synthesized again. Falls back to one request for the whole
+    text if the chunks' audio can't be joined.
+    """
+    chunks = split_for_speech(text, config.TTS_CHUNK_MAX_CHARS)
+    if len(chunks) < 2:
+        return _synthesize(text, cache_key, options)
     
-    return response.choices[0].message.content
+    # A sentence repeated within the reply is synthesized once
+    texts = {options.cache_key(chunk): chunk for chunk in chunks}
+    keys = list(texts)
+    audio: Dict[str, bytes] = {}
+    for key in keys:
+        cached = tts_cache.get(key)
+        if cached is not None:
+            audio[key] = cached
+    TTS_CHUNKS.labels("cached").inc(len(audio))
+    
+    missing = [key for key in keys if key not in audio]
+    if missing:
+        TTS_CHUNKS.labels("synthesized").inc(len(missing))
+        with ThreadPoolExecutor(max_workers=max(1, min(config.TTS_CHUNK_CONCURRENCY, len(missing)))) as executor:
+            futures = {
+                submit_with_context(executor, _synthesize, texts[key], key, options): key
+                for key in missing
+            }
+            
+            def cancel_pending():
+                count_cancelled("skipped", "tts", sum(future.cancel() for future in futures))
+            
+            # Chunks not yet sent are dropped as soon as the client goes away
+            token = current_token()
+            unregister = token.on_cancel(cancel_pending) if token is not None else None
+            try:
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        raise RequestCancelledError()
+                    audio[futures[future]] = future.result()
+            finally:
+                if unregister is not None:
+                    unregister()
+                cancel_pending()
+    
+    try:
+        joined = concatenate_mp3([audio[options.cache_key(chunk)] for chunk in chunks])
+    except Mp3FormatError as e:
+        logging.warning(f"Could not join speech chunks ({str(e)}); synthesizing the reply whole")
+        return _synthesize(text, cache_key, options)
+    tts_cache.set(cache_key, joined)
+    return joined
+
+def render_speech(text: str, cache_key: str, options: SpeechOptions = DEFAULT_SPEECH) -> bytes:
+    """
+    Synthesize speech and store it in tts_cache under `cache_key`, without
+    looking there first. Long text goes out as sentence chunks, short text in
+    one request.
+
+    Args:
+        text (str): Text as passed through speech_text
+        cache_key (str): options.cache_key(text)
+        options (SpeechOptions): Voice and output format
+
+    Returns:
+        bytes: MP3 audio
+    """
+    if 0 < config.TTS_CHUNK_THRESHOLD_CHARS < len(text):
+        return _synthesize_chunked(text, cache_key, options)
+    return _synthesize(text, cache_key, options)
 
 # Generate speech
-def generate_speech(text: str) -> bytes:
-    ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")
+@timed("tts")
+def generate_speech_with_key(text: str) -> Tuple[str, bytes]:
+    """
+    Speech for a reply, from the cache or synthesized.
+
+    Returns:
+        Tuple[str, bytes]: The tts_cache key the audio is stored under (also
+            its /api/audio address) and the MP3 audio
+    """
+    ELEVENLABS_API_KEY = config.ELEVENLABS_API_KEY
     
     if not ELEVENLABS_API_KEY:
         raise ValueError("ElevenLabs API key not found")
     
-    # Generate audio using ElevenLabs
-    audio = generate(
-        text=text,
-        voice="Adam",  # Default voice
-        model="eleven_monolingual_v1"
-    )
+    text = speech_text(text)
+    cache_key = DEFAULT_SPEECH.cache_key(text)
+    cached = tts_cache.get(cache_key)
+    if config.SPECULATION_ENABLED:
+        speculation.store.note_speech(current_session(), cache_key, cached is not None)
+    if cached is not None:
+        return cache_key, cached
     
-    return audio
+    return cache_key, render_speech(text, cache_key)
+
+def generate_speech(text: str) -> bytes:
+    return generate_speech_with_key(text)[1]
+
+def speech_text(text: str) -> str:
+    """The text actually synthesized for a reply: normalized for speech unless TTS_NORMALIZE_TEXT is off."""
+    return normalize_for_speech(text) if config.TTS_NORMALIZE_TEXT else text
+
+# Rough size of an LLM token, for charging speculative replies to the budget
+CHARS_PER_TOKEN = 4
+
+def speculate_next_answers(session: str):
+    """
+    Prepare replies and speech for the questions a session will most likely
+    ask next, while the client plays the current answer.
+
+    Stops as soon as a speech slot is not idle, the worker is overloaded or
+    the session's SPECULATION_SESSION_CHAR_BUDGET would be exceeded.
+
+    Args:
+        session (str): The session key, as from limiter.current_session()
+    """
+    if not config.ELEVENLABS_API_KEY:
+        return
+    for question_type in speculation.store.plan(session, config.SPECULATION_TOP_N):
+        if admission.overloaded():
+            SPECULATION.labels("busy").inc()
+            return
+        question = speculation.SCRIPT_QUESTIONS[question_type]
+        plan = classify_turn(question)
+        reply = plan.canned_answer
+        if reply is None:
+            # Reserve the longest possible reply, then give back what it didn't use
+            reserved = plan.max_tokens * CHARS_PER_TOKEN
+            if not speculation.store.charge(session, reserved):
+                SPECULATION.labels("over_budget").inc()
+                return
+            reply = _complete_reply(plan, question, speculation.store.history(session))
+            speculation.store.refund(session, max(0, reserved - len(reply)))
+        
+        spoken = speech_text(reply)
+        cache_key = DEFAULT_SPEECH.cache_key(spoken)
+        if cache_key not in tts_cache:
+            if not limiters[ELEVENLABS].has_idle_slot():
+                SPECULATION.labels("busy").inc()
+                return
+            if not speculation.store.charge(session, len(spoken)):
+                SPECULATION.labels("over_budget").inc()
+                return
+            render_speech(spoken, cache_key)
+        speculation.store.prepared(session, question_type, reply, cache_key)
+        SPECULATION.labels("generated").inc()
+
+def speculate_after_turn():
+    """Schedule speculate_next_answers for the current session, if speculation is on."""
+    speculation.schedule(current_session(), speculate_next_answers)
 
 def format_conversation_for_openai(system_prompt: str, conversation_history: List[Dict[str, str]]) -> List[Dict[str, str]]:
     """
@@ -192,4 +563,116 @@ def detect_interview_question_type(text: str) -> Optional[str]:
     elif any(phrase in text for phrase in ["push boundaries", "challenge yourself", "comfort zone", "limits"]):
         return "pushing_boundaries"
     
-    return None 
\ No newline at end of file
+    return None
+
+# The standard interview questions, as asked word for word, with the type of
+# stored answer each one gets. Only these exact questions are answered from
+# the stored answers; anything merely mentioning "growth" or "limits" is not.
+INTERVIEW_QUESTIONS = {
+    "tell me about yourself": "life_story",
+    "tell me about yourself and your journey so far": "life_story",
+    "what's your life story": "life_story",
+    "what is your life story": "life_story",
+    "what's your number one superpower": "superpower",
+    "what is your number one superpower": "superpower",
+    "what would you say is your number one superpower": "superpower",
+    "what's your #1 superpower": "superpower",
+    "what is your #1 superpower": "superpower",
+    "what's your superpower": "superpower",
+    "what is your superpower": "superpower",
+    "what are the top three areas you'd like to grow in": "growth_areas",
+    "what are the top 3 areas you'd like to grow in": "growth_areas",
+    "what are your top three growth areas": "growth_areas",
+    "what are your growth areas": "growth_areas",
+    "what misconception do your coworkers have about you": "misconception",
+    "what misconceptions do your coworkers have about you": "misconception",
+    "what's a misconception your coworkers have about you": "misconception",
+    "how do you push your boundaries and limits": "pushing_boundaries",
+    "how do you push your boundaries": "pushing_boundaries",
+    "how do you push your limits": "pushing_boundaries",
+}
+
+def match_interview_question(text: str) -> Optional[str]:
+    """
+    The question type of a standard interview question asked word for word.
+
+    Case, whitespace, curly apostrophes and punctuation other than
+    apostrophes and "#" are ignored.
+
+    Args:
+        text (str): The question text
+
+    Returns:
+        Optional[str]: The question type, or None for any other message
+    """
+    text = re.sub(r"[^\w\s'#]", "", text.lower().replace("\u2019", "'"))
+    return INTERVIEW_QUESTIONS.get(" ".join(text.split()))
+
+class TurnPlan(NamedTuple):
+    """How to answer one turn."""
+    turn_class: str
+    tier: str
+    max_tokens: int
+    length_hint: Optional[str]
+    canned_answer: Optional[str] = None
+    question_type: Optional[str] = None
+
+# Small talk that needs a one-line reply: greetings, thanks, farewells and acknowledgements
+GREETING_PATTERN = re.compile(
+    r"^(hi|hii+|hello|hey|hey there|yo|howdy|good (morning|afternoon|evening|night)|"
+    r"how are you( doing)?|how's it going|what's up|nice to meet you|"
+    r"thanks|thank you|thanks a lot|thank you so much|cheers|bye|goodbye|see you|"
+    r"ok|okay|cool|great|nice|got it|sure|yes|yeah|yep|no|nope|right)"
+    r"( (there|again|bot|friend|so much|then))*$"
+)
+QUESTION_WORDS = ("what", "who", "where", "when", "which", "how", "why", "do", "does", "did",
+                  "are", "is", "have", "can", "could", "would", "will")
+PERSONA_WORDS = {"you", "your", "you're", "yours", "yourself"}
+REQUEST_OPENERS = [["can", "you"], ["could", "you"], ["would", "you"], ["will", "you"]]
+# Longer than this and a question about the persona is treated as open-ended
+PERSONA_MAX_WORDS = 15
+
+LENGTH_HINTS = {
+    "greeting": "Reply in one short, friendly sentence.",
+    "persona": "Answer in two or three spoken sentences.",
+    "open": None,
+}
+
+def classify_turn(message: str) -> TurnPlan:
+    """
+    Classify a message locally and pick the backend tier and reply length for it.
+
+    Classes are "greeting" (small talk), "persona" (a short question about
+    the bot itself) and "open" (everything else, given the full reply budget).
+    With TURN_CANNED_ANSWERS on, a standard interview question asked word for
+    word is "canned" and answered from the stored answers.
+
+    Args:
+        message (str): The user's message
+
+    Returns:
+        TurnPlan: Class, backend tier, max_tokens and length instruction, plus
+            the question type and stored answer for canned questions
+    """
+    if not config.TURN_ROUTING_ENABLED:
+        return TurnPlan("open", "", 500, None)
+    
+    text = " ".join(message.lower().split()).strip(string.punctuation + " ")
+    turn_class = "open"
+    if GREETING_PATTERN.match(text):
+        turn_class = "greeting"
+    else:
+        canned_type = match_interview_question(text) if config.TURN_CANNED_ANSWERS else None
+        if canned_type is not None:
+            answer = generate_response_for_interview_question(canned_type, text)
+            if answer is not None:
+                return TurnPlan("canned", "", 0, None, answer, canned_type)
+        words = _transcript_words(text)
+        # "Can you explain ..." asks for something; it isn't about the persona
+        subject = words[2:] if words[:2] in REQUEST_OPENERS else words
+        if (len(words) <= PERSONA_MAX_WORDS and words and words[0] in QUESTION_WORDS
+                and PERSONA_WORDS.intersection(subject)):
+            turn_class = "persona"
+    
+    return TurnPlan(turn_class, config.TURN_TIERS[turn_class], config.TURN_MAX_TOKENS[turn_class],
+                    LENGTH_HINTS[turn_class]) 
\ No newline at end of file
@@ -28,6 +28,7 @@ export default function Home() {
   const audioRef = useRef<HTMLAudioElement>(null);
   const chatContainerRef = useRef<HTMLDivElement>(null);
   const recognitionRef = useRef<any>(null);
+  const turnRef = useRef<AbortController | null>(null);
 
   // Initialize speech recognition
   useEffect(() => {
@@ -97,6 +98,10 @@ export default function Home() {
       return;
     }
     
+    // Barge in: speaking over a reply abandons it, on the server too
+    turnRef.current?.abort();
+    audioRef.current?.pause();
+    
     try {
       recognitionRef.current.start();
       setIsRecording(true);
@@ -126,6 +131,8 @@ export default function Home() {
     setMessages(prev => [...prev, userMessage]);
     setTranscribedText('');
     setIsProcessing(true);
+    const controller = new AbortController();
+    turnRef.current = controller;
     
     try {
       const history = [...messages, userMessage].map(msg => ({
@@ -133,13 +140,16 @@ export default function Home() {
         content: msg.content
       }));
       
-      const aiResponse = await api.generateText(text, history);
+      const aiResponse = await api.generateText(text, history, controller.signal);
       setMessages(prev => [...prev, { role: 'assistant', content: aiResponse }]);
       
-      const audioBlob = await api.textToSpeech(aiResponse);
+      const audioBlob = await api.textToSpeech(aiResponse, controller.signal);
       const audioUrl = URL.createObjectURL(audioBlob);
       setAudioSrc(audioUrl);
     } catch (error) {
+      if (controller.signal.aborted) {
+        return;
+      }
       console.error('Error processing message:', error);
       setMessages(prev => [...prev, { 
         role: 'assistant', 
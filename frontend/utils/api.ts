@@ -7,6 +7,7 @@ export interface Message {
 }
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+const WS_URL = API_URL.replace(/^http/, 'ws');
 
 // API client configuration
 const apiClient = axios.create({
@@ -67,21 +68,60 @@ export const generateSpeech = async (text: string): Promise<ArrayBuffer> => {
     return response.arrayBuffer();
 };
 
+// Events of a turn on /ws/voice; the speech arrives as 'audio'
+export type VoiceEvent =
+  | { type: 'reply'; response: string }
+  | { type: 'audio'; audio: Blob }
+  | { type: 'done' }
+  | { type: 'cancelled' }
+  | { type: 'error'; status: number; detail: string };
+
+// Voice turns over one WebSocket. bargeIn() abandons the turn in progress,
+// including its upstream calls on the server
+export const openVoiceSocket = (onEvent: (event: VoiceEvent) => void) => {
+  const socket = new WebSocket(`${WS_URL}/ws/voice`);
+  socket.binaryType = 'blob';
+  const ready = new Promise<void>(resolve => {
+    socket.onopen = () => resolve();
+  });
+  socket.onmessage = (message: MessageEvent) => {
+    if (message.data instanceof Blob) {
+      onEvent({ type: 'audio', audio: message.data });
+    } else {
+      onEvent(JSON.parse(message.data));
+    }
+  };
+  const send = async (data: object) => {
+    await ready;
+    socket.send(JSON.stringify(data));
+  };
+
+  return {
+    sendTurn: (message: string, conversationHistory: Message[]) =>
+      send({ type: 'turn', message, conversation_history: conversationHistory }),
+    bargeIn: () => send({ type: 'barge_in' }),
+    close: () => socket.close(),
+  };
+};
+
+// Aborting a request through `signal` closes it, and the server then stops
+// the upstream work behind it
 const api = {
-  generateText: async (message: string, conversationHistory: any[]) => {
+  generateText: async (message: string, conversationHistory: any[], signal?: AbortSignal) => {
     const response = await axios.post(`${API_URL}/api/generate-text`, {
       message,
       conversation_history: conversationHistory
-    });
+    }, { signal });
     return response.data.response;
   },
 
-  textToSpeech: async (text: string) => {
+  textToSpeech: async (text: string, signal?: AbortSignal) => {
     const formData = new FormData();
     formData.append('text', text);
     
     const response = await axios.post(`${API_URL}/api/text-to-speech`, formData, {
-      responseType: 'blob'
+      responseType: 'blob',
+      signal
     });
     return response.data;
   }